@@ -1,3 +1,6 @@
+-- Sustituido por scripts/calendario_bursatil.py, que genera el calendario de forma
+-- vectorizada, lo carga por lotes y rellena EsDiaHabil con las sesiones de NYSE.
+-- Este script deja EsDiaHabil = 0 en todas las fechas.
 SET LANGUAGE Spanish;
 TRUNCATE TABLE Metadata.DateDim;
 WITH DATOS AS(
@@ -1,3 +1,5 @@
+-- Para más de unos pocos símbolos usar scripts/matriz_precios.py (construir_matriz),
+-- que lee en formato largo y pivota en memoria sin un CASE por símbolo y campo.
 -- Utiliza un CTE (Common Table Expression) para obtener los datos base
 WITH BaseData AS (
     SELECT
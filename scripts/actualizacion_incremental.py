@@ -0,0 +1,316 @@
+"""
+Módulo para la actualización incremental de AVdata.StockPrices.
+
+En lugar de volver a descargar todo el histórico, consulta la última fecha
+almacenada de cada símbolo activo y descarga solo el tramo que falta.
+detectar_huecos localiza además las sesiones intermedias sin barra (según
+Metadata.DateDim.EsDiaHabil) para volver a pedir solo esos tramos.
+"""
+import logging
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+from sqlalchemy.types import Date
+
+try:
+    from .carga_masiva import fusionar_precios
+    from .descargador import descargar_y_cargar
+    from .yahoo_finance import descargar_datos_yahoo
+except ImportError:
+    from carga_masiva import fusionar_precios
+    from descargador import descargar_y_cargar
+    from yahoo_finance import descargar_datos_yahoo
+
+FECHA_INICIO_POR_DEFECTO = '2010-01-01'
+# Huecos separados por pocas sesiones se piden juntos: una petición más larga
+# sale más barata que varias cortas y las barras repetidas no se reescriben (MERGE)
+UNIR_HUECOS_SESIONES = 5
+
+logger = logging.getLogger('alphavantage.actualizacion_incremental')
+
+# Una sola consulta para todos los símbolos activos; el MAX por SymbolID
+# se resuelve con un seek por símbolo sobre la clave agrupada PK_StockPrices.
+ULTIMAS_FECHAS_SQL = text('''
+    SELECT s.SymbolID, s.Symbol, MAX(sp.[Date]) AS UltimaFecha
+    FROM Metadata.Symbols s
+    LEFT JOIN AVdata.StockPrices sp ON sp.SymbolID = s.SymbolID
+    WHERE s.IsActive = 1
+    GROUP BY s.SymbolID, s.Symbol
+    ORDER BY s.SymbolID
+''')
+
+ULTIMA_FECHA_SIMBOLO_SQL = text('''
+    SELECT MAX([Date]) FROM AVdata.StockPrices WHERE SymbolID = :symbol_id
+''')
+
+
+# Sesiones de Metadata.DateDim sin barra, desde la primera barra de cada símbolo
+# activo. Las sesiones que faltan seguidas forman una isla (número de sesión
+# menos su posición dentro del símbolo constante) y cada isla es un hueco.
+HUECOS_SQL = text('''
+    WITH Sesiones AS (
+        SELECT Fecha, ROW_NUMBER() OVER (ORDER BY Fecha) AS NumSesion
+        FROM Metadata.DateDim
+        WHERE EsDiaHabil = 1 AND Fecha BETWEEN :desde AND :hasta
+    ),
+    Simbolos AS (
+        SELECT s.SymbolID, s.Symbol, MIN(sp.[Date]) AS PrimeraFecha
+        FROM Metadata.Symbols s
+        JOIN AVdata.StockPrices sp ON sp.SymbolID = s.SymbolID
+        WHERE s.IsActive = 1
+        GROUP BY s.SymbolID, s.Symbol
+    ),
+    Faltantes AS (
+        SELECT si.SymbolID, si.Symbol, se.Fecha, se.NumSesion,
+               se.NumSesion - ROW_NUMBER() OVER (PARTITION BY si.SymbolID ORDER BY se.NumSesion) AS Isla
+        FROM Simbolos si
+        JOIN Sesiones se ON se.Fecha >= si.PrimeraFecha
+        WHERE NOT EXISTS (
+            SELECT 1 FROM AVdata.StockPrices sp
+            WHERE sp.SymbolID = si.SymbolID AND sp.[Date] = se.Fecha
+        )
+    )
+    SELECT SymbolID, Symbol, MIN(Fecha) AS Desde, MAX(Fecha) AS Hasta,
+           MIN(NumSesion) AS PrimeraSesion, MAX(NumSesion) AS UltimaSesion
+    FROM Faltantes
+    GROUP BY SymbolID, Symbol, Isla
+    ORDER BY SymbolID, PrimeraSesion
+''').bindparams(
+    bindparam('desde', type_=Date()),
+    bindparam('hasta', type_=Date()),
+)
+
+
+def _a_fecha(valor):
+    """Convierte el valor devuelto por el driver (date, datetime o str) a date."""
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return datetime.strptime(str(valor)[:10], '%Y-%m-%d').date()
+
+
+def obtener_ultimas_fechas(engine):
+    """
+    Devuelve la última fecha almacenada de cada símbolo activo.
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine
+        Engine conectado a AlphaVantageDB.
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        Columnas SymbolID, Symbol y UltimaFecha (None si el símbolo no tiene precios).
+    """
+    with engine.connect() as conn:
+        filas = conn.execute(ULTIMAS_FECHAS_SQL).fetchall()
+    return pd.DataFrame(
+        [(fila[0], fila[1], _a_fecha(fila[2])) for fila in filas],
+        columns=['SymbolID', 'Symbol', 'UltimaFecha'],
+    )
+
+
+def obtener_ultima_fecha(conexion, symbol_id):
+    """Devuelve la última fecha almacenada para un símbolo o None si no tiene precios."""
+    return _a_fecha(conexion.execute(ULTIMA_FECHA_SIMBOLO_SQL, {"symbol_id": int(symbol_id)}).scalar())
+
+
+def calcular_inicio(ultima_fecha, fecha_inicio_defecto=FECHA_INICIO_POR_DEFECTO):
+    """
+    Calcula la fecha desde la que hay que descargar.
+
+    Retorna el día siguiente a ultima_fecha o fecha_inicio_defecto si el símbolo
+    todavía no tiene precios, en formato 'YYYY-MM-DD'.
+    """
+    if ultima_fecha is None:
+        return fecha_inicio_defecto
+    return (ultima_fecha + timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def planificar_descargas(ultimas_fechas, fecha_inicio_defecto=FECHA_INICIO_POR_DEFECTO, fecha_fin=None):
+    """
+    Construye la lista de tramos pendientes a partir de obtener_ultimas_fechas.
+
+    Retorna:
+    --------
+    list
+        Lista de diccionarios con SymbolID, Symbol, inicio y fin. Los símbolos
+        que ya están al día no aparecen.
+    """
+    fin = fecha_fin or datetime.now().strftime('%Y-%m-%d')
+    pendientes = []
+    for fila in ultimas_fechas.itertuples(index=False):
+        inicio = calcular_inicio(fila.UltimaFecha, fecha_inicio_defecto)
+        # yfinance trata la fecha de fin como exclusiva
+        if inicio >= fin:
+            continue
+        pendientes.append({'SymbolID': fila.SymbolID, 'Symbol': fila.Symbol, 'inicio': inicio, 'fin': fin})
+    return pendientes
+
+
+def actualizar_incremental(engine, fecha_inicio_defecto=FECHA_INICIO_POR_DEFECTO, fecha_fin=None,
+                           proveedor=descargar_datos_yahoo, tamano_lote=None, registro=None, **opciones_descarga):
+    """
+    Descarga e inserta solo los precios posteriores a la última fecha almacenada.
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine
+        Engine conectado a AlphaVantageDB.
+    fecha_inicio_defecto : str, opcional
+        Fecha de inicio para los símbolos que no tienen ningún precio.
+    fecha_fin : str, opcional
+        Fecha de fin (exclusiva, como en yfinance). Por defecto la fecha actual.
+    proveedor : callable, opcional
+        Función con la firma de descargar_datos_yahoo.
+    tamano_lote : int, opcional
+        Filas por lote en la inserción.
+    registro : RegistroSimbolos, opcional
+        Si se indica, se validan en bloque los símbolos caducados y se omiten los no válidos.
+    **opciones_descarga :
+        Opciones de descargador.descargar_y_cargar (max_hilos, peticiones_por_segundo...).
+
+    Retorna:
+    --------
+    dict
+        Resumen con simbolos_actualizados, simbolos_al_dia, filas y errores.
+    """
+    ultimas_fechas = obtener_ultimas_fechas(engine)
+    pendientes = planificar_descargas(ultimas_fechas, fecha_inicio_defecto, fecha_fin)
+    if registro is not None:
+        pendientes = registro.filtrar_validos(pendientes)
+    resumen = {
+        'simbolos_actualizados': 0,
+        'simbolos_al_dia': len(ultimas_fechas) - len(pendientes),
+        'filas': 0,
+        'errores': [],
+    }
+
+    def guardar(tarea, df):
+        estadisticas = fusionar_precios(engine, df, tarea['SymbolID'], tamano_lote)
+        resumen['simbolos_actualizados'] += 1
+        resumen['filas'] += estadisticas['filas']
+
+    resultado = descargar_y_cargar(pendientes, guardar, proveedor=proveedor, **opciones_descarga)
+    resumen['errores'] = resultado['errores']
+
+    logger.info("Actualización incremental: %d símbolos actualizados, %d al día, %d filas",
+                resumen['simbolos_actualizados'], resumen['simbolos_al_dia'], resumen['filas'])
+    return resumen
+
+
+def detectar_huecos(engine, desde=FECHA_INICIO_POR_DEFECTO, hasta=None, unir_separados=UNIR_HUECOS_SESIONES):
+    """
+    Lista los tramos mínimos a descargar para cubrir las sesiones sin barra.
+
+    Compara en una sola consulta las fechas almacenadas de cada símbolo activo
+    con las sesiones de Metadata.DateDim (EsDiaHabil = 1), de modo que los
+    festivos no cuentan como huecos. Solo se buscan huecos desde la primera
+    barra de cada símbolo; los símbolos sin precios son cosa de la carga
+    inicial. Requiere DateDim cargada con calendario_bursatil.cargar_date_dim.
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine
+        Engine conectado a AlphaVantageDB.
+    desde : str, opcional
+        Primera sesión a revisar 'YYYY-MM-DD'.
+    hasta : str, opcional
+        Última sesión a revisar. Por defecto ayer (la sesión de hoy puede no haber cerrado).
+    unir_separados : int, opcional
+        Huecos del mismo símbolo separados por hasta este número de sesiones
+        con datos se piden en un solo tramo.
+
+    Retorna:
+    --------
+    list
+        Lista de diccionarios con SymbolID, Symbol, inicio, fin (exclusivo,
+        como en yfinance) y sesiones (sesiones que faltan en el tramo), en el
+        formato de planificar_descargas.
+
+    Ejemplo:
+    --------
+    >>> tareas = detectar_huecos(engine, desde='2015-01-01')
+    >>> descargar_y_cargar(tareas, guardar)
+    """
+    hasta = hasta or (date.today() - timedelta(days=1)).strftime('%Y-%m-%d')
+    with engine.connect() as conn:
+        huecos = pd.read_sql(HUECOS_SQL, conn, params={'desde': _a_fecha(desde), 'hasta': _a_fecha(hasta)})
+    if huecos.empty:
+        return []
+
+    # Unir huecos cercanos del mismo símbolo: empieza un tramo nuevo si cambia el
+    # símbolo o si la separación con el hueco anterior supera unir_separados
+    separacion = huecos['PrimeraSesion'] - huecos['UltimaSesion'].shift() - 1
+    nuevo_tramo = (huecos['SymbolID'] != huecos['SymbolID'].shift()) | (separacion > unir_separados)
+    huecos['Tramo'] = nuevo_tramo.cumsum()
+    huecos['Sesiones'] = huecos['UltimaSesion'] - huecos['PrimeraSesion'] + 1
+    tramos = huecos.groupby('Tramo', sort=False).agg(
+        SymbolID=('SymbolID', 'first'), Symbol=('Symbol', 'first'),
+        Desde=('Desde', 'first'), Hasta=('Hasta', 'last'), Sesiones=('Sesiones', 'sum'),
+    )
+    return [
+        {'SymbolID': int(fila.SymbolID), 'Symbol': fila.Symbol,
+         'inicio': _a_fecha(fila.Desde).strftime('%Y-%m-%d'),
+         'fin': (_a_fecha(fila.Hasta) + timedelta(days=1)).strftime('%Y-%m-%d'),
+         'sesiones': int(fila.Sesiones)}
+        for fila in tramos.itertuples(index=False)
+    ]
+
+
+def rellenar_huecos(engine, desde=FECHA_INICIO_POR_DEFECTO, hasta=None, proveedor=descargar_datos_yahoo,
+                    tamano_lote=None, registro=None, unir_separados=UNIR_HUECOS_SESIONES, **opciones_descarga):
+    """
+    Descarga y guarda solo los tramos que devuelve detectar_huecos.
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine
+        Engine conectado a AlphaVantageDB.
+    desde, hasta, unir_separados :
+        Ver detectar_huecos.
+    proveedor : callable, opcional
+        Función con la firma de descargar_datos_yahoo. Conviene no usar la
+        caché local, que devolvería el mismo tramo incompleto.
+    tamano_lote : int, opcional
+        Filas por lote en la inserción.
+    registro : RegistroSimbolos, opcional
+        Si se indica, se omiten los símbolos no válidos.
+    **opciones_descarga :
+        Opciones de descargador.descargar_y_cargar.
+
+    Retorna:
+    --------
+    dict
+        Resumen con tramos, sesiones_faltantes, filas_insertadas, symbol_ids
+        (símbolos con barras nuevas) y errores.
+    """
+    tareas = detectar_huecos(engine, desde, hasta, unir_separados)
+    if registro is not None:
+        tareas = registro.filtrar_validos(tareas)
+    resumen = {
+        'tramos': len(tareas),
+        'sesiones_faltantes': sum(tarea['sesiones'] for tarea in tareas),
+        'filas_insertadas': 0,
+        'symbol_ids': [],
+        'errores': [],
+    }
+
+    def guardar(tarea, df):
+        estadisticas = fusionar_precios(engine, df, tarea['SymbolID'], tamano_lote)
+        resumen['filas_insertadas'] += estadisticas['filas_insertadas']
+        if estadisticas['filas_insertadas'] and tarea['SymbolID'] not in resumen['symbol_ids']:
+            resumen['symbol_ids'].append(tarea['SymbolID'])
+
+    if tareas:
+        resultado = descargar_y_cargar(tareas, guardar, proveedor=proveedor, **opciones_descarga)
+        resumen['errores'] = resultado['errores']
+
+    logger.info("Huecos: %d tramos con %d sesiones sin barra, %d barras recuperadas",
+                resumen['tramos'], resumen['sesiones_faltantes'], resumen['filas_insertadas'])
+    return resumen
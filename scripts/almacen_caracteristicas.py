@@ -0,0 +1,372 @@
+"""
+Módulo con el almacén materializado de características (AVdata.StockFeatures).
+
+Guarda una fila por (SymbolID, Date) con las métricas de caracteristicas.py y,
+por símbolo, un estado de control (AVdata.StockFeaturesState) con las últimas
+barras necesarias para continuar las ventanas: todas las del mes en curso
+(métricas mensuales) y las 49 anteriores (ventana de 50). Añadir N barras
+nuevas cuesta O(N + ventana) en lugar de recalcular todo el histórico.
+
+Uso desde línea de comandos:
+    python scripts/almacen_caracteristicas.py               # actualización incremental
+    python scripts/almacen_caracteristicas.py --reconstruir # recalcula todo
+"""
+import argparse
+import json
+import logging
+import os
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+from sqlalchemy.types import Date, DateTime
+
+try:
+    from .caracteristicas import (COLUMNAS_CARACTERISTICAS, VENTANA_MA_CORTA, VENTANA_MA_LARGA,
+                                  VENTANA_VOLATILIDAD, calcular_caracteristicas)
+    from .carga_masiva import ejecutar_por_lotes
+except ImportError:
+    from caracteristicas import (COLUMNAS_CARACTERISTICAS, VENTANA_MA_CORTA, VENTANA_MA_LARGA,
+                                 VENTANA_VOLATILIDAD, calcular_caracteristicas)
+    from carga_masiva import ejecutar_por_lotes
+
+# Cambiar al modificar la definición de alguna característica: fuerza la reconstrucción
+VERSION_DEFINICION = 1
+BARRAS_CONTEXTO = max(VENTANA_MA_CORTA, VENTANA_MA_LARGA, VENTANA_VOLATILIDAD) - 1
+TAMANO_BLOQUE_SIMBOLOS = 200
+
+logger = logging.getLogger('alphavantage.almacen_caracteristicas')
+
+COLUMNAS_BARRA = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+PRECIOS_SIMBOLOS_SQL = text('''
+    SELECT SymbolID, [Date], [Open], [High], [Low], [Close], [Volume]
+    FROM AVdata.StockPrices
+    WHERE SymbolID IN :symbol_ids
+    ORDER BY SymbolID, [Date]
+''').bindparams(bindparam('symbol_ids', expanding=True))
+
+# Símbolos con barras escritas después del punto de control (CreatedDate > UpdatedDate)
+# en o antes de LastDate: correcciones que fusionar_precios aplicó sobre barras ya
+# procesadas. Su estado se borra y pasan a SIN_ESTADO_SQL para reconstruirse.
+# IX_StockPrices_SymbolCreated (SymbolID, CreatedDate) limita la lectura a las barras
+# escritas desde el punto de control, no a todo el histórico del símbolo
+CAMBIADOS_SQL = '''
+    SELECT st.SymbolID
+    FROM AVdata.StockFeaturesState st
+    WHERE EXISTS (
+        SELECT 1 FROM AVdata.StockPrices sp
+        WHERE sp.SymbolID = st.SymbolID AND sp.CreatedDate > st.UpdatedDate AND sp.[Date] <= st.LastDate
+    ) {filtro}
+'''
+
+# Barras posteriores al último punto de control, de todos los símbolos en una consulta.
+# Las barras cambiadas en o antes de LastDate no aparecen aquí: CAMBIADOS_SQL las detecta
+BARRAS_NUEVAS_SQL = '''
+    SELECT sp.SymbolID, sp.[Date], sp.[Open], sp.[High], sp.[Low], sp.[Close], sp.[Volume]
+    FROM AVdata.StockPrices sp
+    INNER JOIN AVdata.StockFeaturesState st ON st.SymbolID = sp.SymbolID
+    WHERE sp.[Date] > st.LastDate AND st.DefinitionVersion = :version {filtro}
+    ORDER BY sp.SymbolID, sp.[Date]
+'''
+
+# Símbolos con precios y sin estado vigente (nuevos, invalidados o con otra versión de la definición).
+# Se parte de Metadata.Symbols: el EXISTS es un seek por símbolo en la clave (SymbolID, Date)
+SIN_ESTADO_SQL = '''
+    SELECT s.SymbolID
+    FROM Metadata.Symbols s
+    LEFT JOIN AVdata.StockFeaturesState st ON st.SymbolID = s.SymbolID
+    WHERE (st.SymbolID IS NULL OR st.DefinitionVersion <> :version)
+      AND EXISTS (SELECT 1 FROM AVdata.StockPrices sp WHERE sp.SymbolID = s.SymbolID) {filtro}
+'''
+
+TODOS_SQL = text('''
+    SELECT s.SymbolID
+    FROM Metadata.Symbols s
+    WHERE EXISTS (SELECT 1 FROM AVdata.StockPrices sp WHERE sp.SymbolID = s.SymbolID)
+''')
+
+ESTADOS_SQL = text('''
+    SELECT SymbolID, [State] FROM AVdata.StockFeaturesState WHERE SymbolID IN :symbol_ids
+''').bindparams(bindparam('symbol_ids', expanding=True))
+
+BORRAR_DESDE_SQL = text('''
+    DELETE FROM AVdata.StockFeatures WHERE SymbolID = :symbol_id AND [Date] >= :desde
+''').bindparams(bindparam('desde', type_=Date()))
+
+BORRAR_SIMBOLO_SQL = text('DELETE FROM AVdata.StockFeatures WHERE SymbolID = :symbol_id')
+
+BORRAR_ESTADO_SQL = text('DELETE FROM AVdata.StockFeaturesState WHERE SymbolID = :symbol_id')
+
+INSERT_ESTADO_SQL = text('''
+    INSERT INTO AVdata.StockFeaturesState (SymbolID, LastDate, DefinitionVersion, [State], UpdatedDate)
+    VALUES (:symbol_id, :last_date, :version, :state, :updated_date)
+''').bindparams(bindparam('last_date', type_=Date()), bindparam('updated_date', type_=DateTime()))
+
+INSERT_CARACTERISTICAS_SQL = text(f'''
+    INSERT INTO AVdata.StockFeatures
+    (SymbolID, [Date], {', '.join(f'[{columna}]' for columna in COLUMNAS_CARACTERISTICAS)}, CreatedDate)
+    VALUES (:SymbolID, :Date, {', '.join(f':{columna}' for columna in COLUMNAS_CARACTERISTICAS)}, :created_date)
+''').bindparams(bindparam('Date', type_=Date()), bindparam('created_date', type_=DateTime()))
+
+
+def _filtrar_simbolos(plantilla, symbol_ids, parametros, columna='sp.SymbolID'):
+    """Sentencia de la plantilla, limitada a symbol_ids (sobre columna) si se indican."""
+    if symbol_ids is None:
+        return text(plantilla.format(filtro='')), parametros
+    sentencia = text(plantilla.format(filtro=f'AND {columna} IN :symbol_ids'))
+    return (sentencia.bindparams(bindparam('symbol_ids', expanding=True)),
+            {**parametros, 'symbol_ids': [int(symbol_id) for symbol_id in symbol_ids]})
+
+
+def _leer(conn, sentencia, parametros=None):
+    """Ejecuta la consulta y devuelve un DataFrame con las fechas ya convertidas."""
+    df = pd.read_sql(sentencia, conn, params=parametros)
+    if 'Date' in df.columns:
+        df['Date'] = pd.to_datetime(df['Date'])
+    return df
+
+
+def _estado_desde(barras):
+    """
+    Barras a conservar como punto de control.
+
+    Se guardan las del último mes (sus métricas mensuales se recalculan al llegar
+    barras nuevas del mismo mes) y las BARRAS_CONTEXTO anteriores a ese mes, para
+    que las ventanas móviles de esas filas reescritas sigan siendo completas.
+    """
+    barras = barras.reset_index(drop=True)
+    meses = barras['Date'].dt.to_period('M')
+    primera_del_mes = int((meses == meses.iloc[-1]).to_numpy().argmax())
+    contexto = barras.loc[max(0, primera_del_mes - BARRAS_CONTEXTO):, COLUMNAS_BARRA]
+    return {
+        'Date': contexto['Date'].dt.strftime('%Y-%m-%d').tolist(),
+        **{
+            columna: [None if pd.isna(valor) else float(valor) for valor in contexto[columna]]
+            for columna in COLUMNAS_BARRA[1:]
+        },
+    }
+
+
+def _barras_desde_estado(estado, symbol_id):
+    barras = pd.DataFrame(estado)
+    barras['Date'] = pd.to_datetime(barras['Date'])
+    barras['SymbolID'] = symbol_id
+    return barras
+
+
+def _filas_para_escribir(caracteristicas, desde):
+    filas = caracteristicas.loc[caracteristicas['Date'] >= desde, ['SymbolID', 'Date'] + COLUMNAS_CARACTERISTICAS].copy()
+    filas['Date'] = filas['Date'].dt.date
+    return filas
+
+
+def _persistir(conn, filas, borrados, estados, leido_en, borrar_todo=False, tamano_lote=None):
+    """
+    Escribe en una transacción las filas de características y los nuevos puntos de control.
+
+    borrados es un DataFrame con symbol_id y desde (fecha a partir de la cual se
+    sustituyen las filas); con borrar_todo se eliminan todas las filas del símbolo.
+    leido_en es el momento anterior a la lectura de los precios y se guarda como
+    UpdatedDate: una barra escrita después, aunque la lectura ya la viera, solo
+    puede provocar una reconstrucción de más, nunca perderse.
+    """
+    if borrar_todo:
+        ejecutar_por_lotes(conn, BORRAR_SIMBOLO_SQL, borrados[['symbol_id']], tamano_lote)
+    else:
+        ejecutar_por_lotes(conn, BORRAR_DESDE_SQL, borrados, tamano_lote)
+    ejecutar_por_lotes(conn, INSERT_CARACTERISTICAS_SQL, filas, tamano_lote,
+                       {'created_date': datetime.now()})
+    ejecutar_por_lotes(conn, BORRAR_ESTADO_SQL, estados[['symbol_id']], tamano_lote)
+    ejecutar_por_lotes(conn, INSERT_ESTADO_SQL, estados, tamano_lote,
+                       {'version': VERSION_DEFINICION, 'updated_date': leido_en})
+
+
+def _estados_de(barras_por_simbolo):
+    return pd.DataFrame([
+        {
+            'symbol_id': int(symbol_id),
+            'last_date': barras['Date'].iloc[-1].date(),
+            'state': json.dumps(_estado_desde(barras)),
+        }
+        for symbol_id, barras in barras_por_simbolo
+    ], columns=['symbol_id', 'last_date', 'state'])
+
+
+def reconstruir_caracteristicas(engine, symbol_ids=None, tamano_lote=None):
+    """
+    Recalcula desde cero las características y los puntos de control.
+
+    Se usa tras cambiar la definición de las características o el esquema.
+    Procesa los símbolos en bloques de TAMANO_BLOQUE_SIMBOLOS para acotar la memoria.
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine
+        Engine conectado a AlphaVantageDB.
+    symbol_ids : list, opcional
+        Símbolos a reconstruir. Por defecto todos los que tienen precios.
+    tamano_lote : int, opcional
+        Filas por lote en la escritura.
+
+    Retorna:
+    --------
+    dict
+        Resumen con simbolos y filas escritas.
+    """
+    if symbol_ids is None:
+        with engine.connect() as conn:
+            symbol_ids = [fila[0] for fila in conn.execute(TODOS_SQL)]
+    symbol_ids = sorted(int(symbol_id) for symbol_id in symbol_ids)
+    resumen = {'simbolos': 0, 'filas': 0}
+
+    for inicio in range(0, len(symbol_ids), TAMANO_BLOQUE_SIMBOLOS):
+        bloque = symbol_ids[inicio:inicio + TAMANO_BLOQUE_SIMBOLOS]
+        with engine.begin() as conn:
+            leido_en = datetime.now()
+            precios = _leer(conn, PRECIOS_SIMBOLOS_SQL, {'symbol_ids': bloque})
+            if precios.empty:
+                continue
+            caracteristicas = calcular_caracteristicas(precios)
+            filas = _filas_para_escribir(caracteristicas, caracteristicas['Date'].min())
+            estados = _estados_de(precios.groupby('SymbolID', sort=False))
+            borrados = pd.DataFrame({'symbol_id': bloque})
+            _persistir(conn, filas, borrados, estados, leido_en, borrar_todo=True, tamano_lote=tamano_lote)
+        resumen['simbolos'] += len(estados)
+        resumen['filas'] += len(filas)
+
+    logger.info("Características reconstruidas: %d símbolos, %d filas", resumen['simbolos'], resumen['filas'])
+    return resumen
+
+
+def actualizar_caracteristicas(engine, symbol_ids=None, tamano_lote=None):
+    """
+    Añade las características de las barras posteriores a cada punto de control.
+
+    Los símbolos sin punto de control (o con otra VERSION_DEFINICION) se reconstruyen,
+    igual que aquellos con barras corregidas en o antes de su punto de control.
+    Para el resto solo se leen las barras nuevas y se recalculan, con el contexto
+    guardado, esas barras y las del mes afectado.
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine
+        Engine conectado a AlphaVantageDB.
+    symbol_ids : list, opcional
+        Limitar la actualización a estos símbolos (p. ej. el de una descarga de la webapp).
+    tamano_lote : int, opcional
+        Filas por lote en la escritura.
+
+    Retorna:
+    --------
+    dict
+        Resumen con simbolos_actualizados, simbolos_reconstruidos y filas.
+    """
+    if symbol_ids is not None and len(symbol_ids) == 0:
+        return {'simbolos_actualizados': 0, 'simbolos_reconstruidos': 0, 'filas': 0}
+    with engine.begin() as conn:
+        cambiados = [fila[0] for fila in conn.execute(*_filtrar_simbolos(CAMBIADOS_SQL, symbol_ids, {}, 'st.SymbolID'))]
+        if cambiados:
+            ejecutar_por_lotes(conn, BORRAR_ESTADO_SQL, pd.DataFrame({'symbol_id': cambiados}), tamano_lote)
+            logger.info("Características: %d símbolos con barras corregidas, se reconstruyen", len(cambiados))
+
+    parametros = {'version': VERSION_DEFINICION}
+    leido_en = datetime.now()
+    with engine.connect() as conn:
+        sin_estado = [fila[0] for fila in
+                      conn.execute(*_filtrar_simbolos(SIN_ESTADO_SQL, symbol_ids, parametros, 's.SymbolID'))]
+        nuevas = _leer(conn, *_filtrar_simbolos(BARRAS_NUEVAS_SQL, symbol_ids, parametros))
+        if not nuevas.empty:
+            estados_previos = {
+                int(symbol_id): json.loads(estado)
+                for symbol_id, estado in conn.execute(
+                    ESTADOS_SQL, {'symbol_ids': [int(s) for s in nuevas['SymbolID'].unique()]})
+            }
+
+    resumen = {'simbolos_actualizados': 0, 'simbolos_reconstruidos': 0, 'filas': 0}
+    if sin_estado:
+        reconstruido = reconstruir_caracteristicas(engine, sin_estado, tamano_lote)
+        resumen['simbolos_reconstruidos'] = reconstruido['simbolos']
+        resumen['filas'] += reconstruido['filas']
+
+    if not nuevas.empty:
+        filas, borrados, barras_por_simbolo = [], [], []
+        for symbol_id, barras_nuevas in nuevas.groupby('SymbolID', sort=False):
+            contexto = _barras_desde_estado(estados_previos[int(symbol_id)], symbol_id)
+            barras = pd.concat([contexto, barras_nuevas], ignore_index=True)
+            caracteristicas = calcular_caracteristicas(barras)
+            # Las métricas mensuales cambian para todo el mes de la primera barra nueva
+            desde = barras_nuevas['Date'].min().to_period('M').to_timestamp()
+            filas.append(_filas_para_escribir(caracteristicas, desde))
+            borrados.append({'symbol_id': int(symbol_id), 'desde': desde.date()})
+            barras_por_simbolo.append((symbol_id, barras))
+
+        filas = pd.concat(filas, ignore_index=True)
+        with engine.begin() as conn:
+            _persistir(conn, filas, pd.DataFrame(borrados), _estados_de(barras_por_simbolo), leido_en,
+                       tamano_lote=tamano_lote)
+        resumen['simbolos_actualizados'] = len(borrados)
+        resumen['filas'] += len(filas)
+
+    logger.info("Características: %d símbolos actualizados, %d reconstruidos, %d filas escritas",
+                resumen['simbolos_actualizados'], resumen['simbolos_reconstruidos'], resumen['filas'])
+    return resumen
+
+
+def leer_caracteristicas(engine, symbol_ids, desde=None, hasta=None):
+    """
+    Lee las características precalculadas de AVdata.StockFeatures.
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine
+        Engine conectado a AlphaVantageDB.
+    symbol_ids : list
+        Símbolos a leer.
+    desde, hasta : str, opcional
+        Rango de fechas inclusivo 'YYYY-MM-DD'.
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        Una fila por (SymbolID, Date) con COLUMNAS_CARACTERISTICAS.
+    """
+    consulta = text(f'''
+        SELECT SymbolID, [Date], {', '.join(f'[{columna}]' for columna in COLUMNAS_CARACTERISTICAS)}
+        FROM AVdata.StockFeatures
+        WHERE SymbolID IN :symbol_ids AND [Date] BETWEEN :desde AND :hasta
+        ORDER BY SymbolID, [Date]
+    ''').bindparams(bindparam('symbol_ids', expanding=True),
+                    bindparam('desde', type_=Date()), bindparam('hasta', type_=Date()))
+    parametros = {
+        'symbol_ids': [int(symbol_id) for symbol_id in symbol_ids],
+        'desde': pd.Timestamp(desde or '1900-01-01').date(),
+        'hasta': pd.Timestamp(hasta or '2999-12-31').date(),
+    }
+    with engine.connect() as conn:
+        return _leer(conn, consulta, parametros)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    try:
+        from .sql_connection import cerrar_engine, obtener_engine
+    except ImportError:
+        from sql_connection import cerrar_engine, obtener_engine
+
+    parser = argparse.ArgumentParser(description="Mantenimiento de AVdata.StockFeatures")
+    parser.add_argument('--reconstruir', action='store_true',
+                        help="Recalcular todas las características (cambio de definición o de esquema)")
+    parser.add_argument('--simbolos', type=int, nargs='*',
+                        help="SymbolID a reconstruir (por defecto todos)")
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', '.env'))
+    try:
+        if args.reconstruir:
+            reconstruir_caracteristicas(obtener_engine(), args.simbolos)
+        else:
+            actualizar_caracteristicas(obtener_engine())
+    finally:
+        cerrar_engine()
@@ -0,0 +1,365 @@
+"""
+Módulo con un almacén en memoria de símbolos y precios OHLCV.
+
+Mantiene en el proceso la tabla de símbolos (SymbolID <-> Symbol) y, por
+símbolo, su histórico como arrays contiguos de NumPy: fechas como int32 (días
+desde 1970-01-01), precios float64 y volumen int64. Las consultas por rango de
+fechas se resuelven con búsqueda binaria (searchsorted) y devuelven vistas de
+los arrays, sin crear un objeto Python por fila.
+
+Los precios de cada símbolo se cargan la primera vez que se piden (o todos de
+golpe con cargar()) y se invalidan cuando un trabajo de descarga escribe
+nuevos datos de ese símbolo. Las escrituras de otros procesos (main.py
+--incremental o --huecos) se detectan releyendo MAX(CreatedDate) del símbolo
+como mucho cada ALMACEN_COMPROBACION_SEGUNDOS (5 s por defecto): si ha
+cambiado, la serie se vuelve a cargar. Un símbolo desconocido solo provoca una
+nueva lectura de la tabla de símbolos si la anterior tiene más de
+ALMACEN_RECARGA_SIMBOLOS_SEGUNDOS (60 s por defecto).
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+try:
+    from .sql_connection import ejecutar_consulta_por_lotes, obtener_engine
+except ImportError:
+    from sql_connection import ejecutar_consulta_por_lotes, obtener_engine
+
+SIMBOLOS_SQL = text('SELECT SymbolID, Symbol, IsActive FROM Metadata.Symbols')
+
+RECARGA_SIMBOLOS_POR_DEFECTO = 60
+COMPROBACION_INGESTAS_POR_DEFECTO = 5
+
+PRECIOS_SIMBOLO_SQL = '''
+    SELECT [Date], [Open], [High], [Low], [Close], [Volume]
+    FROM AVdata.StockPrices
+    WHERE SymbolID = :symbol_id
+    ORDER BY [Date]
+'''
+
+PRECIOS_TODOS_SQL = '''
+    SELECT SymbolID, [Date], [Open], [High], [Low], [Close], [Volume]
+    FROM AVdata.StockPrices
+    ORDER BY SymbolID, [Date]
+'''
+
+ULTIMA_INGESTA_SQL = text('SELECT MAX(CreatedDate) FROM AVdata.StockPrices WHERE SymbolID = :symbol_id')
+
+ULTIMAS_INGESTAS_SQL = text('SELECT SymbolID, MAX(CreatedDate) FROM AVdata.StockPrices GROUP BY SymbolID')
+
+# Histórico de un símbolo: arrays del mismo tamaño ordenados por fecha
+SerieOHLCV = namedtuple('SerieOHLCV', ['fechas', 'open', 'high', 'low', 'close', 'volume'])
+
+
+def a_dia(valor):
+    """Convierte 'YYYY-MM-DD', date, datetime o Timestamp al número de día (int) desde 1970-01-01."""
+    if isinstance(valor, str):
+        valor = datetime.strptime(valor[:10], '%Y-%m-%d').date()
+    elif isinstance(valor, datetime):
+        valor = valor.date()
+    elif not isinstance(valor, date):
+        valor = pd.Timestamp(valor).date()
+    return (valor - date(1970, 1, 1)).days
+
+
+def _a_segundos(valor):
+    """Convierte un CreatedDate (datetime o cadena) a segundos epoch, o None."""
+    if valor is None:
+        return None
+    return pd.Timestamp(valor).to_pydatetime().timestamp()
+
+
+def _serie_desde(df):
+    """Construye una SerieOHLCV a partir de un DataFrame con Date, Open, High, Low, Close y Volume."""
+    fechas = pd.to_datetime(df['Date']).to_numpy(dtype='datetime64[D]').astype(np.int32)
+    return SerieOHLCV(
+        fechas=np.ascontiguousarray(fechas),
+        open=df['Open'].to_numpy(dtype=np.float64, na_value=np.nan),
+        high=df['High'].to_numpy(dtype=np.float64, na_value=np.nan),
+        low=df['Low'].to_numpy(dtype=np.float64, na_value=np.nan),
+        close=df['Close'].to_numpy(dtype=np.float64, na_value=np.nan),
+        volume=df['Volume'].to_numpy(dtype=np.int64, na_value=0),
+    )
+
+
+class AlmacenMemoria:
+    """
+    Almacén en memoria de símbolos y precios.
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine, opcional
+        Engine del que se cargan los datos. Por defecto el compartido (obtener_engine).
+    recarga_simbolos : float, opcional
+        Segundos mínimos entre dos lecturas de la tabla de símbolos provocadas
+        por símbolos desconocidos. Por defecto ALMACEN_RECARGA_SIMBOLOS_SEGUNDOS o 60.
+    comprobacion_ingestas : float, opcional
+        Segundos durante los que se da por buena la última ingesta leída de un
+        símbolo antes de volver a consultar MAX(CreatedDate). Por defecto
+        ALMACEN_COMPROBACION_SEGUNDOS o 5.
+    """
+
+    def __init__(self, engine=None, recarga_simbolos=None, comprobacion_ingestas=None):
+        self._engine = engine
+        if recarga_simbolos is None:
+            recarga_simbolos = float(os.getenv('ALMACEN_RECARGA_SIMBOLOS_SEGUNDOS', RECARGA_SIMBOLOS_POR_DEFECTO))
+        self.recarga_simbolos = recarga_simbolos
+        if comprobacion_ingestas is None:
+            comprobacion_ingestas = float(os.getenv('ALMACEN_COMPROBACION_SEGUNDOS', COMPROBACION_INGESTAS_POR_DEFECTO))
+        self.comprobacion_ingestas = comprobacion_ingestas
+        self._lock = threading.Lock()
+        self._simbolos = None          # {SymbolID: (Symbol, activo)}
+        self._ids_por_simbolo = {}
+        self._series = {}              # {SymbolID: SerieOHLCV}
+        self._ingestas = {}            # {SymbolID: MAX(CreatedDate) en segundos epoch}
+        self._comprobadas = {}         # {SymbolID: time.monotonic() de la última lectura de _ingestas}
+        self._generacion = 0           # Aumenta con cada invalidación
+        self.cargado_en = None
+
+    @property
+    def engine(self):
+        return self._engine or obtener_engine()
+
+    # --- Símbolos -------------------------------------------------------------
+
+    def cargar_simbolos(self):
+        """Lee (o vuelve a leer) la tabla de símbolos."""
+        with self.engine.connect() as conn:
+            filas = conn.execute(SIMBOLOS_SQL).fetchall()
+        simbolos = {int(symbol_id): (symbol, bool(activo)) for symbol_id, symbol, activo in filas}
+        with self._lock:
+            self._simbolos = simbolos
+            self._ids_por_simbolo = {symbol: symbol_id for symbol_id, (symbol, _) in simbolos.items()}
+            self.cargado_en = time.time()
+
+    def _tabla_simbolos(self):
+        if self._simbolos is None:
+            self.cargar_simbolos()
+        return self._simbolos
+
+    def simbolos(self, solo_activos=True):
+        """
+        Lista de (SymbolID, Symbol) ordenada por Symbol.
+
+        Mismo formato que las filas de "SELECT SymbolID, Symbol FROM Metadata.Symbols".
+        """
+        tabla = self._tabla_simbolos()
+        return sorted(((symbol_id, symbol) for symbol_id, (symbol, activo) in tabla.items()
+                       if activo or not solo_activos), key=lambda fila: fila[1])
+
+    def _recargar_si_caducada(self):
+        """
+        Vuelve a leer la tabla de símbolos si la última lectura tiene más de
+        recarga_simbolos segundos. Devuelve True si la ha leído.
+
+        Así una sucesión de consultas de símbolos inexistentes cuesta como mucho
+        una lectura por intervalo, no una por consulta.
+        """
+        with self._lock:
+            if self.cargado_en is not None and time.time() - self.cargado_en < self.recarga_simbolos:
+                return False
+            # Se marca antes de leer para que los hilos concurrentes no repitan la lectura
+            self.cargado_en = time.time()
+        self.cargar_simbolos()
+        return True
+
+    def symbol_de(self, symbol_id, recargar=True):
+        """
+        Devuelve el Symbol de un SymbolID o None si no existe.
+
+        Si el ID no está en memoria y recargar es True, se vuelve a leer la
+        tabla de símbolos (como mucho una vez cada recarga_simbolos segundos),
+        por si se ha dado de alta después de la carga.
+        """
+        symbol_id = int(symbol_id)
+        entrada = self._tabla_simbolos().get(symbol_id)
+        if entrada is None and recargar and self._recargar_si_caducada():
+            entrada = self._simbolos.get(symbol_id)
+        return entrada[0] if entrada else None
+
+    def id_de(self, symbol, recargar=True):
+        """Devuelve el SymbolID de un Symbol o None si no existe (recargar: ver symbol_de)."""
+        self._tabla_simbolos()
+        symbol_id = self._ids_por_simbolo.get(symbol)
+        if symbol_id is None and recargar and self._recargar_si_caducada():
+            symbol_id = self._ids_por_simbolo.get(symbol)
+        return symbol_id
+
+    # --- Precios --------------------------------------------------------------
+
+    def cargar(self, tamano_lote=None):
+        """
+        Carga en memoria los símbolos y los precios de todos ellos.
+
+        Los precios se leen en streaming por bloques, así que el pico de memoria
+        es el de los arrays finales más un bloque.
+        """
+        self.cargar_simbolos()
+        generacion = self._generacion
+        # Las versiones se leen antes que los precios: si cambian entre medias,
+        # la siguiente comprobación verá una versión distinta y recargará
+        comprobado = time.monotonic()
+        with self.engine.connect() as conn:
+            ingestas = {int(symbol_id): _a_segundos(creado)
+                        for symbol_id, creado in conn.execute(ULTIMAS_INGESTAS_SQL)}
+        partes = {}
+        for bloque in ejecutar_consulta_por_lotes(self.engine, PRECIOS_TODOS_SQL, tamano_lote=tamano_lote):
+            for symbol_id, df in bloque.groupby('SymbolID', sort=False):
+                partes.setdefault(int(symbol_id), []).append(_serie_desde(df))
+        series = {symbol_id: SerieOHLCV(*(np.concatenate(campo) for campo in zip(*trozos)))
+                  for symbol_id, trozos in partes.items()}
+        with self._lock:
+            if generacion == self._generacion:
+                self._series = series
+                self._ingestas = ingestas
+                self._comprobadas = dict.fromkeys(ingestas, comprobado)
+        return self
+
+    def _comprobar_ingesta(self, symbol_id):
+        """
+        Relee MAX(CreatedDate) del símbolo si la última lectura tiene más de
+        comprobacion_ingestas segundos y, si ha cambiado (escritura de otro
+        proceso), descarta su serie en memoria.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            comprobado = self._comprobadas.get(symbol_id)
+            if comprobado is not None and ahora - comprobado < self.comprobacion_ingestas:
+                return
+            # Se marca antes de consultar para que los hilos concurrentes no repitan la lectura
+            self._comprobadas[symbol_id] = ahora
+        with self.engine.connect() as conn:
+            ingesta = _a_segundos(conn.execute(ULTIMA_INGESTA_SQL, {'symbol_id': symbol_id}).scalar())
+        with self._lock:
+            if symbol_id not in self._ingestas or self._ingestas[symbol_id] != ingesta:
+                # Una carga en curso de la serie puede ser anterior a esta versión: se descarta
+                self._generacion += 1
+                self._series.pop(symbol_id, None)
+                self._ingestas[symbol_id] = ingesta
+
+    def serie(self, symbol_id):
+        """Devuelve la SerieOHLCV completa de un símbolo, cargándola si hace falta."""
+        symbol_id = int(symbol_id)
+        self._comprobar_ingesta(symbol_id)
+        serie = self._series.get(symbol_id)
+        if serie is None:
+            generacion = self._generacion
+            trozos = [_serie_desde(bloque) for bloque in
+                      ejecutar_consulta_por_lotes(self.engine, PRECIOS_SIMBOLO_SQL, {'symbol_id': symbol_id})]
+            if trozos:
+                serie = SerieOHLCV(*(np.concatenate(campo) for campo in zip(*trozos)))
+            else:
+                serie = _serie_desde(pd.DataFrame(columns=['Date', 'Open', 'High', 'Low', 'Close', 'Volume']))
+            with self._lock:
+                # Si se ha invalidado durante la lectura, los datos pueden estar obsoletos: no se guardan
+                if generacion == self._generacion:
+                    self._series[symbol_id] = serie
+        return serie
+
+    def rango(self, symbol_id, desde=None, hasta=None):
+        """
+        Barras de un símbolo en el rango de fechas inclusivo [desde, hasta].
+
+        Parámetros:
+        -----------
+        symbol_id : int
+            SymbolID del símbolo.
+        desde, hasta : str o date, opcional
+            Límites del rango. Por defecto todo el histórico.
+
+        Retorna:
+        --------
+        SerieOHLCV
+            Vistas (sin copia) de los arrays del símbolo.
+
+        Ejemplo:
+        --------
+        >>> barras = obtener_almacen().rango(1, '2024-01-01', '2024-06-30')
+        >>> barras.close.mean()
+        """
+        serie = self.serie(symbol_id)
+        inicio = 0 if desde is None else np.searchsorted(serie.fechas, a_dia(desde), side='left')
+        fin = len(serie.fechas) if hasta is None else np.searchsorted(serie.fechas, a_dia(hasta), side='right')
+        return SerieOHLCV(*(campo[inicio:fin] for campo in serie))
+
+    def invalidar(self, symbol_id=None):
+        """
+        Descarta los precios en memoria de un símbolo (o de todos si symbol_id es None).
+
+        Se recargan en la siguiente consulta. Con symbol_id=None también se
+        descarta la tabla de símbolos.
+        """
+        with self._lock:
+            self._generacion += 1
+            if symbol_id is None:
+                self._series = {}
+                self._ingestas = {}
+                self._comprobadas = {}
+                self._simbolos = None
+            else:
+                self._series.pop(int(symbol_id), None)
+
+    def registrar_ingesta(self, symbol_id):
+        """
+        Anota que este proceso ha escrito precios de un símbolo: descarta su serie
+        y fuerza a releer su MAX(CreatedDate) en la siguiente consulta.
+        """
+        symbol_id = int(symbol_id)
+        self.invalidar(symbol_id)
+        with self._lock:
+            self._ingestas.pop(symbol_id, None)
+            self._comprobadas.pop(symbol_id, None)
+
+    def ultima_ingesta(self, symbol_id):
+        """
+        Segundos epoch de MAX(CreatedDate) de los precios del símbolo, o None si no tiene.
+
+        Se relee de la base de datos como mucho cada comprobacion_ingestas
+        segundos, así que refleja también las cargas de otros procesos. Sirve
+        como versión de los datos para ETag y Last-Modified.
+        """
+        symbol_id = int(symbol_id)
+        self._comprobar_ingesta(symbol_id)
+        return self._ingestas.get(symbol_id)
+
+    def memoria(self):
+        """
+        Ocupación aproximada del almacén.
+
+        Retorna:
+        --------
+        dict
+            simbolos, series, barras y bytes (arrays de precios más una
+            estimación de la tabla de símbolos).
+        """
+        with self._lock:
+            series = list(self._series.values())
+            simbolos = dict(self._simbolos or {})
+        bytes_series = sum(campo.nbytes for serie in series for campo in serie)
+        bytes_simbolos = sum(len(symbol) + 100 for symbol, _ in simbolos.values())
+        return {
+            'simbolos': len(simbolos),
+            'series': len(series),
+            'barras': sum(len(serie.fechas) for serie in series),
+            'bytes': bytes_series + bytes_simbolos,
+            'cargado_en': self.cargado_en,
+        }
+
+
+_almacen = None
+_almacen_lock = threading.Lock()
+
+
+def obtener_almacen():
+    """Devuelve el almacén en memoria compartido por el proceso."""
+    global _almacen
+    with _almacen_lock:
+        if _almacen is None:
+            _almacen = AlmacenMemoria()
+        return _almacen
@@ -0,0 +1,391 @@
+"""
+Banco de pruebas de rendimiento sin red ni SQL Server.
+
+Genera históricos sintéticos, los sirve con un proveedor falso en lugar de
+Yahoo Finance y los carga en un SQLite local por los mismos caminos de código
+que main.py y la ruta /descargar de la webapp. Mide:
+
+- ingesta: filas/s de la carga inicial (descargar_y_cargar + fusionar_precios),
+  de la recarga de un rango ya almacenado (procesar_descarga de la webapp, con la
+  caché de precios delante del proveedor falso) y de la actualización incremental
+  (actualizar_incremental);
+- consultas: latencia de lecturas por símbolo y rango, de
+  ProfileQueryWithAggregations.sql en SQLite y, si DuckDB está instalado, de
+  ProfileQueryWithAggregations.sql, EDA1.sql y EDA2.sql.sql sobre el espejo
+  columnar (EDA1 y EDA2 usan funciones de T-SQL que SQLite no tiene);
+- equivalentes en Python de EDA2 (calcular_caracteristicas) y de
+  ProfileQueryWithPivotation (construir_matriz);
+- características: reconstrucción y actualización de AVdata.StockFeatures;
+- memoria: pico de memoria reservada durante cada etapa (tracemalloc, con el pico
+  reiniciado al empezar la etapa y descontando lo que ya estaba reservado).
+
+El resultado se guarda en JSON (por defecto en data/benchmarks/) para poder
+comparar ejecuciones con --comparar. Las etapas que no ejecutan el código real
+sino un sustituto lo indican en el campo 'sustituto' del resultado.
+
+Uso:
+    python scripts/benchmark.py --simbolos 50 --anos 10
+    python scripts/benchmark.py --comparar data/benchmarks/anterior.json
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .actualizacion_incremental import actualizar_incremental
+    from .almacen_caracteristicas import actualizar_caracteristicas, reconstruir_caracteristicas
+    from .almacen_memoria import AlmacenMemoria
+    from .cache_precios import CachePrecios
+    from .caracteristicas import calcular_caracteristicas
+    from .carga_masiva import fusionar_precios
+    from .cola_trabajos import Trabajo
+    from .descargador import descargar_y_cargar
+    from .espejo_columnar import conectar_duckdb, ejecutar_consulta_duckdb, sincronizar_espejo, traducir_tsql
+    from .entorno_sintetico import ProveedorSintetico, crear_engine_local, generar_ohlcv, registrar_simbolos
+    from .matriz_precios import construir_matriz
+    from .metricas import obtener_metricas, perfilar
+    from .sql_connection import ejecutar_consulta
+except ImportError:
+    from actualizacion_incremental import actualizar_incremental
+    from almacen_caracteristicas import actualizar_caracteristicas, reconstruir_caracteristicas
+    from almacen_memoria import AlmacenMemoria
+    from cache_precios import CachePrecios
+    from caracteristicas import calcular_caracteristicas
+    from carga_masiva import fusionar_precios
+    from cola_trabajos import Trabajo
+    from descargador import descargar_y_cargar
+    from espejo_columnar import conectar_duckdb, ejecutar_consulta_duckdb, sincronizar_espejo, traducir_tsql
+    from entorno_sintetico import ProveedorSintetico, crear_engine_local, generar_ohlcv, registrar_simbolos
+    from matriz_precios import construir_matriz
+    from metricas import obtener_metricas, perfilar
+    from sql_connection import ejecutar_consulta
+
+DIRECTORIO_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRECTORIO_RESULTADOS = os.path.join(DIRECTORIO_PROYECTO, 'data', 'benchmarks')
+DIRECTORIO_CONSULTAS = os.path.join(DIRECTORIO_PROYECTO, 'scripts', 'Queries')
+
+# Filas por lote al leer de DuckDB los resultados que no caben en un DataFrame (EDA2)
+TAMANO_LOTE_DUCKDB = 100_000
+
+# Días de historia que se retienen en la carga inicial para medir después la incremental
+DIAS_INCREMENTALES = 30
+
+RANGO_POR_SIMBOLO_SQL = '''
+    SELECT [Date], [Open], [High], [Low], [Close], [Volume]
+    FROM AVdata.StockPrices
+    WHERE SymbolID = :symbol_id AND [Date] >= :desde AND [Date] <= :hasta
+'''
+
+
+def _commit_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORIO_PROYECTO,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _percentiles(tiempos):
+    tiempos = np.asarray(tiempos) * 1000
+    return {
+        'n': int(len(tiempos)),
+        'p50_ms': round(float(np.percentile(tiempos, 50)), 3),
+        'p95_ms': round(float(np.percentile(tiempos, 95)), 3),
+        'max_ms': round(float(tiempos.max()), 3),
+    }
+
+
+def _leer_consulta(nombre):
+    with open(os.path.join(DIRECTORIO_CONSULTAS, nombre), encoding='utf-8') as f:
+        return f.read()
+
+
+def _cargar_webapp(engine, descargar, silenciar=True):
+    """
+    Importa webapp/app.py apuntando su engine, su almacén y su descarga a los del benchmark.
+
+    Retorna:
+    --------
+    module o None
+        El módulo de la webapp, o None si Flask no está instalado.
+    """
+    spec = importlib.util.spec_from_file_location('benchmark_webapp',
+                                                  os.path.join(DIRECTORIO_PROYECTO, 'webapp', 'app.py'))
+    webapp = importlib.util.module_from_spec(spec)
+    salida = contextlib.redirect_stdout(io.StringIO()) if silenciar else contextlib.nullcontext()
+    # Al importarse la webapp llama a configurar_logging(): se conserva la configuración del benchmark
+    raiz = logging.getLogger('alphavantage')
+    configuracion = (raiz.handlers[:], raiz.level, raiz.propagate)
+    try:
+        with salida:
+            spec.loader.exec_module(webapp)
+    except ImportError:
+        return None
+    finally:
+        raiz.handlers[:], raiz.level, raiz.propagate = configuracion
+    almacen = AlmacenMemoria(engine, recarga_simbolos=0, comprobacion_ingestas=0)
+    webapp.obtener_engine = lambda: engine
+    webapp.obtener_almacen = lambda: almacen
+    webapp.descargar_datos_cache = descargar
+    return webapp
+
+
+class Banco:
+    """Ejecuta y registra las etapas del benchmark."""
+
+    def __init__(self, trazar_memoria=True, detallado=False):
+        self.resultados = {}
+        self.trazar_memoria = trazar_memoria
+        self.detallado = detallado
+
+    @contextlib.contextmanager
+    def etapa(self, nombre):
+        """Mide tiempo y memoria de un bloque; el bloque puede añadir métricas al dict que recibe."""
+        metricas = {}
+        salida = contextlib.nullcontext() if self.detallado else contextlib.redirect_stdout(io.StringIO())
+        if self.trazar_memoria:
+            # Un solo trazado para toda la ejecución; cada etapa reinicia el pico
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            memoria_inicial = tracemalloc.get_traced_memory()[0]
+        inicio = time.perf_counter()
+        with salida:
+            yield metricas
+        segundos = time.perf_counter() - inicio
+        metricas['segundos'] = round(segundos, 4)
+        if 'filas' in metricas and segundos > 0:
+            metricas['filas_por_segundo'] = round(metricas['filas'] / segundos, 1)
+        if self.trazar_memoria:
+            pico = tracemalloc.get_traced_memory()[1] - memoria_inicial
+            metricas['memoria_pico_mb'] = round(pico / (1024 * 1024), 1)
+        self.resultados[nombre] = metricas
+        print(f"{nombre:<32} {segundos:8.3f} s  "
+              + ", ".join(f"{clave}={valor}" for clave, valor in metricas.items() if clave != 'segundos'))
+
+
+def ejecutar_benchmark(simbolos=20, anos=10, repeticiones=50, latencia=0.0, directorio=None,
+                       trazar_memoria=True, detallado=False, semilla=0):
+    """
+    Ejecuta todas las etapas y devuelve el informe.
+
+    Parámetros:
+    -----------
+    simbolos : int, opcional
+        Número de símbolos sintéticos.
+    anos : int, opcional
+        Años de historia por símbolo.
+    repeticiones : int, opcional
+        Consultas por rango que se cronometran.
+    latencia : float, opcional
+        Segundos de latencia simulada por descarga.
+    directorio : str, opcional
+        Carpeta de la base SQLite (por defecto una temporal).
+    trazar_memoria : bool, opcional
+        Medir el pico de memoria de cada etapa con tracemalloc. Ralentiza las
+        etapas con muchas reservas; con False solo se miden tiempos.
+    detallado : bool, opcional
+        No silenciar los mensajes de las funciones medidas.
+
+    Retorna:
+    --------
+    dict
+        Parámetros, entorno y resultados por etapa.
+    """
+    banco = Banco(trazar_memoria=trazar_memoria, detallado=detallado)
+
+    with banco.etapa('generar_datos') as m:
+        datos = generar_ohlcv(simbolos, anos, semilla=semilla)
+        m['filas'] = sum(len(df) for df in datos.values())
+    ultima = max(df['Date'].iloc[-1] for df in datos.values()).tz_localize(None)
+    corte = (ultima - pd.Timedelta(days=DIAS_INCREMENTALES)).strftime('%Y-%m-%d')
+    fin = (ultima + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    inicio = min(df['Date'].iloc[0] for df in datos.values()).strftime('%Y-%m-%d')
+
+    engine = crear_engine_local(directorio)
+    simbolos_db = registrar_simbolos(engine, list(datos))
+    # Descargas sin límite de tasa: se mide el coste propio del proceso, no el de Yahoo
+    opciones_descarga = {'peticiones_por_segundo': 1_000_000}
+
+    # --- Ingesta: carga inicial por el camino de main.py ---
+    proveedor = ProveedorSintetico(datos, latencia=latencia, hasta=corte)
+    with banco.etapa('ingesta_carga_inicial') as m:
+        filas = []
+        tareas = [{**simbolo, 'inicio': inicio, 'fin': fin} for simbolo in simbolos_db]
+        resultado = descargar_y_cargar(
+            tareas, lambda tarea, df: filas.append(fusionar_precios(engine, df, tarea['SymbolID'])['filas']),
+            proveedor=proveedor, **opciones_descarga)
+        m['filas'] = sum(filas)
+        m['errores'] = len(resultado['errores'])
+
+    # --- Ingesta: actualización incremental (main.py --incremental) ---
+    proveedor.hasta = None
+    with banco.etapa('ingesta_incremental') as m:
+        resumen = actualizar_incremental(engine, inicio, fecha_fin=fin, proveedor=proveedor, **opciones_descarga)
+        m['filas'] = resumen['filas']
+        m['simbolos'] = resumen['simbolos_actualizados']
+
+    # --- Ingesta: recarga de un rango ya almacenado por procesar_descarga de la webapp ---
+    # La caché de precios va delante del proveedor falso, como descargar_datos_cache delante de Yahoo
+    cache = CachePrecios(tempfile.mkdtemp(prefix='alphavantage_cache_'), proveedor=proveedor)
+    descargadas = []
+
+    def descargar(symbol, periodo_inicio=None, periodo_fin=None, intervalo="1d"):
+        df = cache.obtener(symbol, periodo_inicio, periodo_fin, intervalo)
+        descargadas.append(len(df))
+        return df
+
+    webapp = _cargar_webapp(engine, descargar, silenciar=not detallado)
+    with banco.etapa('ingesta_descargar_webapp') as m:
+        desde_rango = (ultima - pd.DateOffset(years=1)).strftime('%Y-%m-%d')
+        for simbolo in simbolos_db[:min(10, len(simbolos_db))]:
+            if webapp is not None:
+                webapp.procesar_descarga(Trabajo('benchmark'), simbolo['SymbolID'], simbolo['Symbol'],
+                                         desde_rango, fin, False)
+            else:
+                fusionar_precios(engine, descargar(simbolo['Symbol'], desde_rango, fin), simbolo['SymbolID'])
+        m['filas'] = sum(descargadas)
+        if webapp is None:
+            m['sustituto'] = 'fusionar_precios (Flask no instalado)'
+
+    # --- Consultas ---
+    rng = np.random.default_rng(semilla)
+    with banco.etapa('consulta_rango_simbolo') as m:
+        tiempos = []
+        for _ in range(repeticiones):
+            simbolo = simbolos_db[int(rng.integers(len(simbolos_db)))]
+            desde = ultima - pd.DateOffset(years=int(rng.integers(1, max(2, anos))))
+            t0 = time.perf_counter()
+            ejecutar_consulta(engine, RANGO_POR_SIMBOLO_SQL, {
+                'symbol_id': simbolo['SymbolID'], 'desde': desde.strftime('%Y-%m-%d'),
+                'hasta': ultima.strftime('%Y-%m-%d')})
+            tiempos.append(time.perf_counter() - t0)
+        m.update(_percentiles(tiempos))
+
+    with banco.etapa('consulta_profile_agregaciones') as m:
+        m['filas'] = len(ejecutar_consulta(engine, _leer_consulta('ProfileQueryWithAggregations.sql')))
+
+    # Las consultas de scripts/Queries sobre el espejo columnar (solo si DuckDB está instalado)
+    if importlib.util.find_spec('duckdb'):
+        directorio_espejo = tempfile.mkdtemp(prefix='alphavantage_espejo_')
+        with banco.etapa('espejo_sincronizar') as m:
+            m['filas'] = sincronizar_espejo(engine, directorio=directorio_espejo)['filas']
+        with banco.etapa('consulta_profile_duckdb') as m:
+            m['filas'] = len(ejecutar_consulta_duckdb(_leer_consulta('ProfileQueryWithAggregations.sql'),
+                                                      directorio=directorio_espejo))
+        with banco.etapa('consulta_eda1_duckdb') as m:
+            eda1 = ejecutar_consulta_duckdb(_leer_consulta('EDA1.sql'), directorio=directorio_espejo)
+            m['filas'], m['columnas'] = eda1.shape
+        with banco.etapa('consulta_eda2_duckdb') as m:
+            # El OUTER APPLY de EDA2 devuelve k * k filas por fecha (k = sesiones en su ventana de
+            # 90 días): el resultado se lee por lotes en lugar de en un DataFrame
+            conexion = conectar_duckdb(directorio_espejo)
+            try:
+                resultado = conexion.execute(traducir_tsql(_leer_consulta('EDA2.sql.sql')))
+                # to_arrow_reader sustituye a fetch_record_batch en las versiones recientes de DuckDB
+                leer = getattr(resultado, 'to_arrow_reader', None) or resultado.fetch_record_batch
+                lector = leer(TAMANO_LOTE_DUCKDB)
+                m['filas'] = sum(lote.num_rows for lote in lector)
+            finally:
+                conexion.close()
+
+    with banco.etapa('consulta_matriz_pivotada') as m:
+        matriz = construir_matriz(engine, [simbolo['Symbol'] for simbolo in simbolos_db],
+                                  campos=['Open', 'High', 'Low', 'Close', 'Volume'])
+        m['filas'], m['columnas'] = matriz.shape
+        m['sustituto'] = 'construir_matriz en lugar de ProfileQueryWithPivotation.sql'
+
+    with banco.etapa('caracteristicas_eda2') as m:
+        precios = ejecutar_consulta(engine, 'SELECT SymbolID, [Date], [Open], [High], [Low], [Close], [Volume] '
+                                            'FROM AVdata.StockPrices')
+        m['filas'] = len(calcular_caracteristicas(precios))
+        m['sustituto'] = 'calcular_caracteristicas en lugar de EDA2.sql.sql'
+
+    # --- Características materializadas ---
+    with banco.etapa('caracteristicas_reconstruir') as m:
+        m['filas'] = reconstruir_caracteristicas(engine)['filas']
+
+    with banco.etapa('caracteristicas_incremental') as m:
+        # Una sesión nueva por símbolo, como en una actualización diaria
+        siguiente = (ultima + pd.offsets.BDay(1)).strftime('%Y-%m-%d')
+        for simbolo in simbolos_db:
+            ultima_barra = datos[simbolo['Symbol']].iloc[[-1]].copy()
+            ultima_barra['Date'] = pd.Timestamp(siguiente, tz='America/New_York')
+            fusionar_precios(engine, ultima_barra, simbolo['SymbolID'])
+        m['filas'] = actualizar_caracteristicas(engine)['filas']
+
+    engine.dispose()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit_git(),
+        'entorno': {
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+        },
+        'parametros': {
+            'simbolos': simbolos, 'anos': anos, 'repeticiones': repeticiones,
+            'latencia': latencia, 'semilla': semilla,
+        },
+        'resultados': banco.resultados,
+        'metricas': obtener_metricas().resumen(),
+    }
+
+
+def comparar(actual, anterior):
+    """Imprime, por etapa, la relación de tiempos entre dos informes (>1 = más lento ahora)."""
+    print(f"\nComparación con {anterior.get('fecha')} (commit {anterior.get('commit')}):")
+    if anterior.get('parametros') != actual['parametros']:
+        print(f"  Advertencia: parámetros distintos ({anterior.get('parametros')}); los tiempos no son comparables.")
+    for nombre, metricas in actual['resultados'].items():
+        previas = anterior.get('resultados', {}).get(nombre)
+        if not previas or not previas.get('segundos'):
+            continue
+        relacion = metricas['segundos'] / previas['segundos']
+        print(f"  {nombre:<32} {previas['segundos']:8.3f} s -> {metricas['segundos']:8.3f} s  (x{relacion:.2f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta, consultas y características")
+    parser.add_argument('--simbolos', type=int, default=20, help="Número de símbolos sintéticos")
+    parser.add_argument('--anos', type=int, default=10, help="Años de historia por símbolo")
+    parser.add_argument('--repeticiones', type=int, default=50, help="Consultas por rango cronometradas")
+    parser.add_argument('--latencia', type=float, default=0.0, help="Latencia simulada por descarga (s)")
+    parser.add_argument('--directorio', help="Carpeta de la base SQLite (por defecto temporal)")
+    parser.add_argument('--salida', help="Fichero JSON de resultados (por defecto data/benchmarks/benchmark_<fecha>.json)")
+    parser.add_argument('--comparar', help="Informe JSON anterior con el que comparar")
+    parser.add_argument('--sin-memoria', action='store_true',
+                        help="No medir la memoria por etapa (tiempos sin la sobrecarga de tracemalloc)")
+    parser.add_argument('--detallado', action='store_true', help="Mostrar los mensajes de las funciones medidas")
+    args = parser.parse_args()
+
+    with perfilar('benchmark'):
+        informe = ejecutar_benchmark(args.simbolos, args.anos, args.repeticiones, args.latencia,
+                                     args.directorio, not args.sin_memoria, args.detallado)
+
+    salida = args.salida or os.path.join(DIRECTORIO_RESULTADOS,
+                                         f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(informe, f, indent=2)
+    print(f"\nResultados guardados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            comparar(informe, json.load(f))
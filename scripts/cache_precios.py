@@ -0,0 +1,381 @@
+"""
+Módulo con una caché local en Parquet de los históricos descargados.
+
+Cada (símbolo, intervalo) se guarda en un fichero Parquet junto con los rangos
+de fechas que ya se han pedido al proveedor. Una petición que solapa con lo
+almacenado solo descarga los huecos que faltan y los fusiona con los datos
+existentes. Cada descarga incluye una barra ya almacenada: si su cierre no
+coincide (Yahoo reajusta el histórico tras un split o un dividendo), la entrada
+se invalida y se vuelve a descargar el rango pedido completo. El tamaño total se
+limita expulsando las entradas usadas hace más tiempo.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .yahoo_finance import descargar_datos_yahoo
+except ImportError:
+    from yahoo_finance import descargar_datos_yahoo
+
+DIRECTORIO_POR_DEFECTO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                      'data', 'cache_precios')
+MAX_MB_POR_DEFECTO = 1024
+# Los accesos de los aciertos se escriben en el índice como mucho cada tantos segundos
+GUARDADO_INDICE_POR_DEFECTO = 30
+# Diferencia relativa de cierre en la barra de solape a partir de la cual cambió la base
+TOLERANCIA_BASE = 1e-6
+
+logger = logging.getLogger('alphavantage.cache_precios')
+
+
+def _a_fecha(valor):
+    """Convierte 'YYYY-MM-DD', date o datetime a date."""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return datetime.strptime(valor, '%Y-%m-%d').date()
+
+
+def fusionar_rangos(rangos):
+    """Une rangos [inicio, fin) solapados o contiguos. Las fechas son cadenas 'YYYY-MM-DD'."""
+    fusionados = []
+    for inicio, fin in sorted(rangos):
+        if fusionados and inicio <= fusionados[-1][1]:
+            fusionados[-1][1] = max(fusionados[-1][1], fin)
+        else:
+            fusionados.append([inicio, fin])
+    return fusionados
+
+
+def calcular_huecos(rangos, inicio, fin):
+    """Devuelve los tramos de [inicio, fin) que no cubren los rangos dados."""
+    huecos = []
+    cursor = inicio
+    for r_inicio, r_fin in fusionar_rangos(rangos):
+        if r_fin <= cursor:
+            continue
+        if r_inicio >= fin:
+            break
+        if r_inicio > cursor:
+            huecos.append((cursor, r_inicio))
+        cursor = max(cursor, r_fin)
+        if cursor >= fin:
+            break
+    if cursor < fin:
+        huecos.append((cursor, fin))
+    return huecos
+
+
+def _fechas_locales(serie):
+    """Fechas sin zona horaria ni hora, para comparar con los límites de los rangos."""
+    fechas = pd.to_datetime(serie)
+    if fechas.dt.tz is not None:
+        fechas = fechas.dt.tz_localize(None)
+    return fechas.dt.normalize()
+
+
+def _ancla(datos, inicio, fin):
+    """
+    Barra almacenada con la que solapar la descarga del hueco [inicio, fin).
+
+    Es la última barra anterior al hueco o, si no hay, la primera posterior.
+    Retorna (barra, inicio, fin) con el tramo a pedir ampliado hasta ella, o
+    (None, inicio, fin) si no hay datos almacenados.
+    """
+    if datos is None or datos.empty:
+        return None, inicio, fin
+    fechas = _fechas_locales(datos['Date'])
+    anteriores = np.flatnonzero((fechas < pd.Timestamp(inicio)).to_numpy())
+    if len(anteriores):
+        barra = datos.iloc[anteriores[-1]]
+        return barra, fechas.iloc[anteriores[-1]].date().isoformat(), fin
+    posteriores = np.flatnonzero((fechas >= pd.Timestamp(fin)).to_numpy())
+    if len(posteriores):
+        barra = datos.iloc[posteriores[0]]
+        return barra, inicio, (fechas.iloc[posteriores[0]].date() + timedelta(days=1)).isoformat()
+    return None, inicio, fin
+
+
+def _cambio_de_base(barra, df):
+    """True si df trae la barra de solape con un cierre distinto del almacenado."""
+    if barra is None or df is None or df.empty:
+        return False
+    solape = df.loc[pd.to_datetime(df['Date']) == pd.Timestamp(barra['Date']), 'Close']
+    if solape.empty:
+        return False
+    return not np.isclose(solape.iloc[-1], barra['Close'], rtol=TOLERANCIA_BASE, atol=0)
+
+
+class CachePrecios:
+    """
+    Caché de lectura de históricos de precios en ficheros Parquet.
+
+    Parámetros:
+    -----------
+    directorio : str, opcional
+        Carpeta de la caché. Por defecto CACHE_PRECIOS_DIR o data/cache_precios.
+    max_bytes : int, opcional
+        Tamaño máximo en disco. Por defecto CACHE_PRECIOS_MAX_MB (1024 MB).
+    proveedor : callable, opcional
+        Función con la firma de descargar_datos_yahoo usada para los huecos.
+    guardado_indice : float, opcional
+        Segundos mínimos entre escrituras del índice provocadas solo por aciertos
+        (ultimo_acceso). Por defecto CACHE_PRECIOS_GUARDADO_SEGUNDOS (30).
+    """
+
+    def __init__(self, directorio=None, max_bytes=None, proveedor=descargar_datos_yahoo, guardado_indice=None):
+        self.directorio = directorio or os.getenv('CACHE_PRECIOS_DIR', DIRECTORIO_POR_DEFECTO)
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('CACHE_PRECIOS_MAX_MB', MAX_MB_POR_DEFECTO)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.proveedor = proveedor
+        if guardado_indice is None:
+            guardado_indice = float(os.getenv('CACHE_PRECIOS_GUARDADO_SEGUNDOS', GUARDADO_INDICE_POR_DEFECTO))
+        self.guardado_indice = guardado_indice
+        self.aciertos = 0
+        self.parciales = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+        self._locks_clave = {}
+        os.makedirs(self.directorio, exist_ok=True)
+        self._ruta_indice = os.path.join(self.directorio, 'indice.json')
+        self._indice = self._cargar_indice()
+        self._accesos_pendientes = False
+        self._guardado_en = time.monotonic()
+
+    # --- Índice ---------------------------------------------------------------
+
+    def _cargar_indice(self):
+        if not os.path.exists(self._ruta_indice):
+            return {}
+        try:
+            with open(self._ruta_indice, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Índice de caché ilegible, se empieza vacío: %s", e)
+            return {}
+
+    def _guardar_indice(self):
+        """Escribe el índice (con los accesos pendientes). Requiere self._lock."""
+        temporal = f"{self._ruta_indice}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self._indice, f, indent=2, sort_keys=True)
+        os.replace(temporal, self._ruta_indice)
+        self._accesos_pendientes = False
+        self._guardado_en = time.monotonic()
+
+    @staticmethod
+    def _clave(symbol, intervalo):
+        return f"{re.sub(r'[^A-Za-z0-9._=^-]', '_', symbol)}__{intervalo}"
+
+    def _ruta_datos(self, clave):
+        return os.path.join(self.directorio, f"{clave}.parquet")
+
+    def _lock_clave(self, clave):
+        with self._lock:
+            return self._locks_clave.setdefault(clave, threading.Lock())
+
+    # --- API pública ----------------------------------------------------------
+
+    def obtener(self, symbol, inicio=None, fin=None, intervalo="1d"):
+        """
+        Devuelve los precios de [inicio, fin) descargando solo lo que no está en caché.
+
+        Parámetros:
+        -----------
+        symbol : str
+            Símbolo bursátil.
+        inicio, fin : str, opcional
+            Fechas 'YYYY-MM-DD'. Por defecto un año atrás y hoy, como descargar_datos_yahoo.
+            fin es exclusiva, igual que en yfinance.
+        intervalo : str, opcional
+            Intervalo de los datos.
+
+        Retorna:
+        --------
+        pandas.DataFrame
+            Mismo formato que descargar_datos_yahoo.
+        """
+        hoy = date.today()
+        inicio = _a_fecha(inicio) if inicio is not None else hoy - timedelta(days=365)
+        fin = _a_fecha(fin) if fin is not None else hoy
+        clave = self._clave(symbol, intervalo)
+
+        with self._lock_clave(clave):
+            with self._lock:
+                entrada = self._indice.get(clave, {'rangos': [], 'bytes': 0})
+            huecos = calcular_huecos(entrada['rangos'], inicio.isoformat(), fin.isoformat())
+            datos = self._leer(clave)
+
+            with self._lock:
+                if not huecos:
+                    self.aciertos += 1
+                elif len(huecos) == 1 and huecos[0] == (inicio.isoformat(), fin.isoformat()):
+                    self.fallos += 1
+                else:
+                    self.parciales += 1
+            if huecos:
+                rangos = entrada['rangos']
+                nuevos = []
+                for h_inicio, h_fin in huecos:
+                    barra, desde, hasta = _ancla(datos, h_inicio, h_fin)
+                    df = self.proveedor(symbol, desde, hasta, intervalo)
+                    if _cambio_de_base(barra, df):
+                        logger.info("Cambio de base en '%s' (%s): se invalida la caché y se descarga de "
+                                    "nuevo desde %s", symbol, intervalo, inicio.isoformat())
+                        self._invalidar_clave(clave)
+                        datos, rangos = None, []
+                        huecos = [(inicio.isoformat(), fin.isoformat())]
+                        df = self.proveedor(symbol, inicio.isoformat(), fin.isoformat(), intervalo)
+                        nuevos = [df] if df is not None and not df.empty else []
+                        break
+                    if df is not None and not df.empty:
+                        nuevos.append(df)
+                # La sesión en curso puede estar incompleta: no se marca como cubierta
+                cubiertos = [[h_inicio, min(h_fin, hoy.isoformat())] for h_inicio, h_fin in huecos
+                             if h_inicio < hoy.isoformat()]
+                datos = self._escribir(clave, datos, nuevos, rangos + cubiertos)
+
+        if datos is None or datos.empty:
+            return pd.DataFrame()
+        fechas = _fechas_locales(datos['Date'])
+        mascara = (fechas >= pd.Timestamp(inicio)) & (fechas < pd.Timestamp(fin))
+        return datos.loc[mascara].reset_index(drop=True)
+
+    def descargar(self, symbol, periodo_inicio=None, periodo_fin=None, intervalo="1d"):
+        """Alias con la firma de descargar_datos_yahoo para inyectarlo como proveedor."""
+        return self.obtener(symbol, periodo_inicio, periodo_fin, intervalo)
+
+    def invalidar(self, symbol, intervalo="1d"):
+        """Elimina de la caché los datos de un símbolo (p. ej. tras un split o un dividendo)."""
+        clave = self._clave(symbol, intervalo)
+        with self._lock_clave(clave):
+            self._invalidar_clave(clave)
+
+    def guardar(self):
+        """Escribe en disco los accesos de los aciertos aún no guardados en el índice."""
+        with self._lock:
+            if self._accesos_pendientes:
+                self._guardar_indice()
+
+    def estadisticas(self):
+        """Contadores de aciertos, aciertos parciales y fallos, y ocupación en disco."""
+        with self._lock:
+            return {
+                'aciertos': self.aciertos,
+                'parciales': self.parciales,
+                'fallos': self.fallos,
+                'entradas': len(self._indice),
+                'bytes': sum(entrada.get('bytes', 0) for entrada in self._indice.values()),
+                'max_bytes': self.max_bytes,
+            }
+
+    # --- Lectura, escritura y expulsión ---------------------------------------
+
+    def _leer(self, clave):
+        ruta = self._ruta_datos(clave)
+        if not os.path.exists(ruta):
+            return None
+        with self._lock:
+            if clave in self._indice:
+                self._indice[clave]['ultimo_acceso'] = time.time()
+                self._accesos_pendientes = True
+                # Sin esto un proceso que solo acierta nunca reescribe el índice y, al
+                # reiniciar, la expulsión trata como frías las entradas más leídas
+                if time.monotonic() - self._guardado_en >= self.guardado_indice:
+                    self._guardar_indice()
+        return pd.read_parquet(ruta)
+
+    def _invalidar_clave(self, clave):
+        """Borra el fichero y la entrada del índice. Requiere el lock de la clave."""
+        ruta = self._ruta_datos(clave)
+        if os.path.exists(ruta):
+            os.remove(ruta)
+        with self._lock:
+            self._indice.pop(clave, None)
+            self._guardar_indice()
+
+    def _escribir(self, clave, datos, nuevos, rangos):
+        partes = ([datos] if datos is not None and not datos.empty else []) + nuevos
+        ruta = self._ruta_datos(clave)
+        if partes:
+            datos = pd.concat(partes, ignore_index=True)
+            # Los datos recién descargados sustituyen a los que ya había para la misma fecha
+            datos = (datos.drop_duplicates(subset='Date', keep='last')
+                          .sort_values('Date')
+                          .reset_index(drop=True))
+            datos.to_parquet(ruta, index=False, compression='zstd')
+        tamano = os.path.getsize(ruta) if os.path.exists(ruta) else 0
+
+        with self._lock:
+            self._indice[clave] = {
+                'rangos': fusionar_rangos(rangos),
+                'bytes': tamano,
+                'ultimo_acceso': time.time(),
+            }
+            self._expulsar(proteger=clave)
+            self._guardar_indice()
+        return datos
+
+    def _expulsar(self, proteger=None):
+        """
+        Elimina las entradas menos usadas hasta respetar max_bytes. Requiere self._lock.
+
+        Solo se expulsan las claves cuyo lock se obtiene sin esperar: una clave en uso
+        por otro hilo (leyendo su Parquet o descargando sus huecos) se salta y queda
+        para la siguiente escritura. Esperar aquí invertiría el orden de los locks
+        (clave y después self._lock) que sigue obtener().
+        """
+        total = sum(entrada.get('bytes', 0) for entrada in self._indice.values())
+        if total <= self.max_bytes:
+            return
+        candidatas = sorted(
+            (clave for clave in self._indice if clave != proteger),
+            key=lambda clave: self._indice[clave].get('ultimo_acceso', 0),
+        )
+        for clave in candidatas:
+            if total <= self.max_bytes:
+                break
+            lock = self._locks_clave.setdefault(clave, threading.Lock())
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                ruta = self._ruta_datos(clave)
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+                total -= self._indice.pop(clave).get('bytes', 0)
+            finally:
+                lock.release()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obtener_cache():
+    """Devuelve la caché de precios compartida por el proceso."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CachePrecios()
+            atexit.register(_cache.guardar)
+        return _cache
+
+
+def descargar_datos_cache(symbol, periodo_inicio=None, periodo_fin=None, intervalo="1d"):
+    """
+    Igual que descargar_datos_yahoo, pero leyendo de la caché local.
+
+    Solo se consulta Yahoo Finance para los tramos de fechas que aún no están en caché.
+    """
+    return obtener_cache().obtener(symbol, periodo_inicio, periodo_fin, intervalo)
@@ -0,0 +1,197 @@
+"""
+Módulo con el calendario de sesiones de NYSE/Nasdaq y la carga de Metadata.DateDim.
+
+Los festivos se generan con las reglas del mercado (pandas.tseries.holiday)
+más los cierres extraordinarios, y el calendario completo se calcula de forma
+vectorizada para todo el rango de fechas. cargar_date_dim sustituye al CTE
+recursivo de scripts/Queries/LlenarDateDim.sql y añade la columna EsDiaHabil,
+que permite distinguir un festivo de una barra que falta
+(actualizacion_incremental.detectar_huecos).
+
+Uso desde línea de comandos:
+    python scripts/calendario_bursatil.py                       # 1999-01-01 hasta fin del año próximo
+    python scripts/calendario_bursatil.py --desde 2010-01-01 --hasta 2030-12-31
+"""
+import argparse
+import logging
+import os
+from datetime import date
+
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, GoodFriday, Holiday, USLaborDay,
+                                    USMemorialDay, USPresidentsDay, USThanksgivingDay, MO,
+                                    nearest_workday, sunday_to_monday)
+from pandas.tseries.offsets import DateOffset
+from sqlalchemy import bindparam, text
+from sqlalchemy.types import Date
+
+try:
+    from .carga_masiva import ejecutar_por_lotes
+except ImportError:
+    from carga_masiva import ejecutar_por_lotes
+
+FECHA_INICIO_POR_DEFECTO = '1999-01-01'
+
+logger = logging.getLogger('alphavantage.calendario_bursatil')
+
+# Cierres no recogidos por las reglas anuales (atentados, huracanes, funerales de Estado)
+CIERRES_EXTRAORDINARIOS = [
+    '2001-09-11', '2001-09-12', '2001-09-13', '2001-09-14',
+    '2004-06-11', '2007-01-02', '2012-10-29', '2012-10-30',
+    '2018-12-05', '2025-01-09',
+]
+
+# Tal como los devuelve DATENAME con SET LANGUAGE Spanish (columnas months y days de
+# sys.syslanguages para Español): con mayúscula inicial y tildes
+NOMBRES_MES = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio',
+               'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
+NOMBRES_DIA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+INSERT_DATE_DIM_SQL = text('''
+    INSERT INTO Metadata.DateDim
+    (IdFecha, Fecha, DiaMes, MesDelAno, Ano, NombreMes, MesAno, SemanaAno, NombreDia, EsDiaHabil)
+    VALUES (:IdFecha, :Fecha, :DiaMes, :MesDelAno, :Ano, :NombreMes, :MesAno, :SemanaAno, :NombreDia, :EsDiaHabil)
+''').bindparams(bindparam('Fecha', type_=Date()))
+
+BORRAR_DATE_DIM_SQL = text('DELETE FROM Metadata.DateDim WHERE Fecha BETWEEN :desde AND :hasta').bindparams(
+    bindparam('desde', type_=Date()),
+    bindparam('hasta', type_=Date()),
+)
+
+
+class CalendarioNYSE(AbstractHolidayCalendar):
+    """
+    Festivos de NYSE. Si caen en fin de semana se trasladan al día laborable
+    más próximo, salvo Año Nuevo en sábado, que no se traslada al viernes.
+    """
+    rules = [
+        Holiday('Año Nuevo', month=1, day=1, observance=sunday_to_monday),
+        Holiday('Martin Luther King', month=1, day=1, offset=DateOffset(weekday=MO(3)),
+                start_date='1998-01-01'),
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, observance=nearest_workday, start_date='2022-01-01'),
+        Holiday('Independencia', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Navidad', month=12, day=25, observance=nearest_workday),
+    ]
+
+
+def festivos(desde, hasta):
+    """Festivos de mercado entre desde y hasta, incluidos los cierres extraordinarios (DatetimeIndex)."""
+    reglas = CalendarioNYSE().holidays(pd.Timestamp(desde), pd.Timestamp(hasta))
+    extraordinarios = pd.DatetimeIndex(CIERRES_EXTRAORDINARIOS)
+    extraordinarios = extraordinarios[(extraordinarios >= pd.Timestamp(desde)) &
+                                      (extraordinarios <= pd.Timestamp(hasta))]
+    return reglas.union(extraordinarios)
+
+
+def sesiones(desde, hasta):
+    """
+    Fechas con sesión de mercado entre desde y hasta, ambas incluidas.
+
+    Retorna:
+    --------
+    pandas.DatetimeIndex
+    """
+    dias = pd.bdate_range(desde, hasta)
+    return dias[~dias.isin(festivos(desde, hasta))]
+
+
+def construir_date_dim(desde=FECHA_INICIO_POR_DEFECTO, hasta=None):
+    """
+    Genera las filas de Metadata.DateDim para un rango de fechas.
+
+    Reproduce las columnas de LlenarDateDim.sql (con SET LANGUAGE Spanish:
+    nombres en español y semanas que empiezan en lunes) y añade EsDiaHabil.
+
+    Parámetros:
+    -----------
+    desde : str, opcional
+        Primera fecha 'YYYY-MM-DD'.
+    hasta : str, opcional
+        Última fecha. Por defecto el 31 de diciembre del año próximo.
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        Una fila por día natural con las columnas de Metadata.DateDim.
+    """
+    hasta = hasta or f"{date.today().year + 1}-12-31"
+    fechas = pd.date_range(desde, hasta, freq='D')
+    dia_semana = fechas.dayofweek.to_numpy()
+    # DATEPART(WEEK) con DATEFIRST 1: la semana 1 es la que contiene el 1 de enero
+    dia_semana_1_enero = (dia_semana - (fechas.dayofyear.to_numpy() - 1)) % 7
+    habiles = fechas.isin(sesiones(desde, hasta))
+    return pd.DataFrame({
+        'IdFecha': fechas.year * 10000 + fechas.month * 100 + fechas.day,
+        'Fecha': fechas.date,
+        'DiaMes': fechas.day,
+        'MesDelAno': fechas.month,
+        'Ano': fechas.year,
+        'NombreMes': pd.Categorical.from_codes(fechas.month - 1, NOMBRES_MES).astype(str),
+        'MesAno': fechas.month.astype(str) + '/' + fechas.year.astype(str),
+        'SemanaAno': (fechas.dayofyear.to_numpy() - 1 + dia_semana_1_enero) // 7 + 1,
+        'NombreDia': pd.Categorical.from_codes(dia_semana, NOMBRES_DIA).astype(str),
+        'EsDiaHabil': habiles.astype(int),
+    })
+
+
+def cargar_date_dim(engine, desde=FECHA_INICIO_POR_DEFECTO, hasta=None, tamano_lote=None):
+    """
+    Sustituye Metadata.DateDim en el rango indicado por el calendario generado.
+
+    Borra el rango y lo inserta por lotes (executemany) en una sola transacción.
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine
+        Engine conectado a AlphaVantageDB.
+    desde, hasta : str, opcional
+        Rango de fechas (ver construir_date_dim).
+    tamano_lote : int, opcional
+        Filas por llamada a executemany.
+
+    Retorna:
+    --------
+    dict
+        Resumen con dias y sesiones cargados.
+
+    Ejemplo:
+    --------
+    >>> cargar_date_dim(obtener_engine(), '2010-01-01', '2030-12-31')
+    """
+    calendario = construir_date_dim(desde, hasta)
+    rango = {'desde': calendario['Fecha'].iloc[0], 'hasta': calendario['Fecha'].iloc[-1]}
+    with engine.begin() as conn:
+        conn.execute(BORRAR_DATE_DIM_SQL, rango)
+        ejecutar_por_lotes(conn, INSERT_DATE_DIM_SQL, calendario, tamano_lote)
+    resumen = {'dias': len(calendario), 'sesiones': int(calendario['EsDiaHabil'].sum())}
+    logger.info("Metadata.DateDim cargada de %s a %s: %d días, %d sesiones", rango['desde'], rango['hasta'],
+                resumen['dias'], resumen['sesiones'])
+    return resumen
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    try:
+        from .metricas import configurar_logging
+        from .sql_connection import cerrar_engine, obtener_engine
+    except ImportError:
+        from metricas import configurar_logging
+        from sql_connection import cerrar_engine, obtener_engine
+
+    parser = argparse.ArgumentParser(description="Carga de Metadata.DateDim con el calendario de sesiones")
+    parser.add_argument('--desde', default=FECHA_INICIO_POR_DEFECTO, help="Primera fecha (YYYY-MM-DD)")
+    parser.add_argument('--hasta', help="Última fecha (por defecto fin del año próximo)")
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', '.env'))
+    configurar_logging()
+    try:
+        cargar_date_dim(obtener_engine(), args.desde, args.hasta)
+    finally:
+        cerrar_engine()
@@ -0,0 +1,265 @@
+"""
+Motor vectorizado de características equivalente a scripts/Queries/EDA2.sql.sql.
+
+Calcula para muchos símbolos a la vez, sobre arrays contiguos de NumPy, las
+mismas métricas que la consulta SQL con funciones de ventana:
+
+- MonthlyAvg_Close, MonthlyStdDev_Close, MonthlyAvg_Volume, MonthlyStdDev_Volume
+  (AVG/STDEV OVER (PARTITION BY Symbol, YEAR(Date), MONTH(Date)))
+- MA_20d_Close, MA_50d_Close y Volatility_20d_Close
+  (AVG/STDEV OVER (... ROWS BETWEEN n-1 PRECEDING AND CURRENT ROW))
+- PrevDay_Close, PctChange_Close_Daily y DailyRange
+- DayOfWeek, DayOfMonth y Month
+
+Las ventanas móviles se obtienen en O(n) con sumas acumuladas por símbolo
+(sumas y sumas de cuadrados, centradas en la media del símbolo) en lugar de
+recalcular cada ventana. Igual que en SQL Server, los
+NULL (NaN) se ignoran en AVG/STDEV, las ventanas iniciales incompletas usan las
+filas disponibles y STDEV de una sola fila es NULL.
+"""
+import numpy as np
+import pandas as pd
+
+VENTANA_MA_CORTA = 20
+VENTANA_MA_LARGA = 50
+VENTANA_VOLATILIDAD = 20
+
+COLUMNAS_CARACTERISTICAS = [
+    'MonthlyAvg_Close', 'MonthlyStdDev_Close', 'MonthlyAvg_Volume', 'MonthlyStdDev_Volume',
+    'MA_20d_Close', 'MA_50d_Close', 'Volatility_20d_Close',
+    'PrevDay_Close', 'PctChange_Close_Daily', 'DailyRange',
+    'DayOfWeek', 'DayOfMonth', 'Month',
+]
+
+
+def _inicio_de_grupo(grupos):
+    """Para cada fila, el índice de la primera fila de su grupo (los grupos deben ser contiguos)."""
+    n = len(grupos)
+    indices = np.arange(n)
+    nuevo = np.ones(n, dtype=bool)
+    if n > 1:
+        nuevo[1:] = grupos[1:] != grupos[:-1]
+    return np.maximum.accumulate(np.where(nuevo, indices, 0))
+
+
+def _acumulada_por_grupo(valores, limites):
+    """Suma acumulada (incluida la fila actual) que vuelve a empezar en cada grupo."""
+    acumulada = np.empty(len(valores), dtype=np.float64)
+    # Una suma por grupo: con una sola suma global, la ventana de un símbolo se
+    # obtendría restando dos totales que incluyen a todos los símbolos anteriores
+    # y perdería los dígitos significativos de las series de poca varianza
+    for desde, hasta in zip(limites[:-1], limites[1:]):
+        np.cumsum(valores[desde:hasta], out=acumulada[desde:hasta])
+    return acumulada
+
+
+def _sumas_acumuladas(valores, desplazamiento, limites):
+    """Sumas acumuladas por grupo de n, x y x² ignorando los NaN."""
+    validos = ~np.isnan(valores)
+    # Restar la media del grupo mantiene pequeños los términos de la suma de cuadrados
+    centrados = np.where(validos, valores - desplazamiento, 0.0)
+    return (
+        _acumulada_por_grupo(validos.astype(np.float64), limites),
+        _acumulada_por_grupo(centrados, limites),
+        _acumulada_por_grupo(centrados * centrados, limites),
+    )
+
+
+def _media_y_desviacion(n, suma, suma_cuadrados, desplazamiento):
+    """Media y desviación típica muestral (n-1) a partir de n, Σx y Σx²."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = np.where(n > 0, suma / n, np.nan) + desplazamiento
+        varianza = (suma_cuadrados - suma * suma / n) / (n - 1)
+    varianza = np.where(n > 1, np.maximum(varianza, 0.0), np.nan)
+    return media, np.sqrt(varianza)
+
+
+def ventana_movil(valores, inicio_grupo, ventana):
+    """
+    Media y desviación típica muestral móviles de las últimas `ventana` filas de cada grupo.
+
+    Equivale a AVG/STDEV OVER (PARTITION BY grupo ORDER BY Date
+    ROWS BETWEEN ventana-1 PRECEDING AND CURRENT ROW).
+
+    Parámetros:
+    -----------
+    valores : numpy.ndarray
+        Valores float64 ordenados por grupo y fecha.
+    inicio_grupo : numpy.ndarray
+        Índice de la primera fila del grupo de cada fila.
+    ventana : int
+        Número de filas de la ventana.
+
+    Retorna:
+    --------
+    tuple
+        (media, desviacion) como arrays float64.
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    indices = np.arange(len(valores))
+    limites = np.append(np.flatnonzero(inicio_grupo == indices), len(valores))
+    desplazamiento = _media_de_grupo(valores, inicio_grupo)
+    cuenta, suma, suma_cuadrados = _sumas_acumuladas(valores, desplazamiento, limites)
+    desde = np.maximum(inicio_grupo, indices - ventana + 1)
+    # Lo acumulado antes de la ventana (cero si la ventana empieza con el grupo)
+    anterior = desde > inicio_grupo
+    previa = np.maximum(desde - 1, 0)
+
+    def en_ventana(acumulada):
+        return acumulada - np.where(anterior, acumulada[previa], 0.0)
+
+    return _media_y_desviacion(en_ventana(cuenta), en_ventana(suma), en_ventana(suma_cuadrados),
+                               desplazamiento)
+
+
+def _media_de_grupo(valores, inicio_grupo):
+    """Media de los valores no nulos de cada grupo, repetida en cada fila (0 si no hay ninguno)."""
+    validos = ~np.isnan(valores)
+    _, grupo = np.unique(inicio_grupo, return_inverse=True)
+    n = np.bincount(grupo, weights=validos)
+    suma = np.bincount(grupo, weights=np.where(validos, valores, 0.0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = np.where(n > 0, suma / n, 0.0)
+    return media[grupo]
+
+
+def agregado_por_segmento(valores, segmentos):
+    """
+    Media y desviación típica muestral de cada segmento, repetidas en cada fila.
+
+    Equivale a AVG/STDEV OVER (PARTITION BY segmento).
+
+    Parámetros:
+    -----------
+    valores : numpy.ndarray
+        Valores float64.
+    segmentos : numpy.ndarray
+        Identificador entero 0..k-1 del segmento de cada fila.
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    validos = ~np.isnan(valores)
+    total = segmentos.max() + 1 if len(segmentos) else 0
+    n = np.bincount(segmentos, weights=validos, minlength=total)
+    # Centramos por la media del segmento en dos pasadas para no perder precisión
+    suma = np.bincount(segmentos, weights=np.where(validos, valores, 0.0), minlength=total)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = np.where(n > 0, suma / n, np.nan)
+    desvios = np.where(validos, valores - media[segmentos], 0.0)
+    suma_cuadrados = np.bincount(segmentos, weights=desvios * desvios, minlength=total)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        varianza = np.where(n > 1, suma_cuadrados / (n - 1), np.nan)
+    return media[segmentos], np.sqrt(varianza)[segmentos]
+
+
+def calcular_caracteristicas_arrays(grupos, fechas, close, volume, high=None, low=None, primer_dia_semana=7):
+    """
+    Calcula las características de EDA2 sobre arrays ya ordenados por grupo y fecha.
+
+    Parámetros:
+    -----------
+    grupos : numpy.ndarray
+        Identificador del símbolo de cada fila (filas de un mismo símbolo contiguas).
+    fechas : numpy.ndarray
+        Fechas como datetime64.
+    close, volume : numpy.ndarray
+        Precio de cierre y volumen.
+    high, low : numpy.ndarray, opcional
+        Máximo y mínimo para DailyRange.
+    primer_dia_semana : int, opcional
+        Equivalente a @@DATEFIRST de SQL Server (7 = domingo, el valor de us_english;
+        1 = lunes, el de SET LANGUAGE Spanish).
+
+    Retorna:
+    --------
+    dict
+        Diccionario {nombre_columna: numpy.ndarray} con COLUMNAS_CARACTERISTICAS.
+    """
+    grupos = np.asarray(grupos)
+    close = np.asarray(close, dtype=np.float64)
+    volume = np.asarray(volume, dtype=np.float64)
+    dias = np.asarray(fechas, dtype='datetime64[D]')
+    inicio_grupo = _inicio_de_grupo(grupos)
+    indices = np.arange(len(close))
+
+    # --- Métricas mensuales: un segmento por (símbolo, año, mes) contiguo ---
+    meses = dias.astype('datetime64[M]').astype(np.int64)
+    cambio = np.ones(len(close), dtype=bool)
+    if len(close) > 1:
+        cambio[1:] = (meses[1:] != meses[:-1]) | (inicio_grupo[1:] == indices[1:])
+    segmentos = np.cumsum(cambio) - 1
+
+    resultado = {}
+    resultado['MonthlyAvg_Close'], resultado['MonthlyStdDev_Close'] = agregado_por_segmento(close, segmentos)
+    resultado['MonthlyAvg_Volume'], resultado['MonthlyStdDev_Volume'] = agregado_por_segmento(volume, segmentos)
+
+    # --- Métricas móviles ---
+    resultado['MA_20d_Close'], volatilidad = ventana_movil(close, inicio_grupo, VENTANA_MA_CORTA)
+    resultado['MA_50d_Close'], _ = ventana_movil(close, inicio_grupo, VENTANA_MA_LARGA)
+    if VENTANA_VOLATILIDAD != VENTANA_MA_CORTA:
+        _, volatilidad = ventana_movil(close, inicio_grupo, VENTANA_VOLATILIDAD)
+    resultado['Volatility_20d_Close'] = volatilidad
+
+    # --- Cambio y lag (LAG devuelve NULL en la primera fila de cada símbolo) ---
+    previo = np.full(len(close), np.nan)
+    if len(close) > 1:
+        previo[1:] = close[:-1]
+    previo[inicio_grupo == indices] = np.nan
+    resultado['PrevDay_Close'] = previo
+    with np.errstate(invalid='ignore', divide='ignore'):
+        resultado['PctChange_Close_Daily'] = np.where(previo != 0, (close - previo) / previo, np.nan)
+    if high is not None and low is not None:
+        resultado['DailyRange'] = np.asarray(high, dtype=np.float64) - np.asarray(low, dtype=np.float64)
+    else:
+        resultado['DailyRange'] = np.full(len(close), np.nan)
+
+    # --- Características de fecha (1970-01-01 fue jueves) ---
+    dias_epoch = dias.astype(np.int64)
+    resultado['DayOfWeek'] = ((dias_epoch + 4 - primer_dia_semana % 7) % 7 + 1).astype(np.int8)
+    resultado['DayOfMonth'] = ((dias - dias.astype('datetime64[M]')).astype(np.int64) + 1).astype(np.int8)
+    resultado['Month'] = (meses % 12 + 1).astype(np.int8)
+    return resultado
+
+
+def calcular_caracteristicas(df, columna_grupo='SymbolID', primer_dia_semana=7):
+    """
+    Calcula las características de EDA2 para un DataFrame en formato largo.
+
+    Parámetros:
+    -----------
+    df : pandas.DataFrame
+        Una fila por (símbolo, fecha) con las columnas Date, Open, High, Low,
+        Close, Volume y la columna de grupo (SymbolID o Symbol). No hace falta
+        que venga ordenado.
+    columna_grupo : str, opcional
+        Columna que identifica el símbolo.
+    primer_dia_semana : int, opcional
+        Equivalente a @@DATEFIRST para DayOfWeek (7 = domingo).
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        El DataFrame ordenado por símbolo y fecha con COLUMNAS_CARACTERISTICAS añadidas.
+
+    Ejemplo:
+    --------
+    >>> precios = ejecutar_consulta(engine, "SELECT SymbolID, [Date], [Open], High, Low, [Close], Volume FROM AVdata.StockPrices")
+    >>> features = calcular_caracteristicas(precios)
+    """
+    fechas = pd.to_datetime(df['Date'])
+    if fechas.dt.tz is not None:
+        fechas = fechas.dt.tz_localize(None)
+    fechas = fechas.to_numpy(dtype='datetime64[ns]')
+    grupos = df[columna_grupo].to_numpy()
+    orden = np.lexsort((fechas, grupos))
+
+    ordenado = df.iloc[orden].reset_index(drop=True)
+    caracteristicas = calcular_caracteristicas_arrays(
+        grupos[orden],
+        fechas[orden],
+        ordenado['Close'].to_numpy(dtype=np.float64, na_value=np.nan),
+        ordenado['Volume'].to_numpy(dtype=np.float64, na_value=np.nan),
+        ordenado['High'].to_numpy(dtype=np.float64, na_value=np.nan),
+        ordenado['Low'].to_numpy(dtype=np.float64, na_value=np.nan),
+        primer_dia_semana=primer_dia_semana,
+    )
+    return pd.concat([ordenado, pd.DataFrame(caracteristicas)], axis=1)
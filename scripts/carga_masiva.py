@@ -0,0 +1,303 @@
+"""
+Módulo para la carga masiva de precios históricos en AVdata.StockPrices.
+
+Sustituye las inserciones fila a fila por lotes enviados con executemany:
+cada lote viaja al servidor en una única llamada (con pyodbc y
+fast_executemany los parámetros se envían como arrays por columna).
+
+fusionar_precios es la carga idempotente que usan main.py, la actualización
+incremental y la webapp: los lotes van a AVdata.StockPricesStaging y un único
+MERGE contra la clave (SymbolID, Date) inserta las barras nuevas y actualiza
+solo las que han cambiado, de modo que repetir una carga no duplica filas.
+"""
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.types import Date, DateTime
+
+try:
+    from .metricas import contar, fijar, observar
+except ImportError:
+    from metricas import contar, fijar, observar
+
+TAMANO_LOTE_POR_DEFECTO = 1000
+
+logger = logging.getLogger('alphavantage.carga_masiva')
+
+# Columnas que devuelve descargar_datos_yahoo y que se guardan en la tabla
+COLUMNAS_PRECIOS = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def _tamano_lote(tamano_lote):
+    """Devuelve el tamaño de lote indicado o el configurado en CARGA_TAMANO_LOTE."""
+    if tamano_lote is None:
+        tamano_lote = int(os.getenv('CARGA_TAMANO_LOTE', TAMANO_LOTE_POR_DEFECTO))
+    if tamano_lote <= 0:
+        raise ValueError("El tamaño de lote debe ser un entero positivo.")
+    return tamano_lote
+
+
+def preparar_precios(df, symbol_id):
+    """
+    Convierte el DataFrame de descargar_datos_yahoo al formato de AVdata.StockPrices.
+
+    Parámetros:
+    -----------
+    df : pandas.DataFrame
+        DataFrame con las columnas Date, Open, High, Low, Close y Volume.
+    symbol_id : int
+        Identificador del símbolo en Metadata.Symbols.
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        DataFrame con las columnas symbol_id, date, open, high, low, close y volume,
+        donde date es una fecha sin zona horaria.
+    """
+    faltantes = [columna for columna in COLUMNAS_PRECIOS if columna not in df.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en el DataFrame de precios: {faltantes}")
+
+    fechas = pd.to_datetime(df['Date'])
+    # yfinance devuelve fechas con la zona horaria del mercado; nos quedamos con la fecha local
+    if fechas.dt.tz is not None:
+        fechas = fechas.dt.tz_localize(None)
+
+    return pd.DataFrame({
+        'symbol_id': int(symbol_id),
+        'date': fechas.dt.date,
+        'open': df['Open'].astype('float64'),
+        'high': df['High'].astype('float64'),
+        'low': df['Low'].astype('float64'),
+        'close': df['Close'].astype('float64'),
+        'volume': df['Volume'].astype('Int64'),
+    })
+
+
+def _lotes_de_parametros(registros, tamano_lote, constantes=None):
+    """Genera listas de diccionarios de parámetros de, como mucho, tamano_lote filas."""
+    # Convertimos columna a columna (NaN -> None) en lugar de iterar con iterrows
+    columnas = {
+        nombre: registros[nombre].astype(object).where(registros[nombre].notna(), None).tolist()
+        for nombre in registros.columns
+    }
+    nombres = list(columnas)
+    total = len(registros)
+    for inicio in range(0, total, tamano_lote):
+        valores = zip(*(columnas[nombre][inicio:inicio + tamano_lote] for nombre in nombres))
+        lote = [dict(zip(nombres, fila)) for fila in valores]
+        if constantes:
+            for params in lote:
+                params.update(constantes)
+        yield lote
+
+
+def ejecutar_por_lotes(conn, sentencia, registros, tamano_lote=None, constantes=None, progreso=None):
+    """
+    Ejecuta una sentencia parametrizada con executemany, un lote de filas cada vez.
+
+    Parámetros:
+    -----------
+    conn : sqlalchemy.engine.Connection
+        Conexión con la transacción abierta.
+    sentencia : sqlalchemy.sql.elements.TextClause
+        Sentencia con un parámetro por columna de registros.
+    registros : pandas.DataFrame
+        Una fila por ejecución; los NaN se envían como NULL.
+    tamano_lote : int, opcional
+        Filas por llamada a executemany. Por defecto CARGA_TAMANO_LOTE o 1000.
+    constantes : dict, opcional
+        Parámetros con el mismo valor en todas las filas.
+    progreso : callable, opcional
+        Función progreso(filas) llamada tras cada lote.
+
+    Retorna:
+    --------
+    tuple
+        (filas, lotes) enviados.
+    """
+    tamano_lote = _tamano_lote(tamano_lote)
+    filas = lotes = 0
+    for lote in _lotes_de_parametros(registros, tamano_lote, constantes):
+        inicio = time.perf_counter()
+        conn.execute(sentencia, lote)
+        observar('sql_lote_segundos', time.perf_counter() - inicio, {'filas': len(lote)})
+        contar('sql_lote_filas', len(lote))
+        filas += len(lote)
+        lotes += 1
+        if progreso is not None:
+            progreso(filas)
+    return filas, lotes
+
+
+def _cerrar_estadisticas(estadisticas, inicio, symbol_id, metrica):
+    """Completa segundos y filas_por_segundo y registra las métricas <metrica>_segundos y <metrica>_filas."""
+    segundos = time.perf_counter() - inicio
+    estadisticas['segundos'] = segundos
+    estadisticas['filas_por_segundo'] = estadisticas['filas'] / segundos if segundos > 0 else 0.0
+    observar(f'{metrica}_segundos', segundos, {'symbol_id': int(symbol_id), 'filas': estadisticas['filas'],
+                                                'filas_por_segundo': round(estadisticas['filas_por_segundo'], 1)})
+    contar(f'{metrica}_filas', estadisticas['filas'])
+    fijar(f'{metrica}_filas_por_segundo', round(estadisticas['filas_por_segundo'], 1))
+
+
+# --- Carga idempotente: staging + MERGE --------------------------------------
+
+INSERT_STAGING_SQL = text('''
+    INSERT INTO AVdata.StockPricesStaging
+    (LoteID, SymbolID, [Date], [Open], [High], [Low], [Close], [Volume], CreatedDate)
+    VALUES (:lote_id, :symbol_id, :date, :open, :high, :low, :close, :volume, :created_date)
+''').bindparams(
+    bindparam('date', type_=Date()),
+    bindparam('created_date', type_=DateTime()),
+)
+
+# Solo se reescriben las barras cuyos valores cambian (EXCEPT compara también los NULL)
+MERGE_PRECIOS_SQL = text('''
+    SET NOCOUNT ON;
+    DECLARE @acciones TABLE (Accion NVARCHAR(10), Fecha DATE);
+    MERGE AVdata.StockPrices WITH (HOLDLOCK) AS destino
+    USING (
+        SELECT SymbolID, [Date], [Open], [High], [Low], [Close], [Volume], CreatedDate
+        FROM AVdata.StockPricesStaging
+        WHERE LoteID = :lote_id
+    ) AS origen
+    ON destino.SymbolID = origen.SymbolID AND destino.[Date] = origen.[Date]
+    WHEN MATCHED AND EXISTS (
+        SELECT destino.[Open], destino.[High], destino.[Low], destino.[Close], destino.[Volume]
+        EXCEPT
+        SELECT origen.[Open], origen.[High], origen.[Low], origen.[Close], origen.[Volume]
+    ) THEN
+        UPDATE SET [Open] = origen.[Open], [High] = origen.[High], [Low] = origen.[Low],
+                   [Close] = origen.[Close], [Volume] = origen.[Volume], CreatedDate = origen.CreatedDate
+    WHEN NOT MATCHED BY TARGET THEN
+        INSERT (SymbolID, [Date], [Open], [High], [Low], [Close], [Volume], CreatedDate)
+        VALUES (origen.SymbolID, origen.[Date], origen.[Open], origen.[High], origen.[Low],
+                origen.[Close], origen.[Volume], origen.CreatedDate)
+    OUTPUT $action, inserted.[Date] INTO @acciones;
+    SELECT COALESCE(SUM(CASE WHEN Accion = 'INSERT' THEN 1 ELSE 0 END), 0) AS Insertadas,
+           COALESCE(SUM(CASE WHEN Accion = 'UPDATE' THEN 1 ELSE 0 END), 0) AS Actualizadas,
+           MIN(Fecha) AS PrimeraFecha
+    FROM @acciones;
+''')
+
+# Equivalente para SQLite (entorno local y benchmark): INSERT ... ON CONFLICT.
+# Antes del upsert se cuentan las barras ya existentes y la primera que va a cambiar
+EXISTENTES_STAGING_SQL = text('''
+    SELECT COUNT(sp.SymbolID),
+           MIN(CASE WHEN sp.SymbolID IS NULL
+                      OR sp.[Open] IS NOT st.[Open] OR sp.[High] IS NOT st.[High]
+                      OR sp.[Low] IS NOT st.[Low] OR sp.[Close] IS NOT st.[Close]
+                      OR sp.[Volume] IS NOT st.[Volume]
+                    THEN st.[Date] END)
+    FROM AVdata.StockPricesStaging st
+    LEFT JOIN AVdata.StockPrices sp ON sp.SymbolID = st.SymbolID AND sp.[Date] = st.[Date]
+    WHERE st.LoteID = :lote_id
+''')
+
+UPSERT_PRECIOS_SQL = text('''
+    INSERT INTO AVdata.StockPrices (SymbolID, [Date], [Open], [High], [Low], [Close], [Volume], CreatedDate)
+    SELECT SymbolID, [Date], [Open], [High], [Low], [Close], [Volume], CreatedDate
+    FROM AVdata.StockPricesStaging
+    WHERE LoteID = :lote_id
+    ON CONFLICT (SymbolID, [Date]) DO UPDATE SET
+        [Open] = excluded.[Open], [High] = excluded.[High], [Low] = excluded.[Low],
+        [Close] = excluded.[Close], [Volume] = excluded.[Volume], CreatedDate = excluded.CreatedDate
+    WHERE StockPrices.[Open] IS NOT excluded.[Open] OR StockPrices.[High] IS NOT excluded.[High]
+       OR StockPrices.[Low] IS NOT excluded.[Low] OR StockPrices.[Close] IS NOT excluded.[Close]
+       OR StockPrices.[Volume] IS NOT excluded.[Volume]
+''')
+
+BORRAR_STAGING_SQL = text('DELETE FROM AVdata.StockPricesStaging WHERE LoteID = :lote_id')
+
+
+def fusionar_precios(destino, df, symbol_id, tamano_lote=None, progreso=None):
+    """
+    Inserta o actualiza los precios de un símbolo (upsert) sobre la clave (SymbolID, Date).
+
+    Los lotes se cargan con executemany en AVdata.StockPricesStaging y después
+    una sola sentencia MERGE (ON CONFLICT en SQLite) los aplica a
+    AVdata.StockPrices: inserta las fechas nuevas, actualiza las que han
+    cambiado y no escribe las idénticas. Repetir la misma carga es idempotente
+    y no reescribe el histórico. Todo ocurre en una transacción.
+
+    Las barras insertadas o actualizadas reciben un CreatedDate nuevo; con él
+    actualizar_caracteristicas detecta las que cambian en o antes de su punto
+    de control. La carga no toca AVdata.StockFeatures ni su estado.
+
+    Parámetros:
+    -----------
+    destino : sqlalchemy.engine.Engine o sqlalchemy.engine.Connection
+        Engine (se abre una transacción propia) o conexión ya abierta.
+    df : pandas.DataFrame
+        DataFrame devuelto por descargar_datos_yahoo. Si una fecha aparece
+        varias veces se conserva la última.
+    symbol_id : int
+        Identificador del símbolo en Metadata.Symbols.
+    tamano_lote : int, opcional
+        Filas por llamada a executemany. Por defecto CARGA_TAMANO_LOTE o 1000.
+    progreso : callable, opcional
+        Función progreso(filas) llamada tras cada lote cargado en staging.
+
+    Retorna:
+    --------
+    dict
+        Estadísticas de la carga: filas, lotes, filas_insertadas,
+        filas_actualizadas, primera_fecha_cambiada (fecha más antigua insertada
+        o actualizada, None si no cambia nada), segundos y filas_por_segundo.
+
+    Ejemplo:
+    --------
+    >>> df = descargar_datos_yahoo('AAPL', '2024-01-01', '2024-12-31')
+    >>> fusionar_precios(engine, df, symbol_id=1)['filas_insertadas']
+    """
+    tamano_lote = _tamano_lote(tamano_lote)
+    estadisticas = {'filas': 0, 'lotes': 0, 'filas_insertadas': 0, 'filas_actualizadas': 0,
+                    'primera_fecha_cambiada': None, 'segundos': 0.0, 'filas_por_segundo': 0.0}
+    if df is None or df.empty:
+        return estadisticas
+    precios = preparar_precios(df, symbol_id).drop_duplicates('date', keep='last')
+
+    inicio = time.perf_counter()
+    try:
+        if isinstance(destino, Engine):
+            with destino.begin() as conn:
+                _fusionar_lotes(conn, precios, tamano_lote, estadisticas, progreso)
+        else:
+            _fusionar_lotes(destino, precios, tamano_lote, estadisticas, progreso)
+    except SQLAlchemyError as e:
+        logger.error("Error en la carga (MERGE) del SymbolID %s: %s", symbol_id, e)
+        raise
+
+    _cerrar_estadisticas(estadisticas, inicio, symbol_id, 'fusion')
+    logger.info("SymbolID %s: %d filas (%d nuevas, %d actualizadas) en %.2f s", symbol_id, estadisticas['filas'],
+                estadisticas['filas_insertadas'], estadisticas['filas_actualizadas'], estadisticas['segundos'])
+    return estadisticas
+
+
+def _fusionar_lotes(conn, precios, tamano_lote, estadisticas, progreso):
+    """Carga precios en staging con un LoteID propio, aplica el MERGE y vacía el lote."""
+    lote_id = str(uuid.uuid4())
+    filas, lotes = ejecutar_por_lotes(conn, INSERT_STAGING_SQL, precios, tamano_lote,
+                                      {'lote_id': lote_id, 'created_date': datetime.now()}, progreso)
+    if conn.dialect.name == 'mssql':
+        insertadas, actualizadas, primera_fecha = conn.execute(MERGE_PRECIOS_SQL, {'lote_id': lote_id}).one()
+    else:
+        existentes, primera_fecha = conn.execute(EXISTENTES_STAGING_SQL, {'lote_id': lote_id}).one()
+        escritas = conn.execute(UPSERT_PRECIOS_SQL, {'lote_id': lote_id}).rowcount
+        insertadas, actualizadas = filas - existentes, escritas - (filas - existentes)
+    conn.execute(BORRAR_STAGING_SQL, {'lote_id': lote_id})
+    if primera_fecha is not None:
+        estadisticas['primera_fecha_cambiada'] = pd.Timestamp(primera_fecha).date()
+
+    estadisticas['filas'] += filas
+    estadisticas['lotes'] += lotes
+    estadisticas['filas_insertadas'] += int(insertadas)
+    estadisticas['filas_actualizadas'] += int(actualizadas)
@@ -0,0 +1,183 @@
+"""
+Módulo con una cola de trabajos en segundo plano dentro del propio proceso.
+
+Permite que una petición HTTP encole un trabajo largo (descarga e inserción de
+precios) y responda al momento con su identificador. El estado del trabajo
+(fase, filas procesadas, tiempo transcurrido) se consulta después por su ID.
+Los envíos duplicados con la misma clave se agrupan en un único trabajo activo.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .metricas import observar
+except ImportError:
+    from metricas import observar
+
+HILOS_POR_DEFECTO = 2
+RETENCION_SEGUNDOS = 3600
+
+logger = logging.getLogger('alphavantage.cola_trabajos')
+
+PENDIENTE = 'pendiente'
+EN_CURSO = 'en_curso'
+COMPLETADO = 'completado'
+ERROR = 'error'
+
+
+class Trabajo:
+    """
+    Estado de un trabajo encolado.
+
+    La función del trabajo recibe esta instancia y notifica su avance con
+    actualizar(fase=..., filas=...).
+    """
+
+    def __init__(self, clave, descripcion=None):
+        self.id = uuid.uuid4().hex
+        self.clave = clave
+        self.descripcion = descripcion
+        self.estado = PENDIENTE
+        self.fase = 'en cola'
+        self.filas = 0
+        self.mensaje = None
+        self.error = None
+        self.creado = time.time()
+        self.iniciado = None
+        self.terminado = None
+        self._lock = threading.Lock()
+
+    @property
+    def activo(self):
+        return self.estado in (PENDIENTE, EN_CURSO)
+
+    def actualizar(self, fase=None, filas=None, mensaje=None):
+        """Actualiza la fase, las filas procesadas o el mensaje del trabajo."""
+        with self._lock:
+            if fase is not None:
+                self.fase = fase
+            if filas is not None:
+                self.filas = filas
+            if mensaje is not None:
+                self.mensaje = mensaje
+
+    def a_dict(self):
+        """Representación serializable a JSON del estado del trabajo."""
+        with self._lock:
+            fin = self.terminado or time.time()
+            return {
+                'id': self.id,
+                'descripcion': self.descripcion,
+                'estado': self.estado,
+                'fase': self.fase,
+                'filas': self.filas,
+                'mensaje': self.mensaje,
+                'error': self.error,
+                'segundos': round(fin - self.iniciado, 3) if self.iniciado else 0.0,
+                'segundos_en_cola': round((self.iniciado or fin) - self.creado, 3),
+            }
+
+
+class GestorTrabajos:
+    """
+    Pool de hilos que ejecuta trabajos y guarda su estado en memoria.
+
+    Parámetros:
+    -----------
+    max_hilos : int, opcional
+        Trabajos simultáneos. Por defecto TRABAJOS_HILOS o 2.
+    retencion_segundos : int, opcional
+        Tiempo que se conserva el estado de un trabajo terminado.
+    """
+
+    def __init__(self, max_hilos=None, retencion_segundos=RETENCION_SEGUNDOS):
+        if max_hilos is None:
+            max_hilos = int(os.getenv('TRABAJOS_HILOS', HILOS_POR_DEFECTO))
+        self._pool = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="trabajo")
+        self._trabajos = {}
+        self._activos = {}
+        self._lock = threading.Lock()
+        self.retencion_segundos = retencion_segundos
+
+    def enviar(self, clave, funcion, *args, descripcion=None, **kwargs):
+        """
+        Encola funcion(trabajo, *args, **kwargs) salvo que ya haya uno activo con la misma clave.
+
+        Parámetros:
+        -----------
+        clave : hashable
+            Identifica trabajos equivalentes (p. ej. (symbol_id, inicio, fin)).
+        funcion : callable
+            Función que realiza el trabajo. Su valor de retorno, si es un str,
+            se guarda como mensaje final.
+        descripcion : str, opcional
+            Texto descriptivo para el estado.
+
+        Retorna:
+        --------
+        tuple
+            (trabajo, nuevo): el trabajo y False si se ha reutilizado uno existente.
+        """
+        with self._lock:
+            self._purgar()
+            existente = self._activos.get(clave)
+            if existente is not None and existente.activo:
+                return existente, False
+            trabajo = Trabajo(clave, descripcion)
+            self._trabajos[trabajo.id] = trabajo
+            self._activos[clave] = trabajo
+        self._pool.submit(self._ejecutar, trabajo, funcion, args, kwargs)
+        return trabajo, True
+
+    def obtener(self, trabajo_id):
+        """Devuelve el trabajo con ese ID o None."""
+        with self._lock:
+            return self._trabajos.get(trabajo_id)
+
+    def listar(self):
+        """Estado de todos los trabajos conservados, del más reciente al más antiguo."""
+        with self._lock:
+            trabajos = sorted(self._trabajos.values(), key=lambda t: t.creado, reverse=True)
+        return [trabajo.a_dict() for trabajo in trabajos]
+
+    def _ejecutar(self, trabajo, funcion, args, kwargs):
+        with trabajo._lock:
+            trabajo.estado = EN_CURSO
+            trabajo.iniciado = time.time()
+        try:
+            resultado = funcion(trabajo, *args, **kwargs)
+            with trabajo._lock:
+                trabajo.estado = COMPLETADO
+                trabajo.fase = 'terminado'
+                if isinstance(resultado, str):
+                    trabajo.mensaje = resultado
+        except Exception as e:
+            logger.exception("Error en el trabajo %s (%s): %s", trabajo.id, trabajo.descripcion, e)
+            with trabajo._lock:
+                trabajo.estado = ERROR
+                trabajo.error = str(e)
+        finally:
+            with trabajo._lock:
+                trabajo.terminado = time.time()
+            observar('trabajo_segundos', trabajo.terminado - trabajo.iniciado,
+                     {'trabajo': trabajo.id, 'descripcion': trabajo.descripcion, 'filas': trabajo.filas},
+                     estado=trabajo.estado)
+            with self._lock:
+                if self._activos.get(trabajo.clave) is trabajo:
+                    del self._activos[trabajo.clave]
+
+    def _purgar(self):
+        """Olvida los trabajos terminados hace más de retencion_segundos. Requiere self._lock."""
+        limite = time.time() - self.retencion_segundos
+        caducados = [trabajo_id for trabajo_id, trabajo in self._trabajos.items()
+                     if trabajo.terminado is not None and trabajo.terminado < limite]
+        for trabajo_id in caducados:
+            del self._trabajos[trabajo_id]
+
+    def cerrar(self, esperar=True):
+        """Detiene el pool de hilos."""
+        self._pool.shutdown(wait=esperar)
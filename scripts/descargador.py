@@ -0,0 +1,232 @@
+"""
+Módulo para descargar muchos símbolos en paralelo respetando un límite de peticiones.
+
+Sustituye las pausas fijas entre símbolos por:
+- un limitador de tasa por cubeta de tokens compartido por todos los hilos,
+- reintentos con espera exponencial y jitter,
+- un pool acotado de hilos de descarga cuyo resultado consume un único hilo
+  escritor, de forma que las descargas se solapan con la escritura en base de datos.
+
+El proveedor es inyectable (por defecto descargar_datos_yahoo), lo que permite
+usar un proveedor falso sin red.
+"""
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    from .metricas import contar, cronometro
+    from .yahoo_finance import descargar_datos_yahoo
+except ImportError:
+    from metricas import contar, cronometro
+    from yahoo_finance import descargar_datos_yahoo
+
+PETICIONES_POR_SEGUNDO_POR_DEFECTO = 2.0
+HILOS_POR_DEFECTO = 4
+REINTENTOS_POR_DEFECTO = 3
+
+_FIN = object()
+
+logger = logging.getLogger('alphavantage.descargador')
+
+
+class LimitadorTasa:
+    """
+    Limitador de tasa por cubeta de tokens, seguro entre hilos.
+
+    Parámetros:
+    -----------
+    peticiones_por_segundo : float
+        Tokens que se reponen por segundo.
+    capacidad : float, opcional
+        Tamaño máximo de la cubeta (ráfaga permitida). Por defecto igual a
+        peticiones_por_segundo, con un mínimo de 1.
+    """
+
+    def __init__(self, peticiones_por_segundo, capacidad=None):
+        if peticiones_por_segundo <= 0:
+            raise ValueError("peticiones_por_segundo debe ser mayor que cero.")
+        self.tasa = float(peticiones_por_segundo)
+        self.capacidad = float(capacidad if capacidad is not None else max(1.0, self.tasa))
+        self._tokens = self.capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reponer(self):
+        ahora = time.monotonic()
+        self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    def adquirir(self, tokens=1):
+        """Bloquea hasta que haya tokens disponibles y los consume."""
+        while True:
+            with self._lock:
+                self._reponer()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                espera = (tokens - self._tokens) / self.tasa
+            # Dormimos fuera del lock para no bloquear a los demás hilos
+            time.sleep(espera)
+
+
+def descargar_con_reintentos(proveedor, symbol, inicio=None, fin=None, intervalo="1d", limitador=None,
+                             reintentos=REINTENTOS_POR_DEFECTO, espera_base=1.0, espera_maxima=30.0):
+    """
+    Llama al proveedor reintentando los errores con espera exponencial y jitter.
+
+    Cada intento consume un token del limitador, de modo que los reintentos
+    también cuentan para el límite de peticiones.
+
+    Parámetros:
+    -----------
+    proveedor : callable
+        Función con la firma de descargar_datos_yahoo.
+    symbol : str
+        Símbolo a descargar.
+    inicio, fin : str, opcional
+        Fechas en formato 'YYYY-MM-DD'.
+    intervalo : str, opcional
+        Intervalo de los datos ('1d' por defecto).
+    limitador : LimitadorTasa, opcional
+        Limitador compartido. Si es None no se limita la tasa.
+    reintentos : int, opcional
+        Número de reintentos tras el primer intento fallido.
+    espera_base, espera_maxima : float, opcional
+        Parámetros de la espera exponencial (en segundos).
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        Resultado del proveedor.
+    """
+    intento = 0
+    while True:
+        if limitador is not None:
+            limitador.adquirir()
+        try:
+            with cronometro('descarga_segundos', {'symbol': symbol, 'intento': intento + 1}) as detalle:
+                df = proveedor(symbol, inicio, fin, intervalo)
+                detalle['filas'] = 0 if df is None else len(df)
+            contar('descarga_filas', detalle['filas'])
+            return df
+        except Exception as e:
+            if intento >= reintentos:
+                contar('descarga_errores')
+                raise
+            contar('descarga_reintentos')
+            # "Full jitter": espera aleatoria entre 0 y el tope exponencial
+            espera = random.uniform(0, min(espera_maxima, espera_base * (2 ** intento)))
+            logger.warning("Error descargando %s (intento %d/%d): %s. Reintentando en %.1f s",
+                           symbol, intento + 1, reintentos + 1, e, espera)
+            time.sleep(espera)
+            intento += 1
+
+
+def descargar_y_cargar(tareas, escritor, proveedor=descargar_datos_yahoo, max_hilos=None,
+                       peticiones_por_segundo=None, intervalo="1d", reintentos=REINTENTOS_POR_DEFECTO,
+                       limitador=None):
+    """
+    Descarga en paralelo una lista de tramos y los entrega a un único escritor.
+
+    Parámetros:
+    -----------
+    tareas : list
+        Lista de diccionarios con SymbolID, Symbol, inicio y fin (el formato de
+        actualizacion_incremental.planificar_descargas).
+    escritor : callable
+        Función escritor(tarea, df) que persiste cada resultado. Se ejecuta
+        siempre en el mismo hilo, mientras continúan las descargas.
+    proveedor : callable, opcional
+        Función con la firma de descargar_datos_yahoo.
+    max_hilos : int, opcional
+        Hilos de descarga. Por defecto DESCARGA_HILOS o 4.
+    peticiones_por_segundo : float, opcional
+        Límite de peticiones. Por defecto DESCARGA_PETICIONES_POR_SEGUNDO o 2.
+    intervalo : str, opcional
+        Intervalo de los datos.
+    reintentos : int, opcional
+        Reintentos por símbolo.
+    limitador : LimitadorTasa, opcional
+        Limitador a compartir con otras descargas; si se indica, se ignora
+        peticiones_por_segundo.
+
+    Retorna:
+    --------
+    dict
+        Resumen con descargados, vacios, escritos, errores (lista de (symbol, error))
+        y segundos.
+    """
+    if max_hilos is None:
+        max_hilos = int(os.getenv('DESCARGA_HILOS', HILOS_POR_DEFECTO))
+    if limitador is None:
+        if peticiones_por_segundo is None:
+            peticiones_por_segundo = float(os.getenv('DESCARGA_PETICIONES_POR_SEGUNDO',
+                                                     PETICIONES_POR_SEGUNDO_POR_DEFECTO))
+        limitador = LimitadorTasa(peticiones_por_segundo)
+
+    resumen = {'descargados': 0, 'vacios': 0, 'escritos': 0, 'errores': [], 'segundos': 0.0}
+    # Cola acotada: si el escritor va más lento, las descargas esperan en lugar de acumular memoria
+    pendientes = queue.Queue(maxsize=max_hilos * 2)
+    inicio = time.perf_counter()
+
+    def consumir():
+        while True:
+            elemento = pendientes.get()
+            if elemento is _FIN:
+                return
+            tarea, df = elemento
+            try:
+                escritor(tarea, df)
+                resumen['escritos'] += 1
+            except Exception as e:
+                logger.error("Error guardando %s: %s", tarea['Symbol'], e)
+                resumen['errores'].append((tarea['Symbol'], str(e)))
+
+    hilo_escritor = threading.Thread(target=consumir, name="escritor-precios", daemon=True)
+    hilo_escritor.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="descarga") as pool:
+            # Solo mantenemos en vuelo un número acotado de descargas para que la
+            # memoria no crezca con el tamaño de la lista de tareas
+            restantes = iter(tareas)
+            en_curso = {}
+
+            def lanzar():
+                for tarea in restantes:
+                    futuro = pool.submit(descargar_con_reintentos, proveedor, tarea['Symbol'], tarea.get('inicio'),
+                                         tarea.get('fin'), intervalo, limitador, reintentos)
+                    en_curso[futuro] = tarea
+                    if len(en_curso) >= max_hilos * 2:
+                        return
+
+            lanzar()
+            while en_curso:
+                terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    tarea = en_curso.pop(futuro)
+                    try:
+                        df = futuro.result()
+                    except Exception as e:
+                        logger.error("Error con %s: %s", tarea['Symbol'], e)
+                        resumen['errores'].append((tarea['Symbol'], str(e)))
+                        continue
+                    if df is None or df.empty:
+                        resumen['vacios'] += 1
+                        continue
+                    resumen['descargados'] += 1
+                    pendientes.put((tarea, df))
+                lanzar()
+    finally:
+        pendientes.put(_FIN)
+        hilo_escritor.join()
+
+    resumen['segundos'] = time.perf_counter() - inicio
+    logger.info("Descarga concurrente: %d símbolos descargados, %d guardados, %d errores en %.1f s",
+                resumen['descargados'], resumen['escritos'], len(resumen['errores']), resumen['segundos'])
+    return resumen
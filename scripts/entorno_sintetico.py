@@ -0,0 +1,196 @@
+"""
+Módulo con un entorno local sintético para pruebas de rendimiento sin red ni SQL Server.
+
+- generar_ohlcv: históricos diarios OHLCV aleatorios (paseo geométrico) para
+  N símbolos y A años, reproducibles con una semilla.
+- ProveedorSintetico: sustituto de descargar_datos_yahoo que sirve esos
+  históricos con el mismo formato (columna Date con zona horaria, fin exclusivo)
+  y una latencia simulada opcional.
+- crear_engine_local: engine SQLite con los esquemas AVdata y Metadata
+  adjuntos (ATTACH) y las tablas del proyecto, de modo que las consultas con
+  nombres como AVdata.StockPrices funcionan sin cambios.
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event, text
+
+try:
+    from .sql_connection import crear_engine
+except ImportError:
+    from sql_connection import crear_engine
+
+# Los primeros símbolos coinciden con los de las consultas de scripts/Queries
+SIMBOLOS_BASE = ['AAPL', 'NVDA', 'MSFT', 'GOOGL', 'AMZN']
+
+TABLAS_SQLITE = [
+    '''CREATE TABLE IF NOT EXISTS Metadata.Symbols (
+        SymbolID INTEGER PRIMARY KEY, Symbol TEXT NOT NULL, CompanyName TEXT NOT NULL,
+        IsActive INTEGER DEFAULT 1, CreatedDate DATETIME DEFAULT CURRENT_TIMESTAMP)''',
+    '''CREATE TABLE IF NOT EXISTS Metadata.DateDim (
+        IdFecha INTEGER PRIMARY KEY, Fecha DATE NOT NULL, DiaMes INTEGER NOT NULL, MesDelAno INTEGER NOT NULL,
+        Ano INTEGER NOT NULL, NombreMes TEXT NOT NULL, MesAno TEXT NOT NULL, SemanaAno INTEGER NOT NULL,
+        NombreDia TEXT, EsDiaHabil INTEGER NOT NULL DEFAULT 0)''',
+    '''CREATE TABLE IF NOT EXISTS AVdata.StockPrices (
+        PriceID INTEGER PRIMARY KEY AUTOINCREMENT, SymbolID INTEGER NOT NULL, [Date] DATE NOT NULL,
+        [Open] REAL, [High] REAL, [Low] REAL, [Close] REAL, [Volume] INTEGER,
+        CreatedDate DATETIME DEFAULT CURRENT_TIMESTAMP)''',
+    'CREATE UNIQUE INDEX IF NOT EXISTS AVdata.UX_StockPrices_SymbolDate ON StockPrices (SymbolID, [Date])',
+    'CREATE INDEX IF NOT EXISTS AVdata.IX_StockPrices_SymbolCreated ON StockPrices (SymbolID, CreatedDate)',
+    '''CREATE TABLE IF NOT EXISTS AVdata.StockPricesStaging (
+        LoteID TEXT NOT NULL, SymbolID INTEGER NOT NULL, [Date] DATE NOT NULL,
+        [Open] REAL, [High] REAL, [Low] REAL, [Close] REAL, [Volume] INTEGER, CreatedDate DATETIME NOT NULL,
+        PRIMARY KEY (LoteID, SymbolID, [Date]))''',
+    '''CREATE TABLE IF NOT EXISTS AVdata.StockFeatures (
+        SymbolID INTEGER NOT NULL, [Date] DATE NOT NULL,
+        MonthlyAvg_Close REAL, MonthlyStdDev_Close REAL, MonthlyAvg_Volume REAL, MonthlyStdDev_Volume REAL,
+        MA_20d_Close REAL, MA_50d_Close REAL, Volatility_20d_Close REAL,
+        PrevDay_Close REAL, PctChange_Close_Daily REAL, DailyRange REAL,
+        DayOfWeek INTEGER, DayOfMonth INTEGER, [Month] INTEGER, CreatedDate DATETIME,
+        PRIMARY KEY (SymbolID, [Date]))''',
+    '''CREATE TABLE IF NOT EXISTS AVdata.StockFeaturesState (
+        SymbolID INTEGER PRIMARY KEY, LastDate DATE NOT NULL, DefinitionVersion INTEGER NOT NULL,
+        [State] TEXT NOT NULL, UpdatedDate DATETIME)''',
+]
+
+
+def nombres_simbolos(n):
+    """Los n primeros símbolos: SIMBOLOS_BASE y después SYN0005, SYN0006..."""
+    return [SIMBOLOS_BASE[i] if i < len(SIMBOLOS_BASE) else f"SYN{i:04d}" for i in range(n)]
+
+
+def generar_ohlcv(simbolos=10, anos=10, fecha_fin='2024-12-31', semilla=0):
+    """
+    Genera históricos diarios sintéticos.
+
+    Parámetros:
+    -----------
+    simbolos : int o list
+        Número de símbolos (ver nombres_simbolos) o lista de nombres.
+    anos : int, opcional
+        Años de historia hasta fecha_fin, en días hábiles (lunes a viernes).
+    fecha_fin : str, opcional
+        Última fecha generada 'YYYY-MM-DD'.
+    semilla : int, opcional
+        Semilla del generador aleatorio.
+
+    Retorna:
+    --------
+    dict
+        {symbol: DataFrame} con Date (tz America/New_York), Open, High, Low,
+        Close y Volume, como descargar_datos_yahoo.
+    """
+    if isinstance(simbolos, int):
+        simbolos = nombres_simbolos(simbolos)
+    fin = pd.Timestamp(fecha_fin)
+    fechas = pd.bdate_range(fin - pd.DateOffset(years=anos) + pd.Timedelta(days=1), fin,
+                            tz='America/New_York')
+    rng = np.random.default_rng(semilla)
+    n = len(fechas)
+    datos = {}
+    for symbol in simbolos:
+        rendimientos = rng.normal(0.0003, 0.02, n)
+        cierre = rng.uniform(10, 500) * np.exp(np.cumsum(rendimientos))
+        apertura = cierre * np.exp(rng.normal(0, 0.005, n))
+        maximo = np.maximum(apertura, cierre) * (1 + np.abs(rng.normal(0, 0.01, n)))
+        minimo = np.minimum(apertura, cierre) * (1 - np.abs(rng.normal(0, 0.01, n)))
+        datos[symbol] = pd.DataFrame({
+            'Date': fechas,
+            'Open': apertura.round(6),
+            'High': maximo.round(6),
+            'Low': minimo.round(6),
+            'Close': cierre.round(6),
+            'Volume': rng.integers(100_000, 50_000_000, n),
+        })
+    return datos
+
+
+class ProveedorSintetico:
+    """
+    Sustituto de descargar_datos_yahoo que sirve históricos generados en memoria.
+
+    Parámetros:
+    -----------
+    datos : dict
+        {symbol: DataFrame} como devuelve generar_ohlcv.
+    latencia : float, opcional
+        Segundos de espera por petición para simular la red.
+    hasta : str, opcional
+        Fecha 'YYYY-MM-DD' a partir de la cual no hay datos ("hoy" del proveedor);
+        al avanzarla se simulan sesiones nuevas para la carga incremental.
+    """
+
+    def __init__(self, datos, latencia=0.0, hasta=None):
+        self.datos = datos
+        self.latencia = latencia
+        self.hasta = hasta
+        self.peticiones = 0
+
+    def __call__(self, symbol, periodo_inicio=None, periodo_fin=None, intervalo="1d"):
+        self.peticiones += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        df = self.datos.get(symbol)
+        if df is None:
+            return pd.DataFrame()
+        fechas = df['Date'].dt.tz_localize(None)
+        mascara = np.ones(len(df), dtype=bool)
+        if periodo_inicio:
+            mascara &= fechas >= pd.Timestamp(periodo_inicio)
+        if periodo_fin:
+            mascara &= fechas < pd.Timestamp(periodo_fin)
+        if self.hasta:
+            mascara &= fechas <= pd.Timestamp(self.hasta)
+        return df.loc[mascara].reset_index(drop=True)
+
+
+def crear_engine_local(directorio=None):
+    """
+    Crea un engine SQLite con las tablas del proyecto.
+
+    Parámetros:
+    -----------
+    directorio : str, opcional
+        Carpeta de los ficheros main.db, avdata.db y metadata.db. Por defecto
+        una carpeta temporal nueva.
+
+    Retorna:
+    --------
+    sqlalchemy.engine.Engine
+    """
+    directorio = directorio or tempfile.mkdtemp(prefix='alphavantage_')
+    os.makedirs(directorio, exist_ok=True)
+    engine = crear_engine(f"sqlite:///{os.path.join(directorio, 'main.db')}")
+
+    @event.listens_for(engine, 'connect')
+    def _adjuntar_esquemas(conexion_dbapi, registro):
+        for esquema in ('AVdata', 'Metadata'):
+            ruta = os.path.join(directorio, f"{esquema.lower()}.db")
+            conexion_dbapi.execute(f"ATTACH DATABASE '{ruta}' AS {esquema}")
+
+    with engine.begin() as conn:
+        for sentencia in TABLAS_SQLITE:
+            conn.execute(text(sentencia))
+    return engine
+
+
+def registrar_simbolos(engine, simbolos):
+    """
+    Da de alta los símbolos en Metadata.Symbols (SymbolID = posición + 1).
+
+    Retorna:
+    --------
+    list
+        Lista de diccionarios con SymbolID y Symbol.
+    """
+    filas = [{'symbol_id': i + 1, 'symbol': symbol, 'company': f"{symbol} Inc."}
+             for i, symbol in enumerate(simbolos)]
+    with engine.begin() as conn:
+        conn.execute(text('''
+            INSERT INTO Metadata.Symbols (SymbolID, Symbol, CompanyName, IsActive)
+            VALUES (:symbol_id, :symbol, :company, 1)
+        '''), filas)
+    return [{'SymbolID': fila['symbol_id'], 'Symbol': fila['symbol']} for fila in filas]
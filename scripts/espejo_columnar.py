@@ -0,0 +1,381 @@
+"""
+Módulo con un espejo columnar local (Parquet + DuckDB) de las tablas de análisis.
+
+Mantiene copias en Parquet de AVdata.StockPrices (un fichero por símbolo),
+Metadata.Symbols y Metadata.DateDim, y las expone en DuckDB con los mismos
+nombres de esquema y tabla. Así las consultas de scripts/Queries (EDA1, EDA2,
+ProfileQueryWithAggregations, ProfileQueryWithPivotation) se ejecutan en local,
+vectorizadas y sin conexión, en lugar de escanear la tabla de filas de SQL Server.
+
+El espejo se actualiza después de cada ingesta con sincronizar_espejo, que
+solo reescribe los símbolos cuyo número de filas o última escritura han
+cambiado. DuckDB es una dependencia opcional: solo se importa al consultar.
+
+Uso desde línea de comandos:
+    python scripts/espejo_columnar.py                 # sincroniza lo que haya cambiado
+    python scripts/espejo_columnar.py --completo      # reescribe todo el espejo
+    python scripts/espejo_columnar.py --consulta scripts/Queries/EDA1.sql
+"""
+import argparse
+import json
+import logging
+import os
+import re
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import bindparam, text
+
+DIRECTORIO_POR_DEFECTO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                      'data', 'espejo')
+TAMANO_BLOQUE_SIMBOLOS = 200
+
+logger = logging.getLogger('alphavantage.espejo_columnar')
+
+ESQUEMA_PRECIOS = pa.schema([
+    ('SymbolID', pa.int32()),
+    ('Date', pa.date32()),
+    ('Open', pa.float64()),
+    ('High', pa.float64()),
+    ('Low', pa.float64()),
+    ('Close', pa.float64()),
+    ('Volume', pa.int64()),
+    ('CreatedDate', pa.timestamp('us')),
+])
+
+# Huella por símbolo para detectar cambios sin leer los precios
+HUELLAS_SQL = text('''
+    SELECT SymbolID, COUNT(*) AS Filas, MAX(CreatedDate) AS UltimaEscritura
+    FROM AVdata.StockPrices
+    GROUP BY SymbolID
+''')
+
+HUELLAS_SIMBOLOS_SQL = text('''
+    SELECT SymbolID, COUNT(*) AS Filas, MAX(CreatedDate) AS UltimaEscritura
+    FROM AVdata.StockPrices
+    WHERE SymbolID IN :symbol_ids
+    GROUP BY SymbolID
+''').bindparams(bindparam('symbol_ids', expanding=True))
+
+PRECIOS_SQL = text('''
+    SELECT SymbolID, [Date], [Open], [High], [Low], [Close], [Volume], CreatedDate
+    FROM AVdata.StockPrices
+    WHERE SymbolID IN :symbol_ids
+    ORDER BY SymbolID, [Date]
+''').bindparams(bindparam('symbol_ids', expanding=True))
+
+# Tablas pequeñas que se copian enteras: (esquema, tabla, fichero)
+TABLAS_COMPLETAS = [
+    ('Metadata', 'Symbols', 'symbols.parquet'),
+    ('Metadata', 'DateDim', 'date_dim.parquet'),
+]
+
+
+def directorio_espejo():
+    return os.getenv('ESPEJO_DIR', DIRECTORIO_POR_DEFECTO)
+
+
+def espejo_activo():
+    """True si ESPEJO_COLUMNAR está activado: la ingesta mantiene el espejo al día."""
+    return os.getenv('ESPEJO_COLUMNAR', '').lower() in ('1', 'true', 'si', 'sí')
+
+
+def _ruta_manifiesto(directorio):
+    return os.path.join(directorio, 'manifiesto.json')
+
+
+def _leer_manifiesto(directorio):
+    ruta = _ruta_manifiesto(directorio)
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _guardar_manifiesto(directorio, manifiesto):
+    ruta = _ruta_manifiesto(directorio)
+    with open(f"{ruta}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, indent=2, sort_keys=True)
+    os.replace(f"{ruta}.tmp", ruta)
+
+
+def _escribir_parquet(tabla, ruta):
+    """Escritura atómica: las consultas en curso nunca ven un fichero a medias."""
+    pq.write_table(tabla, f"{ruta}.tmp", compression='zstd')
+    os.replace(f"{ruta}.tmp", ruta)
+
+
+def _tabla_precios(df):
+    df = df.copy()
+    df['Date'] = pd.to_datetime(df['Date']).dt.date
+    df['CreatedDate'] = pd.to_datetime(df['CreatedDate'])
+    df['Volume'] = df['Volume'].astype('Int64')
+    return pa.Table.from_pandas(df[ESQUEMA_PRECIOS.names], schema=ESQUEMA_PRECIOS, preserve_index=False)
+
+
+def _huella(filas, ultima_escritura):
+    return {'filas': int(filas), 'ultima_escritura': None if ultima_escritura is None else str(ultima_escritura)}
+
+
+def sincronizar_espejo(engine, symbol_ids=None, completo=False, directorio=None):
+    """
+    Actualiza el espejo Parquet con los datos de SQL Server.
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine
+        Engine conectado a AlphaVantageDB.
+    symbol_ids : list, opcional
+        Limitar la comprobación a estos símbolos (p. ej. el de una descarga de la webapp).
+    completo : bool, opcional
+        Reescribir todos los símbolos aunque no hayan cambiado.
+    directorio : str, opcional
+        Carpeta del espejo. Por defecto ESPEJO_DIR o data/espejo.
+
+    Retorna:
+    --------
+    dict
+        Resumen con simbolos_reescritos, simbolos_borrados y filas.
+    """
+    directorio = directorio or directorio_espejo()
+    carpeta_precios = os.path.join(directorio, 'stock_prices')
+    os.makedirs(carpeta_precios, exist_ok=True)
+    manifiesto = _leer_manifiesto(directorio)
+
+    with engine.connect() as conn:
+        # --- Tablas pequeñas: se copian enteras ---
+        for esquema, tabla, fichero in TABLAS_COMPLETAS:
+            try:
+                df = pd.read_sql(text(f"SELECT * FROM {esquema}.{tabla}"), conn)
+            except Exception as e:
+                logger.warning("No se pudo copiar %s.%s al espejo: %s", esquema, tabla, e)
+                continue
+            _escribir_parquet(pa.Table.from_pandas(df, preserve_index=False), os.path.join(directorio, fichero))
+
+        # --- Precios: solo los símbolos cuya huella ha cambiado ---
+        if symbol_ids is None:
+            huellas = conn.execute(HUELLAS_SQL).fetchall()
+        else:
+            huellas = conn.execute(HUELLAS_SIMBOLOS_SQL, {'symbol_ids': [int(s) for s in symbol_ids]}).fetchall()
+        actuales = {str(symbol_id): _huella(filas, escritura) for symbol_id, filas, escritura in huellas}
+        cambiados = [int(symbol_id) for symbol_id, huella in actuales.items()
+                     if completo or manifiesto.get(symbol_id) != huella]
+        # Sin lista de símbolos se revisan todos: los del manifiesto que ya no tienen filas se borran
+        revisados = set(manifiesto) if symbol_ids is None else {str(int(s)) for s in symbol_ids}
+        borrados = [symbol_id for symbol_id in manifiesto if symbol_id in revisados and symbol_id not in actuales]
+
+        resumen = {'simbolos_reescritos': 0, 'simbolos_borrados': len(borrados), 'filas': 0}
+        for i in range(0, len(cambiados), TAMANO_BLOQUE_SIMBOLOS):
+            bloque = cambiados[i:i + TAMANO_BLOQUE_SIMBOLOS]
+            precios = pd.read_sql(PRECIOS_SQL, conn, params={'symbol_ids': bloque})
+            for symbol_id, df in precios.groupby('SymbolID', sort=False):
+                _escribir_parquet(_tabla_precios(df), os.path.join(carpeta_precios, f"{int(symbol_id)}.parquet"))
+                resumen['simbolos_reescritos'] += 1
+                resumen['filas'] += len(df)
+            for symbol_id in bloque:
+                manifiesto[str(symbol_id)] = actuales[str(symbol_id)]
+
+    for symbol_id in borrados:
+        ruta = os.path.join(carpeta_precios, f"{symbol_id}.parquet")
+        if os.path.exists(ruta):
+            os.remove(ruta)
+        del manifiesto[symbol_id]
+    _guardar_manifiesto(directorio, manifiesto)
+
+    logger.info("Espejo columnar: %d símbolos reescritos (%d filas), %d eliminados",
+                resumen['simbolos_reescritos'], resumen['filas'], resumen['simbolos_borrados'])
+    return resumen
+
+
+def sincronizar_si_activo(engine, symbol_ids=None):
+    """Llama a sincronizar_espejo solo si ESPEJO_COLUMNAR está activado; los errores no detienen la ingesta."""
+    if not espejo_activo():
+        return None
+    try:
+        return sincronizar_espejo(engine, symbol_ids)
+    except Exception as e:
+        logger.warning("No se pudo sincronizar el espejo columnar: %s", e)
+        return None
+
+
+# --- Traducción T-SQL -> DuckDB ---------------------------------------------------
+
+# DATEPART(parte, fecha) -> función de DuckDB. DATEPART(weekday) depende de
+# @@DATEFIRST; se reproduce el valor por defecto (us_english: domingo = 1).
+_DATEPART = {
+    'weekday': '(dayofweek({}) + 1)', 'dw': '(dayofweek({}) + 1)',
+    'day': 'day({})', 'dd': 'day({})', 'd': 'day({})',
+    'month': 'month({})', 'mm': 'month({})', 'm': 'month({})',
+    'year': 'year({})', 'yyyy': 'year({})', 'yy': 'year({})',
+    'quarter': 'quarter({})', 'qq': 'quarter({})',
+    'dayofyear': 'dayofyear({})', 'dy': 'dayofyear({})',
+    'week': 'week({})', 'wk': 'week({})', 'ww': 'week({})',
+}
+
+
+# Sustituciones directas (patrón, reemplazo), en orden
+_EQUIVALENCIAS = [
+    (r"\bSTDEVP\s*\(", 'STDDEV_POP('),
+    (r"\bSTDEV\s*\(", 'STDDEV_SAMP('),
+    (r"\bVARP\s*\(", 'VAR_POP('),
+    (r"\bVAR\s*\(", 'VAR_SAMP('),
+    (r"\bAS\s+FLOAT\b", 'AS DOUBLE'),
+    (r"\bISNULL\s*\(", 'COALESCE('),
+    (r"\bGETDATE\s*\(\s*\)", 'now()'),
+    (r"\bDATEADD\s*\(\s*(day|dd|d)\s*,\s*([-+]?\d+)\s*,\s*([^()]+?)\s*\)", r"(\3 + INTERVAL (\2) DAY)"),
+    # PERCENTILE_CONT(p) WITHIN GROUP (ORDER BY x) -> quantile_cont(x, p); el OVER () se conserva
+    (r"\bPERCENTILE_CONT\s*\(\s*([\d.]+)\s*\)\s*WITHIN\s+GROUP\s*\(\s*ORDER\s+BY\s+((?:[^()]|\([^()]*\))+?)\s*\)",
+     r"quantile_cont(\2, \1)"),
+    (r"\bOUTER\s+APPLY\s*(\((?:[^()]|\((?:[^()]|\([^()]*\))*\))*\)\s*(?:AS\s+)?\w+)", r"LEFT JOIN LATERAL \1 ON TRUE"),
+    (r"\bCROSS\s+APPLY\b", 'CROSS JOIN LATERAL'),
+    # 'a' + b -> 'a' || b: en T-SQL + concatena cadenas
+    (r"'\s*\+", "' ||"),
+    (r"\+\s*'", "|| '"),
+]
+
+
+def _traducir_pivot(sql):
+    """En PIVOT (... FOR col IN ([a], [b])) los valores son literales en DuckDB, no identificadores."""
+    def literales(coincidencia):
+        valores = re.sub(r"\[([^\]]+)\]", r"'\1'", coincidencia.group(2))
+        return coincidencia.group(1) + valores + ')'
+    return re.sub(r"(\bPIVOT\s*\((?:[^()]|\([^()]*\))*?\bFOR\s+\w+\s+IN\s*\()([^)]*)\)", literales, sql,
+                  flags=re.IGNORECASE)
+
+
+def traducir_tsql(sql):
+    """
+    Adapta una consulta T-SQL de scripts/Queries al dialecto de DuckDB.
+
+    Cubre lo que usan esas consultas: identificadores entre corchetes, prefijo
+    de base de datos, STDEV/VAR, CAST AS FLOAT (en DuckDB FLOAT es de 4 bytes),
+    DATEPART, DATEADD, PERCENTILE_CONT, OUTER/CROSS APPLY, concatenación con +,
+    TOP n, valores de PIVOT y parámetros :nombre. No es un traductor general.
+    """
+    sql = _traducir_pivot(sql)
+    # [AlphaVantageDB].[Metadata].[Symbols] -> Metadata.Symbols
+    sql = re.sub(r"\[?AlphaVantageDB\]?\.", '', sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\[([^\]]+)\]", r'"\1"', sql)
+    for patron, reemplazo in _EQUIVALENCIAS:
+        sql = re.sub(patron, reemplazo, sql, flags=re.IGNORECASE)
+
+    def datepart(coincidencia):
+        plantilla = _DATEPART.get(coincidencia.group(1).lower())
+        return plantilla.format(coincidencia.group(2)) if plantilla else coincidencia.group(0)
+    sql = re.sub(r"\bDATEPART\s*\(\s*(\w+)\s*,\s*([^()]+?)\s*\)", datepart, sql, flags=re.IGNORECASE)
+
+    # SELECT TOP n ... -> SELECT ... LIMIT n (solo la primera aparición, la consulta principal)
+    top = re.search(r"\bSELECT\s+TOP\s*\(?\s*(\d+)\s*\)?", sql, flags=re.IGNORECASE)
+    if top:
+        sql = sql[:top.start()] + 'SELECT' + sql[top.end():]
+        sql = sql.rstrip().rstrip(';') + f"\nLIMIT {top.group(1)}"
+    # Parámetros :nombre -> $nombre (sin tocar los casts ::tipo)
+    sql = re.sub(r"(?<![:\w]):(\w+)", r"$\1", sql)
+    return sql
+
+
+# --- Conexión DuckDB -------------------------------------------------------------
+
+_TIPOS_DUCKDB = {'int32': 'INTEGER', 'date32[day]': 'DATE', 'double': 'DOUBLE', 'int64': 'BIGINT',
+                 'timestamp[us]': 'TIMESTAMP'}
+
+
+def _literal(ruta):
+    return "'" + ruta.replace("'", "''") + "'"
+
+
+def conectar_duckdb(directorio=None):
+    """
+    Abre una conexión DuckDB en memoria con las vistas del espejo.
+
+    Crea los esquemas AVdata y Metadata con las vistas StockPrices, Symbols y
+    DateDim sobre los ficheros Parquet, de modo que las consultas usan los
+    mismos nombres que en SQL Server.
+
+    Retorna:
+    --------
+    duckdb.DuckDBPyConnection
+    """
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("El motor analítico local necesita DuckDB: pip install duckdb") from e
+
+    directorio = directorio or directorio_espejo()
+    conexion = duckdb.connect()
+    conexion.execute("CREATE SCHEMA IF NOT EXISTS AVdata")
+    conexion.execute("CREATE SCHEMA IF NOT EXISTS Metadata")
+
+    carpeta_precios = os.path.join(directorio, 'stock_prices')
+    if os.path.isdir(carpeta_precios) and any(f.endswith('.parquet') for f in os.listdir(carpeta_precios)):
+        patron = _literal(os.path.join(carpeta_precios, '*.parquet'))
+        conexion.execute(f"CREATE VIEW AVdata.StockPrices AS SELECT * FROM read_parquet({patron})")
+    else:
+        columnas = ', '.join(f'"{campo.name}" {_TIPOS_DUCKDB[str(campo.type)]}' for campo in ESQUEMA_PRECIOS)
+        conexion.execute(f"CREATE TABLE AVdata.StockPrices ({columnas})")
+
+    for esquema, tabla, fichero in TABLAS_COMPLETAS:
+        ruta = os.path.join(directorio, fichero)
+        if os.path.exists(ruta):
+            conexion.execute(f"CREATE VIEW {esquema}.{tabla} AS SELECT * FROM read_parquet({_literal(ruta)})")
+    return conexion
+
+
+def ejecutar_consulta_duckdb(consulta, parametros=None, traducir=True, directorio=None):
+    """
+    Ejecuta una consulta sobre el espejo columnar y devuelve un DataFrame.
+
+    Parámetros:
+    -----------
+    consulta : str
+        Consulta SQL (T-SQL si traducir=True).
+    parametros : dict, opcional
+        Parámetros :nombre de la consulta.
+    traducir : bool, opcional
+        Pasar la consulta por traducir_tsql.
+    directorio : str, opcional
+        Carpeta del espejo.
+
+    Retorna:
+    --------
+    pandas.DataFrame
+
+    Ejemplo:
+    --------
+    >>> with open('scripts/Queries/EDA1.sql') as f:
+    ...     eda = ejecutar_consulta_duckdb(f.read())
+    """
+    conexion = conectar_duckdb(directorio)
+    try:
+        sql = traducir_tsql(consulta) if traducir else consulta
+        return conexion.execute(sql, parametros or {}).df()
+    finally:
+        conexion.close()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    try:
+        from .metricas import configurar_logging
+        from .sql_connection import cerrar_engine, obtener_engine
+    except ImportError:
+        from metricas import configurar_logging
+        from sql_connection import cerrar_engine, obtener_engine
+
+    parser = argparse.ArgumentParser(description="Espejo columnar local (Parquet + DuckDB)")
+    parser.add_argument('--completo', action='store_true', help="Reescribir todos los símbolos")
+    parser.add_argument('--consulta', help="Fichero .sql a ejecutar sobre el espejo (sin sincronizar)")
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', '.env'))
+    configurar_logging()
+    if args.consulta:
+        with open(args.consulta, encoding='utf-8') as f:
+            print(ejecutar_consulta_duckdb(f.read()))
+    else:
+        try:
+            sincronizar_espejo(obtener_engine(), completo=args.completo)
+        finally:
+            cerrar_engine()
@@ -0,0 +1,446 @@
+"""
+Módulo para exportar AVdata.StockPrices y AVdata.StockFeatures a Parquet particionado.
+
+La tabla se lee en streaming (sql_connection.ejecutar_consulta_por_lotes)
+ordenada por (SymbolID, Date), el orden de la clave agrupada, y cada bloque se
+reparte entre las particiones:
+
+    data/exportacion/<nombre>/symbol=<Symbol>/year=<YYYY>/part-<NNNNN>.parquet
+
+Como las filas llegan ordenadas, solo hay un fichero abierto a la vez y la
+memoria no depende del tamaño de la exportación (un bloque de
+CONSULTA_TAMANO_LOTE filas más el grupo de filas en escritura).
+
+En modo incremental se compara la huella de cada símbolo (filas y
+MAX(CreatedDate), como en espejo_columnar) con la de la exportación anterior y
+solo se reescriben los símbolos que han cambiado, desde el año de la primera
+fila escrita después de la exportación anterior: fusionar_precios actualiza
+barras ya exportadas y actualizar_caracteristicas reescribe desde el inicio del
+mes de la primera barra nueva, y en ambos casos CreatedDate cambia. Las
+particiones afectadas (symbol, year) se sustituyen enteras; si un símbolo tiene
+menos filas que antes, se reescribe completo.
+
+El manifiesto (_manifiesto.json en la carpeta de la tabla) lista los ficheros
+de cada partición con sus filas y fechas, de modo que los lectores pueden
+leer solo lo que necesitan o usar la carpeta directamente como dataset Hive:
+
+    pyarrow.dataset.dataset('data/exportacion/precios', partitioning='hive')
+
+Uso desde línea de comandos:
+    python scripts/exportacion.py                             # precios, incremental
+    python scripts/exportacion.py --tabla caracteristicas --completo
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import date, datetime
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import bindparam, text
+from sqlalchemy.types import DateTime
+
+try:
+    from .espejo_columnar import ESQUEMA_PRECIOS
+    from .metricas import configurar_logging, contar, cronometro
+    from .sql_connection import ejecutar_consulta_por_lotes
+except ImportError:
+    from espejo_columnar import ESQUEMA_PRECIOS
+    from metricas import configurar_logging, contar, cronometro
+    from sql_connection import ejecutar_consulta_por_lotes
+
+DIRECTORIO_POR_DEFECTO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                      'data', 'exportacion')
+# Límite de parámetros por consulta en SQL Server: 2100
+TAMANO_BLOQUE_SIMBOLOS = 1000
+
+logger = logging.getLogger('alphavantage.exportacion')
+
+ESQUEMA_CARACTERISTICAS = pa.schema([
+    ('SymbolID', pa.int32()),
+    ('Date', pa.date32()),
+    ('MonthlyAvg_Close', pa.float64()),
+    ('MonthlyStdDev_Close', pa.float64()),
+    ('MonthlyAvg_Volume', pa.float64()),
+    ('MonthlyStdDev_Volume', pa.float64()),
+    ('MA_20d_Close', pa.float64()),
+    ('MA_50d_Close', pa.float64()),
+    ('Volatility_20d_Close', pa.float64()),
+    ('PrevDay_Close', pa.float64()),
+    ('PctChange_Close_Daily', pa.float64()),
+    ('DailyRange', pa.float64()),
+    ('DayOfWeek', pa.int8()),
+    ('DayOfMonth', pa.int8()),
+    ('Month', pa.int8()),
+    ('CreatedDate', pa.timestamp('us')),
+])
+
+# nombre: (tabla de origen, esquema de los ficheros)
+TABLAS_EXPORTABLES = {
+    'precios': ('AVdata.StockPrices', ESQUEMA_PRECIOS),
+    'caracteristicas': ('AVdata.StockFeatures', ESQUEMA_CARACTERISTICAS),
+}
+
+# Huella por símbolo para detectar cambios sin leer la tabla
+HUELLAS_SQL = '''
+    SELECT SymbolID, COUNT(*) AS Filas, MAX(CreatedDate) AS UltimaEscritura
+    FROM {tabla}
+    GROUP BY SymbolID
+'''
+
+# Primera fecha escrita después de la exportación anterior, por símbolo
+PRIMER_CAMBIO_SQL = '''
+    SELECT SymbolID, MIN([Date]) AS PrimeraFecha
+    FROM {tabla}
+    WHERE SymbolID IN :symbol_ids AND CreatedDate > :escritura
+    GROUP BY SymbolID
+'''
+
+
+def directorio_exportacion():
+    return os.getenv('EXPORTACION_DIR', DIRECTORIO_POR_DEFECTO)
+
+
+def _consulta(tabla, esquema, con_desde):
+    columnas = ', '.join(f"t.[{nombre}]" for nombre in esquema.names)
+    filtro = 'AND t.[Date] >= :desde' if con_desde else ''
+    sentencia = text(f'''
+        SELECT s.Symbol, {columnas}
+        FROM {tabla} t
+        JOIN Metadata.Symbols s ON s.SymbolID = t.SymbolID
+        WHERE t.SymbolID IN :symbol_ids {filtro}
+        ORDER BY t.SymbolID, t.[Date]
+    ''')
+    return sentencia.bindparams(bindparam('symbol_ids', expanding=True))
+
+
+def _tabla_arrow(df, esquema):
+    """Convierte un bloque leído de SQL Server o SQLite a los tipos del esquema."""
+    df = df.copy()
+    for campo in esquema:
+        if pa.types.is_date(campo.type):
+            df[campo.name] = pd.to_datetime(df[campo.name]).dt.date
+        elif pa.types.is_timestamp(campo.type):
+            df[campo.name] = pd.to_datetime(df[campo.name])
+        elif pa.types.is_integer(campo.type):
+            df[campo.name] = df[campo.name].astype('Int64')
+        elif pa.types.is_floating(campo.type):
+            # DECIMAL llega como decimal.Decimal
+            df[campo.name] = df[campo.name].astype('float64')
+    return pa.Table.from_pandas(df[esquema.names], schema=esquema, preserve_index=False)
+
+
+def _ruta_manifiesto(carpeta):
+    return os.path.join(carpeta, '_manifiesto.json')
+
+
+def _leer_manifiesto(carpeta):
+    ruta = _ruta_manifiesto(carpeta)
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _guardar_manifiesto(carpeta, manifiesto):
+    ruta = _ruta_manifiesto(carpeta)
+    with open(f"{ruta}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, indent=2, sort_keys=True)
+    os.replace(f"{ruta}.tmp", ruta)
+
+
+def _manifiesto_vacio(nombre, tabla, esquema):
+    return {
+        'nombre': nombre,
+        'tabla': tabla,
+        'formato': 'parquet',
+        'compresion': 'zstd',
+        'particionado': ['symbol', 'year'],
+        'esquema': [{'nombre': campo.name, 'tipo': str(campo.type)} for campo in esquema],
+        'simbolos': {},
+        'particiones': {},
+        'exportaciones': [],
+    }
+
+
+def _huella(filas, ultima_escritura):
+    return {'filas': int(filas), 'ultima_escritura': None if ultima_escritura is None else str(ultima_escritura)}
+
+
+def _planificar(conn, tabla, manifiesto):
+    """
+    Decide qué símbolos hay que reescribir y desde qué fecha.
+
+    Retorna:
+    --------
+    tuple
+        (plan, huellas): plan es {SymbolID: date del 1 de enero desde el que
+        reescribir, o None para el símbolo entero}; huellas, la huella actual
+        de cada símbolo con filas.
+    """
+    huellas = {int(symbol_id): _huella(filas, escritura)
+               for symbol_id, filas, escritura in conn.execute(text(HUELLAS_SQL.format(tabla=tabla)))}
+    plan, crecidos = {}, {}
+    for symbol_id, huella in huellas.items():
+        previa = manifiesto['simbolos'].get(str(symbol_id), {})
+        if {clave: previa.get(clave) for clave in huella} == huella:
+            continue
+        if previa.get('ultima_escritura') is None or huella['filas'] < previa.get('filas', 0):
+            plan[symbol_id] = None
+        else:
+            crecidos[symbol_id] = previa['ultima_escritura']
+
+    # Un umbral común (la escritura previa más antigua) permite una consulta por
+    # bloque; a lo sumo se reescribe algún año de más
+    symbol_ids = list(crecidos)
+    for i in range(0, len(symbol_ids), TAMANO_BLOQUE_SIMBOLOS):
+        bloque = symbol_ids[i:i + TAMANO_BLOQUE_SIMBOLOS]
+        umbral = min(pd.Timestamp(crecidos[symbol_id]) for symbol_id in bloque).to_pydatetime()
+        sentencia = text(PRIMER_CAMBIO_SQL.format(tabla=tabla)).bindparams(
+            bindparam('symbol_ids', expanding=True), bindparam('escritura', type_=DateTime()))
+        for symbol_id, primera in conn.execute(sentencia, {'symbol_ids': bloque, 'escritura': umbral}):
+            plan[int(symbol_id)] = date(pd.Timestamp(primera).year, 1, 1)
+    # Cambió la huella sin filas nuevas (p. ej. borrados): símbolo entero
+    for symbol_id in symbol_ids:
+        plan.setdefault(symbol_id, None)
+    return plan, huellas
+
+
+def _retirar_particiones(manifiesto, symbol_id, desde=None):
+    """
+    Quita del manifiesto las particiones del símbolo desde el año de desde
+    (todas si es None) y devuelve sus ficheros, que se borran al publicar.
+    """
+    symbol = manifiesto['simbolos'].get(str(symbol_id), {}).get('symbol')
+    if symbol is None:
+        return []
+    prefijo = f"symbol={quote(str(symbol), safe='')}/year="
+    obsoletos = []
+    for particion in [p for p in manifiesto['particiones'] if p.startswith(prefijo)]:
+        if desde is None or int(particion[len(prefijo):]) >= desde.year:
+            obsoletos += [os.path.join(particion, fichero)
+                          for fichero in manifiesto['particiones'].pop(particion)['ficheros']]
+    return obsoletos
+
+
+def _eliminar_huerfanos(carpeta, manifiesto):
+    """Borra los ficheros de una exportación interrumpida (no registrados en el manifiesto)."""
+    registrados = {os.path.normpath(os.path.join(particion, fichero))
+                   for particion, datos in manifiesto['particiones'].items() for fichero in datos['ficheros']}
+    for raiz, _, ficheros in os.walk(carpeta):
+        for fichero in ficheros:
+            ruta = os.path.join(raiz, fichero)
+            relativa = os.path.normpath(os.path.relpath(ruta, carpeta))
+            if fichero.endswith(('.parquet', '.tmp')) and relativa not in registrados:
+                os.remove(ruta)
+
+
+class _EscritorParticiones:
+    """
+    Escribe bloques ordenados por (SymbolID, Date) en ficheros por símbolo y año.
+
+    Mantiene abierto solo el fichero de la partición actual y lo cierra al
+    cambiar de partición. Cada fichero se escribe con un nombre oculto
+    (.part-NNNNN.parquet.tmp, que los lectores de datasets ignoran) y todos se
+    renombran juntos en publicar(), al terminar la exportación, para que los
+    lectores no vean a la vez una partición antigua y su sustituta.
+    """
+
+    def __init__(self, carpeta, esquema, nombre_fichero, manifiesto):
+        self.carpeta = carpeta
+        self.esquema = esquema
+        self.nombre_fichero = nombre_fichero
+        self.manifiesto = manifiesto
+        self.actual = None
+        self.escritor = None
+        self.ruta = None
+        self.temporal = None
+        self.estado = None
+        self.filas = 0
+        self.ficheros = 0
+        self.pendientes = []
+
+    def escribir(self, bloque):
+        # Un solo paso de conversión por bloque; las particiones son tramos
+        # contiguos porque las filas llegan ordenadas por (SymbolID, Date)
+        fechas = pd.to_datetime(bloque['Date'])
+        tabla = _tabla_arrow(bloque.assign(Date=fechas), self.esquema)
+        claves = bloque['SymbolID'].to_numpy() * 10000 + fechas.dt.year.to_numpy()
+        cortes = np.flatnonzero(np.diff(claves)) + 1
+        for desde, hasta in zip(np.r_[0, cortes], np.r_[cortes, len(claves)]):
+            symbol = bloque['Symbol'].iat[desde]
+            particion = f"symbol={quote(str(symbol), safe='')}/year={fechas.iat[desde].year}"
+            if particion != self.actual:
+                self._abrir(particion, symbol, bloque['SymbolID'].iat[desde])
+            self.escritor.write_table(tabla.slice(desde, hasta - desde))
+            self.estado['filas'] += int(hasta - desde)
+            self.estado['hasta'] = fechas.iat[hasta - 1].strftime('%Y-%m-%d')
+            if self.estado['desde'] is None:
+                self.estado['desde'] = fechas.iat[desde].strftime('%Y-%m-%d')
+            self.filas += int(hasta - desde)
+
+    def _abrir(self, particion, symbol, symbol_id):
+        self.cerrar()
+        os.makedirs(os.path.join(self.carpeta, particion), exist_ok=True)
+        self.actual = particion
+        self.ruta = os.path.join(self.carpeta, particion, self.nombre_fichero)
+        self.temporal = os.path.join(self.carpeta, particion, f".{self.nombre_fichero}.tmp")
+        self.escritor = pq.ParquetWriter(self.temporal, self.esquema, compression='zstd')
+        self.estado = {'symbol': str(symbol), 'symbol_id': int(symbol_id), 'filas': 0, 'desde': None, 'hasta': None}
+
+    def cerrar(self):
+        if self.escritor is None:
+            return
+        self.escritor.close()
+        self.pendientes.append((self.temporal, self.ruta))
+        datos = self.manifiesto['particiones'].setdefault(self.actual, {'ficheros': [], 'filas': 0,
+                                                                         'desde': self.estado['desde']})
+        datos['ficheros'].append(self.nombre_fichero)
+        datos['filas'] += self.estado['filas']
+        datos['hasta'] = self.estado['hasta']
+        self.manifiesto['simbolos'].setdefault(str(self.estado['symbol_id']), {})['symbol'] = self.estado['symbol']
+        self.ficheros += 1
+        self.escritor = None
+        self.actual = None
+
+    def publicar(self, obsoletos=()):
+        """Renombra los ficheros escritos y borra los que sustituyen (rutas relativas a la carpeta)."""
+        for temporal, ruta in self.pendientes:
+            os.replace(temporal, ruta)
+        self.pendientes = []
+        for relativa in obsoletos:
+            ruta = os.path.join(self.carpeta, relativa)
+            if os.path.exists(ruta):
+                os.remove(ruta)
+            try:
+                os.removedirs(os.path.dirname(ruta))
+            except OSError:
+                pass  # La carpeta aún tiene ficheros
+
+
+def exportar_tabla(engine, nombre='precios', completo=False, directorio=None, tamano_lote=None):
+    """
+    Exporta una tabla a Parquet particionado por símbolo y año.
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine
+        Engine conectado a AlphaVantageDB.
+    nombre : str, opcional
+        'precios' (AVdata.StockPrices) o 'caracteristicas' (AVdata.StockFeatures).
+    completo : bool, opcional
+        Reescribir la exportación entera. Por defecto solo se reescriben las
+        particiones de los símbolos cuya huella ha cambiado (o todo, si no hay
+        exportación previa).
+    directorio : str, opcional
+        Raíz de las exportaciones. Por defecto EXPORTACION_DIR o data/exportacion.
+    tamano_lote : int, opcional
+        Filas por bloque leído. Por defecto CONSULTA_TAMANO_LOTE.
+
+    Retorna:
+    --------
+    dict
+        Resumen con modo, filas, ficheros, simbolos, simbolos_reescritos y segundos.
+
+    Ejemplo:
+    --------
+    >>> exportar_tabla(obtener_engine(), 'precios')
+    """
+    if nombre not in TABLAS_EXPORTABLES:
+        raise ValueError(f"Tabla no exportable: {nombre} (válidas: {', '.join(TABLAS_EXPORTABLES)})")
+    tabla, esquema = TABLAS_EXPORTABLES[nombre]
+    carpeta = os.path.join(directorio or directorio_exportacion(), nombre)
+    manifiesto = None if completo else _leer_manifiesto(carpeta)
+    modo = 'incremental' if manifiesto else 'completo'
+    # La exportación completa se escribe aparte y sustituye a la anterior al terminar
+    destino = carpeta if manifiesto else f"{carpeta}.tmp"
+    if manifiesto:
+        _eliminar_huerfanos(carpeta, manifiesto)
+    else:
+        shutil.rmtree(destino, ignore_errors=True)
+        manifiesto = _manifiesto_vacio(nombre, tabla, esquema)
+    os.makedirs(destino, exist_ok=True)
+
+    numero = len(manifiesto['exportaciones']) + 1
+    escritor = _EscritorParticiones(destino, esquema, f"part-{numero:05d}.parquet", manifiesto)
+    inicio = time.perf_counter()
+
+    # Las huellas se leen antes que las filas: lo escrito entre medias se
+    # detecta en la siguiente exportación
+    with engine.connect() as conn:
+        plan, huellas = _planificar(conn, tabla, manifiesto)
+    desaparecidos = [int(symbol_id) for symbol_id in manifiesto['simbolos'] if int(symbol_id) not in huellas]
+    obsoletos = []
+    for symbol_id in desaparecidos:
+        obsoletos += _retirar_particiones(manifiesto, symbol_id)
+        del manifiesto['simbolos'][str(symbol_id)]
+    # Símbolos agrupados por la fecha desde la que se reescriben: una consulta por grupo
+    grupos = {}
+    for symbol_id, desde in plan.items():
+        obsoletos += _retirar_particiones(manifiesto, symbol_id, desde)
+        grupos.setdefault(desde, []).append(symbol_id)
+
+    with cronometro('exportacion_segundos', {'modo': modo}, tabla=nombre) as detalle:
+        for desde, symbol_ids in grupos.items():
+            for i in range(0, len(symbol_ids), TAMANO_BLOQUE_SIMBOLOS):
+                parametros = {'symbol_ids': symbol_ids[i:i + TAMANO_BLOQUE_SIMBOLOS]}
+                if desde is not None:
+                    parametros['desde'] = desde
+                sentencia = _consulta(tabla, esquema, desde is not None)
+                try:
+                    for bloque in ejecutar_consulta_por_lotes(engine, sentencia, parametros, tamano_lote):
+                        escritor.escribir(bloque)
+                finally:
+                    escritor.cerrar()
+        detalle['filas'] = escritor.filas
+    escritor.publicar(obsoletos)
+
+    for symbol_id in plan:
+        simbolo = manifiesto['simbolos'].setdefault(str(symbol_id), {})
+        simbolo.update(huellas[symbol_id])
+        prefijo = f"symbol={quote(str(simbolo.get('symbol')), safe='')}/year="
+        simbolo['ultima_fecha'] = max((datos['hasta'] for particion, datos in manifiesto['particiones'].items()
+                                       if particion.startswith(prefijo)), default=None)
+
+    resumen = {'modo': modo, 'filas': escritor.filas, 'ficheros': escritor.ficheros,
+               'simbolos': len(manifiesto['simbolos']), 'simbolos_reescritos': len(plan),
+               'segundos': round(time.perf_counter() - inicio, 3)}
+    manifiesto['exportaciones'].append({'numero': numero, 'fecha': datetime.now().isoformat(timespec='seconds'),
+                                        **resumen})
+    _guardar_manifiesto(destino, manifiesto)
+    if destino != carpeta:
+        shutil.rmtree(carpeta, ignore_errors=True)
+        os.replace(destino, carpeta)
+    contar('exportacion_filas', escritor.filas, tabla=nombre)
+
+    logger.info("Exportación %s de %s: %d filas en %d ficheros (%.1f s) -> %s", modo, tabla, resumen['filas'],
+                resumen['ficheros'], resumen['segundos'], carpeta)
+    return resumen
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    try:
+        from .sql_connection import cerrar_engine, obtener_engine
+    except ImportError:
+        from sql_connection import cerrar_engine, obtener_engine
+
+    parser = argparse.ArgumentParser(description="Exportación de tablas a Parquet particionado por símbolo y año")
+    parser.add_argument('--tabla', default='precios', choices=list(TABLAS_EXPORTABLES))
+    parser.add_argument('--completo', action='store_true', help="Reescribir la exportación entera")
+    parser.add_argument('--directorio', help="Raíz de las exportaciones (por defecto data/exportacion)")
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', '.env'))
+    configurar_logging()
+    try:
+        exportar_tabla(obtener_engine(), args.tabla, args.completo, args.directorio)
+    finally:
+        cerrar_engine()
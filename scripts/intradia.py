@@ -0,0 +1,313 @@
+"""
+Módulo para la descarga y el almacenamiento de barras intradía (1m, 5m, 1h...).
+
+AVdata.StockPrices guarda una barra diaria por fecha, así que las barras
+intradía (de 100 a 400 veces más filas) van a ficheros Parquet particionados:
+
+    data/intradia/<intervalo>/<symbol>/<YYYY-MM>.parquet
+
+con tipos compactos: ts int64 (segundos desde epoch, UTC), precios float32 y
+volumen int64. Cada fichero está ordenado por ts y sin duplicados.
+
+Yahoo Finance limita el tramo de cada petición y la antigüedad de los datos
+según el intervalo (VENTANAS_INTRADIA). descargar_intradia divide el periodo
+pedido en ventanas permitidas, las descarga en paralelo con
+descargador.descargar_y_cargar (mismo limitador de tasa y reintentos) y cada
+ventana se fusiona con el mes ya guardado, eliminando las barras repetidas.
+
+Uso desde línea de comandos:
+    python scripts/intradia.py --simbolos AAPL MSFT --intervalo 5m
+    python scripts/intradia.py --intervalo 1m --desde 2024-06-01 --hasta 2024-06-20
+"""
+import argparse
+import logging
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    from .descargador import descargar_y_cargar
+    from .metricas import configurar_logging, contar, cronometro
+    from .yahoo_finance import descargar_datos_yahoo
+except ImportError:
+    from descargador import descargar_y_cargar
+    from metricas import configurar_logging, contar, cronometro
+    from yahoo_finance import descargar_datos_yahoo
+
+DIRECTORIO_POR_DEFECTO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                      'data', 'intradia')
+
+logger = logging.getLogger('alphavantage.intradia')
+
+# intervalo: (días por petición, antigüedad máxima en días) según los límites de Yahoo Finance
+VENTANAS_INTRADIA = {
+    '1m': (7, 30),
+    '2m': (60, 60),
+    '5m': (60, 60),
+    '15m': (60, 60),
+    '30m': (60, 60),
+    '90m': (60, 60),
+    '60m': (730, 730),
+    '1h': (730, 730),
+}
+
+ESQUEMA_INTRADIA = pa.schema([
+    ('ts', pa.int64()),
+    ('open', pa.float32()),
+    ('high', pa.float32()),
+    ('low', pa.float32()),
+    ('close', pa.float32()),
+    ('volume', pa.int64()),
+])
+
+
+def directorio_intradia():
+    return os.getenv('INTRADIA_DIR', DIRECTORIO_POR_DEFECTO)
+
+
+def calcular_ventanas(intervalo, inicio=None, fin=None, ahora=None):
+    """
+    Divide [inicio, fin) en tramos que Yahoo Finance acepta para el intervalo.
+
+    El inicio se recorta a la antigüedad máxima permitida (los datos anteriores
+    ya no están disponibles).
+
+    Parámetros:
+    -----------
+    intervalo : str
+        Intervalo intradía (una clave de VENTANAS_INTRADIA).
+    inicio : str, opcional
+        Fecha 'YYYY-MM-DD'. Por defecto, lo más antiguo disponible.
+    fin : str, opcional
+        Fecha 'YYYY-MM-DD' exclusiva. Por defecto mañana (incluye hoy).
+    ahora : datetime, opcional
+        Momento de referencia para la antigüedad máxima.
+
+    Retorna:
+    --------
+    list
+        Lista de tuplas (inicio, fin) en formato 'YYYY-MM-DD'.
+    """
+    if intervalo not in VENTANAS_INTRADIA:
+        raise ValueError(f"Intervalo intradía no soportado: {intervalo} (válidos: {', '.join(VENTANAS_INTRADIA)})")
+    dias_ventana, antiguedad = VENTANAS_INTRADIA[intervalo]
+    hoy = (ahora or datetime.now()).date()
+    # Un día de margen: el límite del proveedor se cuenta desde el momento de la petición
+    minimo = hoy - timedelta(days=antiguedad - 1)
+    desde = max(datetime.strptime(inicio, '%Y-%m-%d').date(), minimo) if inicio else minimo
+    hasta = datetime.strptime(fin, '%Y-%m-%d').date() if fin else hoy + timedelta(days=1)
+    if inicio and desde > datetime.strptime(inicio, '%Y-%m-%d').date():
+        logger.warning("Con intervalo %s solo hay datos desde %s; se recorta el inicio.", intervalo, desde)
+
+    ventanas = []
+    while desde < hasta:
+        siguiente = min(desde + timedelta(days=dias_ventana), hasta)
+        ventanas.append((desde.strftime('%Y-%m-%d'), siguiente.strftime('%Y-%m-%d')))
+        desde = siguiente
+    return ventanas
+
+
+def preparar_barras(df):
+    """
+    Convierte el DataFrame del proveedor al formato compacto de almacenamiento.
+
+    Acepta la columna de tiempo Datetime (intradía en yfinance) o Date, con o
+    sin zona horaria (sin zona se interpreta como UTC). Elimina las barras
+    repetidas conservando la última y ordena por ts.
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        Columnas ts (int64, segundos UTC), open, high, low, close (float32) y volume (int64).
+    """
+    columna = 'Datetime' if 'Datetime' in df.columns else 'Date'
+    momentos = pd.to_datetime(df[columna], utc=True)
+    barras = pd.DataFrame({
+        'ts': momentos.dt.as_unit('s').astype('int64').to_numpy(),
+        'open': df['Open'].to_numpy(dtype=np.float32),
+        'high': df['High'].to_numpy(dtype=np.float32),
+        'low': df['Low'].to_numpy(dtype=np.float32),
+        'close': df['Close'].to_numpy(dtype=np.float32),
+        'volume': df['Volume'].fillna(0).to_numpy(dtype=np.int64),
+    })
+    return barras.drop_duplicates('ts', keep='last').sort_values('ts', ignore_index=True)
+
+
+def _ruta_mes(directorio, intervalo, symbol, mes):
+    return os.path.join(directorio, intervalo, symbol, f"{mes}.parquet")
+
+
+def guardar_barras(symbol, intervalo, df, directorio=None):
+    """
+    Fusiona barras intradía con las ya guardadas del mismo mes.
+
+    Parámetros:
+    -----------
+    symbol : str
+        Símbolo bursátil.
+    intervalo : str
+        Intervalo de las barras.
+    df : pandas.DataFrame
+        DataFrame del proveedor o ya preparado con preparar_barras.
+    directorio : str, opcional
+        Raíz del almacén. Por defecto INTRADIA_DIR o data/intradia.
+
+    Retorna:
+    --------
+    int
+        Barras nuevas añadidas (sin contar las que ya estaban).
+    """
+    directorio = directorio or directorio_intradia()
+    barras = df if 'ts' in df.columns else preparar_barras(df)
+    if barras.empty:
+        return 0
+    meses = pd.to_datetime(barras['ts'], unit='s').dt.strftime('%Y-%m')
+    nuevas = 0
+    for mes, bloque in barras.groupby(meses.to_numpy(), sort=False):
+        ruta = _ruta_mes(directorio, intervalo, symbol, mes)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        previas = 0
+        if os.path.exists(ruta):
+            existentes = pq.read_table(ruta).to_pandas()
+            previas = len(existentes)
+            bloque = pd.concat([existentes, bloque], ignore_index=True)
+            bloque = bloque.drop_duplicates('ts', keep='last').sort_values('ts', ignore_index=True)
+        tabla = pa.Table.from_pandas(bloque, schema=ESQUEMA_INTRADIA, preserve_index=False)
+        # Escritura atómica: los lectores nunca ven un fichero a medias
+        pq.write_table(tabla, f"{ruta}.tmp", compression='zstd')
+        os.replace(f"{ruta}.tmp", ruta)
+        nuevas += len(bloque) - previas
+    contar('intradia_filas', nuevas, intervalo=intervalo)
+    return nuevas
+
+
+def descargar_intradia(simbolos, intervalo='5m', inicio=None, fin=None, proveedor=descargar_datos_yahoo,
+                       directorio=None, **opciones_descarga):
+    """
+    Descarga barras intradía de varios símbolos por ventanas y las guarda en Parquet.
+
+    Cada (símbolo, ventana) es una tarea de descargador.descargar_y_cargar, de
+    modo que las ventanas se piden en paralelo con el límite de tasa común y el
+    único hilo escritor fusiona cada resultado con su mes.
+
+    Parámetros:
+    -----------
+    simbolos : list
+        Lista de símbolos bursátiles.
+    intervalo : str, opcional
+        Intervalo intradía ('1m', '5m', '1h'...). Por defecto '5m'.
+    inicio, fin : str, opcional
+        Periodo 'YYYY-MM-DD' (fin exclusivo). Ver calcular_ventanas.
+    proveedor : callable, opcional
+        Función con la firma de descargar_datos_yahoo.
+    directorio : str, opcional
+        Raíz del almacén.
+    **opciones_descarga :
+        Opciones de descargar_y_cargar (max_hilos, peticiones_por_segundo...).
+
+    Retorna:
+    --------
+    dict
+        Resumen con ventanas, barras_nuevas y errores.
+
+    Ejemplo:
+    --------
+    >>> descargar_intradia(['AAPL', 'MSFT'], '1m')
+    """
+    ventanas = calcular_ventanas(intervalo, inicio, fin)
+    tareas = [{'SymbolID': None, 'Symbol': symbol, 'inicio': desde, 'fin': hasta}
+              for symbol in simbolos for desde, hasta in ventanas]
+    resumen = {'ventanas': len(tareas), 'barras_nuevas': 0, 'errores': []}
+
+    def guardar(tarea, df):
+        with cronometro('intradia_guardado_segundos', {'symbol': tarea['Symbol']}, intervalo=intervalo) as detalle:
+            detalle['filas'] = guardar_barras(tarea['Symbol'], intervalo, df, directorio)
+        resumen['barras_nuevas'] += detalle['filas']
+
+    resultado = descargar_y_cargar(tareas, guardar, proveedor=proveedor, intervalo=intervalo, **opciones_descarga)
+    resumen['errores'] = resultado['errores']
+    logger.info("Intradía %s: %d símbolos en %d ventanas, %d barras nuevas", intervalo, len(simbolos),
+                resumen['ventanas'], resumen['barras_nuevas'])
+    return resumen
+
+
+def _momento_utc(valor):
+    if valor is None:
+        return None
+    momento = pd.Timestamp(valor)
+    return momento.tz_localize('UTC') if momento.tz is None else momento.tz_convert('UTC')
+
+
+def leer_intradia(symbol, intervalo, desde=None, hasta=None, directorio=None):
+    """
+    Lee las barras intradía de un símbolo entre dos momentos.
+
+    Solo abre los ficheros de los meses del rango.
+
+    Parámetros:
+    -----------
+    symbol : str
+        Símbolo bursátil.
+    intervalo : str
+        Intervalo de las barras.
+    desde, hasta : str o datetime, opcional
+        Límites incluidos; sin zona horaria se interpretan como UTC.
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        Columnas ts, open, high, low, close y volume ordenadas por ts.
+    """
+    carpeta = os.path.join(directorio or directorio_intradia(), intervalo, symbol)
+    if not os.path.isdir(carpeta):
+        return ESQUEMA_INTRADIA.empty_table().to_pandas()
+    inicio = _momento_utc(desde)
+    final = _momento_utc(hasta)
+    ficheros = sorted(f for f in os.listdir(carpeta) if f.endswith('.parquet'))
+    # Los ficheros se llaman YYYY-MM.parquet: se descartan los meses fuera del rango sin abrirlos
+    if inicio is not None:
+        ficheros = [f for f in ficheros if f[:7] >= inicio.strftime('%Y-%m')]
+    if final is not None:
+        ficheros = [f for f in ficheros if f[:7] <= final.strftime('%Y-%m')]
+    if not ficheros:
+        return ESQUEMA_INTRADIA.empty_table().to_pandas()
+
+    filtros = []
+    if inicio is not None:
+        filtros.append(('ts', '>=', int(inicio.timestamp())))
+    if final is not None:
+        filtros.append(('ts', '<=', int(final.timestamp())))
+    tabla = pq.read_table([os.path.join(carpeta, f) for f in ficheros], schema=ESQUEMA_INTRADIA,
+                          filters=filtros or None)
+    return tabla.to_pandas()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    try:
+        from .sql_connection import cerrar_engine, ejecutar_consulta, obtener_engine
+    except ImportError:
+        from sql_connection import cerrar_engine, ejecutar_consulta, obtener_engine
+
+    parser = argparse.ArgumentParser(description="Descarga de barras intradía a Parquet")
+    parser.add_argument('--simbolos', nargs='*', help="Símbolos (por defecto los activos de Metadata.Symbols)")
+    parser.add_argument('--intervalo', default='5m', choices=list(VENTANAS_INTRADIA))
+    parser.add_argument('--desde', help="Fecha de inicio (YYYY-MM-DD)")
+    parser.add_argument('--hasta', help="Fecha de fin exclusiva (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', '.env'))
+    configurar_logging()
+    simbolos = args.simbolos
+    if not simbolos:
+        try:
+            simbolos = ejecutar_consulta(obtener_engine(),
+                                         "SELECT Symbol FROM Metadata.Symbols WHERE IsActive = 1")['Symbol'].tolist()
+        finally:
+            cerrar_engine()
+    descargar_intradia(simbolos, args.intervalo, args.desde, args.hasta)
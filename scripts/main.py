@@ -7,17 +7,24 @@ Este script proporciona dos funcionalidades principales:
 
 """
 
+import argparse
+import logging
 import os
 import pandas as pd
-import pyodbc
-import time
-from datetime import datetime
 from dotenv import load_dotenv
-from sqlalchemy import text
 
 # Importar funciones de los módulos creados
-from sql_connection import conectar_sql_server, ejecutar_consulta
-from yahoo_finance import descargar_datos_yahoo, guardar_datos
+from sql_connection import cerrar_engine, conectar_sql_server, ejecutar_consulta
+from carga_masiva import fusionar_precios
+from actualizacion_incremental import actualizar_incremental, rellenar_huecos
+from descargador import descargar_y_cargar
+from registro_simbolos import obtener_registro
+from cache_precios import descargar_datos_cache
+from almacen_caracteristicas import actualizar_caracteristicas, reconstruir_caracteristicas
+from metricas import configurar_logging, obtener_metricas, perfilar
+from espejo_columnar import sincronizar_si_activo
+
+logger = logging.getLogger('alphavantage.main')
 
 def guardar_datos_en_sql(engine, df, tabla, schema=None, if_exists='replace'):
     """
@@ -52,10 +59,10 @@ def guardar_datos_en_sql(engine, df, tabla, schema=None, if_exists='replace'):
             if_exists=if_exists,
             index=False
         )
-        print(f"Datos guardados exitosamente en la tabla '{tabla}'")
+        logger.info("Datos guardados exitosamente en la tabla '%s'", tabla)
         return True
     except Exception as e:
-        print(f"Error al guardar datos en SQL Server: {str(e)}")
+        logger.error("Error al guardar datos en SQL Server: %s", e)
         return False
 
 def ejemplo_uso():
@@ -77,69 +84,87 @@ def ejemplo_uso():
 
     # Verificar si symbols_df es un DataFrame
     if not isinstance(symbols_df, pd.DataFrame):
-        print("Error: La consulta no devolvió un DataFrame.")
+        logger.error("La consulta no devolvió un DataFrame.")
         exit()
 
     # Extraer los valores de las columnas SymbolID y Symbol como una lista de diccionarios
     symbols_lista = symbols_df[['SymbolID', 'Symbol']].to_dict(orient='records')
 
     if not symbols_lista:
-        print("No se encontraron símbolos para procesar.")
+        logger.warning("No se encontraron símbolos para procesar.")
         exit()
 
 
-    # SQL para insertar históricos (ajusta al nombre exacto de tu tabla destino)
-    insert_sql = '''
-        INSERT INTO [AVData].[StockPrices] 
-        ([SymbolId], [Date], [Open], [High], [Low], [Close], [Volume], [CreatedDate])
-        VALUES (:symbol_id, :date, :open, :high, :low, :close, :volume, GETDATE())
-    '''
+    tareas = [
+        {**symbol_data, 'inicio': '2010-01-01', 'fin': '2024-12-31'}
+        for symbol_data in symbols_lista
+    ]
+    # Validación de símbolos en bloque y solo para los caducados (sin ticker.info por descarga)
+    tareas = obtener_registro().filtrar_validos(tareas)
+
+    def guardar(tarea, df_historico):
+        # Upsert por lotes (staging + MERGE, una transacción por símbolo): volver a
+        # ejecutar la carga no duplica barras y solo reescribe las que han cambiado
+        fusionar_precios(conexion, df_historico, tarea['SymbolID'])
+        logger.info("Histórico de %s insertado correctamente.", tarea['Symbol'])
+
+    # Descargas en paralelo limitadas por tasa (DESCARGA_PETICIONES_POR_SEGUNDO) en lugar
+    # de una pausa fija entre símbolos; las inserciones se solapan con las descargas.
+    # La caché local evita volver a pedir a Yahoo Finance los rangos ya descargados.
+    descargar_y_cargar(tareas, guardar, proveedor=descargar_datos_cache)
+    # Con ESPEJO_COLUMNAR=1 el espejo Parquet de análisis se pone al día
+    sincronizar_si_activo(conexion, [tarea['SymbolID'] for tarea in tareas])
+
+def actualizacion_incremental():
+    """Descarga para cada símbolo activo solo los días posteriores al último almacenado."""
+    conexion = conectar_sql_server()
+    actualizar_incremental(conexion, proveedor=descargar_datos_cache, registro=obtener_registro())
+    # Las características materializadas solo se calculan para las barras nuevas
+    actualizar_caracteristicas(conexion)
+    sincronizar_si_activo(conexion)
 
-    for symbol_data in symbols_lista:
-        try:
-            symbol_id = symbol_data['SymbolID']
-            symbol = symbol_data['Symbol']
-            print(f"Procesando SymbolID: {symbol_id}, Symbol: {symbol}")
-            # Descargar datos históricos de Yahoo Finance
-            df_historico = descargar_datos_yahoo(symbol, periodo_inicio='2010-01-01', periodo_fin='2024-12-31')
-
-            with conexion.connect() as conn:
-            # Insertar cada fila en SQL Server
-                for index, row in df_historico.iterrows():
-                    params = {
-                        "symbol_id": symbol_id,
-                        "date": row['Date'],
-                        "open": row['Open'],
-                        "high": row['High'],    
-                        "low": row['Low'],
-                        "close": row['Close'],
-                        "volume": row['Volume']
-                    }
-                    conn.execute(text(insert_sql),params)
-                
-                # Guardar el DataFrame en SQL Server
-                conn.commit()
-                print(f"Histórico de {symbol} insertado correctamente.")
-
-                time.sleep(12)  # 12 segundos entre cada símbolo garantiza cumplir límites
-
-        except Exception as e:
-            print(f"Error con {symbol}: {e}")
-            continue
-
-    conexion.dispose()
-    # Cerrar la conexión
+def recuperar_huecos():
+    """Vuelve a pedir solo los tramos con sesiones sin barra (según Metadata.DateDim)."""
+    conexion = conectar_sql_server()
+    # Sin caché local: devolvería el mismo tramo incompleto
+    resumen = rellenar_huecos(conexion, registro=obtener_registro())
+    # Las barras intermedias cambian las ventanas ya materializadas de esos símbolos
+    if resumen['symbol_ids']:
+        reconstruir_caracteristicas(conexion, resumen['symbol_ids'])
+        sincronizar_si_activo(conexion, resumen['symbol_ids'])
 
 if __name__ == "__main__":
-    
+
+    parser = argparse.ArgumentParser(description="Carga de históricos de Yahoo Finance en SQL Server")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Descargar solo los días posteriores al último almacenado de cada símbolo activo")
+    parser.add_argument('--huecos', action='store_true',
+                        help="Descargar solo las sesiones sin barra desde la primera almacenada de cada símbolo hasta ayer")
+    args = parser.parse_args()
+
     #Cargamos configuración 
     env_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', '.env')
-    if not os.path.exists(env_file):
-        # Advertir al usuario si no se encuentra el archivo
-        print(f"Advertencia: No se encontró el archivo .env en {env_file}.")
 
     # Cargar las variables del archivo .env
     load_dotenv(env_file)
 
-    # Conexión a SQL Server
-    ejemplo_uso()
+    # LOG_NIVEL=DEBUG muestra cada métrica; LOG_FORMATO=json la escribe como JSON
+    configurar_logging()
+    if not os.path.exists(env_file):
+        # Advertir al usuario si no se encuentra el archivo
+        logger.warning("No se encontró el archivo .env en %s.", env_file)
+
+    # Conexión a SQL Server (engine compartido; se cierra el pool al terminar).
+    # Con PERFILAR=1 la ejecución completa se perfila con cProfile.
+    try:
+        with perfilar('main'):
+            if args.incremental:
+                actualizacion_incremental()
+            elif args.huecos:
+                recuperar_huecos()
+            else:
+                ejemplo_uso()
+    finally:
+        cerrar_engine()
+        for serie, valores in obtener_metricas().resumen()['histogramas'].items():
+            logger.info("%s: %d mediciones, %.2f s", serie, valores['cuenta'], valores['suma'])
@@ -0,0 +1,215 @@
+"""
+Módulo para construir matrices anchas de precios (una columna por campo y símbolo).
+
+Sustituye al PIVOT escrito a mano de scripts/Queries/ProfileQueryWithPivotation.sql:
+en lugar de un CASE por símbolo y campo, se leen los precios en formato largo con
+una consulta por rango (SymbolID, Date), que aprovecha el índice de StockPrices,
+y se pivotan en memoria con NumPy. Escala a miles de columnas y es la entrada de
+los cálculos de correlaciones y carteras.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+from sqlalchemy.types import Date
+
+CAMPOS_PRECIOS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# SQL Server admite como máximo 2100 parámetros por sentencia
+TAMANO_BLOQUE_IN = 1000
+
+logger = logging.getLogger('alphavantage.matriz_precios')
+
+SIMBOLOS_SQL = text('''
+    SELECT SymbolID, Symbol FROM Metadata.Symbols WHERE Symbol IN :simbolos
+''').bindparams(bindparam('simbolos', expanding=True))
+
+
+def _consulta_precios(campos):
+    return text(f'''
+        SELECT SymbolID, [Date], {', '.join(f'[{campo}]' for campo in campos)}
+        FROM AVdata.StockPrices
+        WHERE SymbolID IN :symbol_ids AND [Date] >= :desde AND [Date] <= :hasta
+    ''').bindparams(bindparam('symbol_ids', expanding=True),
+                    bindparam('desde', type_=Date()), bindparam('hasta', type_=Date()))
+
+
+def _bloques(valores, tamano=TAMANO_BLOQUE_IN):
+    for i in range(0, len(valores), tamano):
+        yield valores[i:i + tamano]
+
+
+def resolver_simbolos(engine, simbolos):
+    """
+    Devuelve un diccionario {Symbol: SymbolID} para los símbolos dados.
+
+    Los símbolos que no existen en Metadata.Symbols no aparecen en el resultado.
+    """
+    ids = {}
+    with engine.connect() as conn:
+        for bloque in _bloques(list(simbolos)):
+            for symbol_id, symbol in conn.execute(SIMBOLOS_SQL, {'simbolos': bloque}):
+                ids[symbol] = int(symbol_id)
+    return ids
+
+
+def leer_precios_largos(engine, symbol_ids, campos=None, desde=None, hasta=None):
+    """
+    Lee los precios en formato largo (una fila por SymbolID y fecha).
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine
+        Engine conectado a AlphaVantageDB.
+    symbol_ids : list
+        SymbolID a leer. Se consultan en bloques de TAMANO_BLOQUE_IN.
+    campos : list, opcional
+        Columnas de CAMPOS_PRECIOS a leer. Por defecto todas.
+    desde, hasta : str, opcional
+        Rango de fechas inclusivo 'YYYY-MM-DD'.
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        Columnas SymbolID, Date y los campos pedidos.
+    """
+    campos = _validar_campos(campos)
+    consulta = _consulta_precios(campos)
+    parametros = {
+        'desde': pd.Timestamp(desde or '1900-01-01').date(),
+        'hasta': pd.Timestamp(hasta or '2999-12-31').date(),
+    }
+    partes = []
+    with engine.connect() as conn:
+        for bloque in _bloques([int(symbol_id) for symbol_id in symbol_ids]):
+            partes.append(pd.read_sql(consulta, conn, params={**parametros, 'symbol_ids': bloque}))
+    if not partes:
+        return pd.DataFrame(columns=['SymbolID', 'Date'] + campos)
+    largos = pd.concat(partes, ignore_index=True)
+    largos['Date'] = pd.to_datetime(largos['Date'])
+    return largos
+
+
+def _validar_campos(campos):
+    campos = list(campos) if campos else list(CAMPOS_PRECIOS)
+    desconocidos = [campo for campo in campos if campo not in CAMPOS_PRECIOS]
+    if desconocidos:
+        raise ValueError(f"Campos no válidos: {desconocidos}. Usa alguno de {CAMPOS_PRECIOS}.")
+    return campos
+
+
+def _rellenar_hacia_delante(matriz):
+    """Propaga el último valor no nulo de cada columna hacia abajo (los NaN iniciales se mantienen)."""
+    filas = np.where(~np.isnan(matriz), np.arange(matriz.shape[0])[:, None], 0)
+    np.maximum.accumulate(filas, axis=0, out=filas)
+    return matriz[filas, np.arange(matriz.shape[1])]
+
+
+def pivotar_precios(largos, etiquetas, campos=None, fechas='union', relleno=None, dtype=np.float64):
+    """
+    Pivota precios en formato largo a una matriz alineada por fecha.
+
+    Parámetros:
+    -----------
+    largos : pandas.DataFrame
+        Columnas SymbolID, Date y los campos, como devuelve leer_precios_largos.
+    etiquetas : dict
+        {SymbolID: Symbol}. Fija el orden de las columnas y sus nombres.
+    campos : list, opcional
+        Campos a pivotar. Por defecto todos los de CAMPOS_PRECIOS.
+    fechas : str, opcional
+        'union' conserva todas las fechas con algún dato; 'interseccion' solo
+        las fechas en las que todos los símbolos tienen barra.
+    relleno : str, opcional
+        None deja NaN donde falta la barra; 'ffill' arrastra el último valor
+        conocido de cada columna (los NaN anteriores a la primera barra se mantienen).
+    dtype : numpy.dtype, opcional
+        np.float64 o np.float32 (la mitad de memoria para matrices grandes).
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        Índice Date ascendente y columnas '{campo}_{symbol}' (p. ej. Close_AAPL),
+        agrupadas por símbolo en el orden de etiquetas.
+    """
+    campos = _validar_campos(campos)
+    if fechas not in ('union', 'interseccion'):
+        raise ValueError("fechas debe ser 'union' o 'interseccion'.")
+    if relleno not in (None, 'ffill'):
+        raise ValueError("relleno debe ser None o 'ffill'.")
+
+    symbol_ids = np.fromiter(etiquetas.keys(), dtype=np.int64, count=len(etiquetas))
+    columnas = [f"{campo}_{symbol}" for symbol in etiquetas.values() for campo in campos]
+
+    ids_filas = largos['SymbolID'].to_numpy(dtype=np.int64)
+    presentes = np.isin(ids_filas, symbol_ids)
+    ids_filas = ids_filas[presentes]
+    dias = largos['Date'].to_numpy(dtype='datetime64[ns]')[presentes]
+
+    # Posición de cada fila en el eje de fechas y en el de símbolos
+    eje_fechas, fila = np.unique(dias, return_inverse=True)
+    orden_ids = np.argsort(symbol_ids)
+    simbolo = orden_ids[np.searchsorted(symbol_ids, ids_filas, sorter=orden_ids)]
+
+    n_campos = len(campos)
+    matriz = np.full((len(eje_fechas), len(symbol_ids) * n_campos), np.nan, dtype=dtype)
+    for k, campo in enumerate(campos):
+        valores = largos[campo].to_numpy(dtype=np.float64, na_value=np.nan)[presentes]
+        matriz[fila, simbolo * n_campos + k] = valores
+
+    if fechas == 'interseccion':
+        barras_por_fecha = np.bincount(fila, minlength=len(eje_fechas))
+        completas = barras_por_fecha == len(symbol_ids)
+        matriz, eje_fechas = matriz[completas], eje_fechas[completas]
+    if relleno == 'ffill' and matriz.size:
+        matriz = _rellenar_hacia_delante(matriz)
+
+    return pd.DataFrame(matriz, index=pd.DatetimeIndex(eje_fechas, name='Date'), columns=columnas)
+
+
+def construir_matriz(engine, simbolos, campos=('Close',), desde=None, hasta=None,
+                     fechas='union', relleno=None, float32=False):
+    """
+    Construye una matriz ancha de precios para una lista de símbolos.
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine
+        Engine conectado a AlphaVantageDB.
+    simbolos : list
+        Símbolos bursátiles (p. ej. ['AAPL', 'NVDA']). Los que no existen en
+        Metadata.Symbols se omiten con un aviso.
+    campos : list, opcional
+        Campos de CAMPOS_PRECIOS. Por defecto solo Close.
+    desde, hasta : str, opcional
+        Rango de fechas inclusivo 'YYYY-MM-DD'.
+    fechas : str, opcional
+        'union' o 'interseccion' (ver pivotar_precios).
+    relleno : str, opcional
+        None o 'ffill' (ver pivotar_precios).
+    float32 : bool, opcional
+        Devolver la matriz en float32 en lugar de float64.
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        Índice Date y columnas '{campo}_{symbol}'.
+
+    Ejemplo:
+    --------
+    >>> engine = conectar_sql_server()
+    >>> matriz = construir_matriz(engine, ['AAPL', 'NVDA'], campos=['Open', 'Close'], desde='2020-01-01')
+    >>> rendimientos = matriz.pct_change().corr()
+    """
+    simbolos = list(dict.fromkeys(simbolos))
+    ids = resolver_simbolos(engine, simbolos)
+    faltan = [symbol for symbol in simbolos if symbol not in ids]
+    if faltan:
+        logger.warning("Símbolos no encontrados en Metadata.Symbols: %s", ', '.join(faltan))
+    etiquetas = {ids[symbol]: symbol for symbol in simbolos if symbol in ids}
+
+    campos = _validar_campos(campos)
+    largos = leer_precios_largos(engine, list(etiquetas), campos, desde, hasta)
+    return pivotar_precios(largos, etiquetas, campos, fechas=fechas, relleno=relleno,
+                           dtype=np.float32 if float32 else np.float64)
@@ -0,0 +1,325 @@
+"""
+Módulo de métricas de rendimiento: contadores, tiempos y perfilado.
+
+Registra en memoria contadores e histogramas de duración con etiquetas y los
+expone en el formato de texto de Prometheus (ruta /metrics de la webapp).
+Cada observación se emite además como registro estructurado del logger
+'alphavantage.metricas' (nivel DEBUG) con los campos metrica, valor y las
+etiquetas, que configurar_logging puede escribir en JSON.
+
+Perfilado: con PERFILAR=1 en el entorno, perfilar() envuelve una ejecución
+completa en cProfile, guarda el .prof en data/perfiles/ y registra en el
+logger las funciones con más tiempo acumulado (campo detalle).
+
+Ejemplo:
+--------
+>>> with cronometro('descarga_segundos', origen='yahoo'):
+...     df = descargar_datos_yahoo('AAPL')
+>>> contar('descarga_filas', len(df), origen='yahoo')
+"""
+import cProfile
+import contextlib
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+
+PREFIJO = 'alphavantage_'
+
+# Límites (segundos) de los histogramas: de 1 ms a 2 min
+LIMITES_POR_DEFECTO = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+DIRECTORIO_PERFILES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   'data', 'perfiles')
+
+logger = logging.getLogger('alphavantage.metricas')
+
+
+class Histograma:
+    """Histograma acumulado de duraciones (cuenta, suma y cubos)."""
+
+    def __init__(self, limites=LIMITES_POR_DEFECTO):
+        self.limites = tuple(limites)
+        self.cubos = [0] * (len(self.limites) + 1)
+        self.cuenta = 0
+        self.suma = 0.0
+
+    def observar(self, valor):
+        self.cubos[bisect_left(self.limites, valor)] += 1
+        self.cuenta += 1
+        self.suma += valor
+
+
+class Metricas:
+    """
+    Registro de contadores, valores instantáneos e histogramas con etiquetas.
+
+    Las claves son (nombre, etiquetas) con las etiquetas como tupla ordenada de
+    pares, de modo que cada combinación es una serie distinta. Las etiquetas
+    deben tener pocos valores posibles (operación, origen, ruta...); lo que
+    varía por símbolo va al log, no a las etiquetas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self._valores = {}
+        self._histogramas = {}
+        self._ayudas = {}
+
+    @staticmethod
+    def _clave(nombre, etiquetas):
+        return nombre, tuple(sorted((clave, str(valor)) for clave, valor in etiquetas.items()))
+
+    def describir(self, nombre, ayuda):
+        """Texto de ayuda (# HELP) de una métrica."""
+        self._ayudas[nombre] = ayuda
+
+    def contar(self, nombre, valor=1, **etiquetas):
+        """Suma valor al contador nombre{etiquetas}."""
+        clave = self._clave(nombre, etiquetas)
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    def fijar(self, nombre, valor, **etiquetas):
+        """Fija el valor instantáneo (gauge) nombre{etiquetas}."""
+        clave = self._clave(nombre, etiquetas)
+        with self._lock:
+            self._valores[clave] = valor
+
+    def observar(self, nombre, segundos, **etiquetas):
+        """Añade una duración al histograma nombre{etiquetas}."""
+        clave = self._clave(nombre, etiquetas)
+        with self._lock:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                histograma = self._histogramas[clave] = Histograma()
+            histograma.observar(segundos)
+
+    def reiniciar(self):
+        """Borra todas las series (útil entre ejecuciones de un benchmark)."""
+        with self._lock:
+            self._contadores.clear()
+            self._valores.clear()
+            self._histogramas.clear()
+
+    def resumen(self):
+        """
+        Vista en diccionario de todas las series.
+
+        Retorna:
+        --------
+        dict
+            {'contadores': {...}, 'valores': {...}, 'histogramas': {...}} con
+            claves 'nombre{etiqueta=valor,...}'.
+        """
+        with self._lock:
+            return {
+                'contadores': {_nombre_serie(*clave): valor for clave, valor in self._contadores.items()},
+                'valores': {_nombre_serie(*clave): valor for clave, valor in self._valores.items()},
+                'histogramas': {_nombre_serie(*clave): {'cuenta': h.cuenta, 'suma': round(h.suma, 6)}
+                                for clave, h in self._histogramas.items()},
+            }
+
+    def texto_prometheus(self):
+        """Todas las series en el formato de exposición de texto de Prometheus 0.0.4."""
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            valores = sorted(self._valores.items())
+            histogramas = sorted((clave, (list(h.cubos), h.cuenta, h.suma, h.limites))
+                                 for clave, h in self._histogramas.items())
+        lineas = []
+        vistos = set()
+
+        def cabecera(nombre, tipo):
+            if nombre not in vistos:
+                vistos.add(nombre)
+                familia = f"{PREFIJO}{nombre}{'_total' if tipo == 'counter' else ''}"
+                if nombre in self._ayudas:
+                    lineas.append(f"# HELP {familia} {self._ayudas[nombre]}")
+                lineas.append(f"# TYPE {familia} {tipo}")
+
+        for (nombre, etiquetas), valor in contadores:
+            cabecera(nombre, 'counter')
+            lineas.append(f"{PREFIJO}{nombre}_total{_etiquetas(etiquetas)} {_numero(valor)}")
+        for (nombre, etiquetas), valor in valores:
+            cabecera(nombre, 'gauge')
+            lineas.append(f"{PREFIJO}{nombre}{_etiquetas(etiquetas)} {_numero(valor)}")
+        for (nombre, etiquetas), (cubos, cuenta, suma, limites) in histogramas:
+            cabecera(nombre, 'histogram')
+            acumulado = 0
+            for limite, en_cubo in zip(limites + (float('inf'),), cubos):
+                acumulado += en_cubo
+                le = '+Inf' if limite == float('inf') else repr(limite)
+                lineas.append(f"{PREFIJO}{nombre}_bucket{_etiquetas(etiquetas + (('le', le),))} {acumulado}")
+            lineas.append(f"{PREFIJO}{nombre}_sum{_etiquetas(etiquetas)} {_numero(suma)}")
+            lineas.append(f"{PREFIJO}{nombre}_count{_etiquetas(etiquetas)} {cuenta}")
+        return "\n".join(lineas) + "\n"
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ''
+    return '{' + ','.join(f'{clave}="{_escapar(valor)}"' for clave, valor in etiquetas) + '}'
+
+
+def _nombre_serie(nombre, etiquetas):
+    return nombre + ('{' + ','.join(f"{clave}={valor}" for clave, valor in etiquetas) + '}' if etiquetas else '')
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+_metricas = Metricas()
+
+
+def obtener_metricas():
+    """Devuelve el registro de métricas compartido por el proceso."""
+    return _metricas
+
+
+def contar(nombre, valor=1, **etiquetas):
+    """Suma valor al contador compartido nombre{etiquetas}."""
+    _metricas.contar(nombre, valor, **etiquetas)
+
+
+def fijar(nombre, valor, **etiquetas):
+    """Fija el valor instantáneo compartido nombre{etiquetas}."""
+    _metricas.fijar(nombre, valor, **etiquetas)
+
+
+def observar(nombre, segundos, detalle=None, **etiquetas):
+    """
+    Añade una duración al histograma compartido y la emite como log estructurado.
+
+    Parámetros:
+    -----------
+    nombre : str
+        Nombre del histograma (p. ej. 'insercion_lote_segundos').
+    segundos : float
+        Duración observada.
+    detalle : dict, opcional
+        Campos que solo van al log (p. ej. {'symbol': 'AAPL', 'filas': 250}).
+    **etiquetas :
+        Etiquetas de la serie.
+    """
+    _metricas.observar(nombre, segundos, **etiquetas)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(nombre, extra={'metrica': nombre, 'valor': round(segundos, 6),
+                                    **etiquetas, **(detalle or {})})
+
+
+@contextlib.contextmanager
+def cronometro(nombre, detalle=None, **etiquetas):
+    """
+    Mide la duración del bloque y la registra con observar().
+
+    El bloque recibe el diccionario detalle (vacío si no se pasa) y puede
+    añadirle campos para el log, como las filas procesadas. Si el bloque lanza
+    una excepción se registra igualmente con la etiqueta error="1".
+    """
+    detalle = {} if detalle is None else detalle
+    inicio = time.perf_counter()
+    try:
+        yield detalle
+    except Exception:
+        observar(nombre, time.perf_counter() - inicio, detalle, error='1', **etiquetas)
+        raise
+    observar(nombre, time.perf_counter() - inicio, detalle, **etiquetas)
+
+
+# --- Logging estructurado ------------------------------------------------------
+
+_ATRIBUTOS_ESTANDAR = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class FormatoJSON(logging.Formatter):
+    """Formatea cada registro como una línea JSON con los campos extra incluidos."""
+
+    def format(self, record):
+        datos = {
+            'momento': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+        }
+        datos.update({clave: valor for clave, valor in vars(record).items()
+                      if clave not in _ATRIBUTOS_ESTANDAR})
+        if record.exc_info:
+            datos['excepcion'] = self.formatException(record.exc_info)
+        return json.dumps(datos, default=str, ensure_ascii=False)
+
+
+def configurar_logging(nivel=None, formato=None):
+    """
+    Configura el logger 'alphavantage'.
+
+    Parámetros:
+    -----------
+    nivel : str, opcional
+        Nivel de log. Por defecto LOG_NIVEL o INFO (DEBUG muestra cada métrica).
+    formato : str, opcional
+        'json' o 'texto'. Por defecto LOG_FORMATO o texto.
+    """
+    nivel = (nivel or os.getenv('LOG_NIVEL', 'INFO')).upper()
+    formato = formato or os.getenv('LOG_FORMATO', 'texto')
+    manejador = logging.StreamHandler()
+    if formato == 'json':
+        manejador.setFormatter(FormatoJSON())
+    else:
+        manejador.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    raiz = logging.getLogger('alphavantage')
+    raiz.handlers[:] = [manejador]
+    raiz.setLevel(nivel)
+    raiz.propagate = False
+
+
+# --- Perfilado -----------------------------------------------------------------
+
+@contextlib.contextmanager
+def perfilar(nombre, activo=None, lineas=25):
+    """
+    Perfila el bloque con cProfile si PERFILAR está activo en el entorno.
+
+    Parámetros:
+    -----------
+    nombre : str
+        Prefijo del fichero .prof (p. ej. 'main').
+    activo : bool, opcional
+        Fuerza el perfilado; por defecto PERFILAR in ('1', 'true', 'si').
+    lineas : int, opcional
+        Funciones del informe, ordenadas por tiempo acumulado. El informe va en
+        el campo detalle del registro y la ruta del .prof en el campo perfil.
+    """
+    if activo is None:
+        activo = os.getenv('PERFILAR', '').lower() in ('1', 'true', 'si', 'sí')
+    if not activo:
+        yield None
+        return
+
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield perfil
+    finally:
+        perfil.disable()
+        directorio = os.getenv('PERFILES_DIR', DIRECTORIO_PERFILES)
+        os.makedirs(directorio, exist_ok=True)
+        ruta = os.path.join(directorio, f"{nombre}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof")
+        perfil.dump_stats(ruta)
+        salida = io.StringIO()
+        pstats.Stats(perfil, stream=salida).sort_stats('cumulative').print_stats(lineas)
+        logger.info("Perfil de %s: %d funciones con más tiempo acumulado", nombre, lineas,
+                    extra={'perfil': ruta, 'detalle': salida.getvalue()})
+        logger.info("Perfil guardado en %s (ábrelo con 'python -m pstats %s' o snakeviz)", ruta, ruta,
+                    extra={'perfil': ruta})
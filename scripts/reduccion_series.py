@@ -0,0 +1,107 @@
+"""
+Módulo para reducir series de precios antes de enviarlas a un gráfico.
+
+- lttb: Largest-Triangle-Three-Buckets, elige las barras que mejor conservan la
+  forma visual de la serie de cierres.
+- agregar_ohlc: agrega las barras diarias en velas semanales o mensuales
+  (primer Open, máximo High, mínimo Low, último Close y suma de Volume).
+
+Trabajan sobre los arrays de almacen_memoria (fechas como días int32).
+"""
+import numpy as np
+
+PERIODOS = ('semana', 'mes')
+
+
+def lttb(x, y, puntos):
+    """
+    Índices de las barras elegidas por Largest-Triangle-Three-Buckets.
+
+    Parámetros:
+    -----------
+    x, y : numpy.ndarray
+        Abscisas crecientes (p. ej. días) y valores de la serie.
+    puntos : int
+        Número de puntos deseado (como mínimo 3).
+
+    Retorna:
+    --------
+    numpy.ndarray
+        Índices ordenados de las filas a conservar. Incluyen siempre la primera
+        y la última; si la serie ya tiene puntos filas o menos se devuelven todas.
+    """
+    n = len(y)
+    if puntos >= n or puntos < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    # Los NaN no pueden formar triángulos: se tratan como el valor anterior conocido
+    y = np.asarray(y, dtype=np.float64)
+    if np.isnan(y).any():
+        validos = np.where(~np.isnan(y), np.arange(n), 0)
+        np.maximum.accumulate(validos, out=validos)
+        y = np.nan_to_num(y[validos])
+
+    # Cubos interiores: las filas 1..n-2 repartidas en puntos-2 tramos
+    limites = (np.arange(puntos - 1) * (n - 2) / (puntos - 2)).astype(np.int64) + 1
+    limites[-1] = n - 1
+    elegidos = np.empty(puntos, dtype=np.int64)
+    elegidos[0], elegidos[-1] = 0, n - 1
+
+    anterior = 0
+    for i in range(puntos - 2):
+        inicio, fin = limites[i], limites[i + 1]
+        # Vértice siguiente: media del cubo siguiente (o el último punto)
+        siguiente_inicio, siguiente_fin = fin, limites[i + 2] if i + 2 < len(limites) else n
+        x_medio = x[siguiente_inicio:siguiente_fin].mean()
+        y_medio = y[siguiente_inicio:siguiente_fin].mean()
+        ax, ay = x[anterior], y[anterior]
+        areas = np.abs((ax - x_medio) * (y[inicio:fin] - ay) - (ax - x[inicio:fin]) * (y_medio - ay))
+        anterior = inicio + int(areas.argmax())
+        elegidos[i + 1] = anterior
+    return elegidos
+
+
+def _clave_periodo(dias, periodo):
+    """Identificador entero del periodo de cada día (semanas de lunes a domingo)."""
+    dias = np.asarray(dias, dtype=np.int64)
+    if periodo == 'semana':
+        # 1970-01-01 fue jueves: con +3 los cortes caen en lunes
+        return (dias + 3) // 7
+    if periodo == 'mes':
+        return dias.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    raise ValueError(f"Periodo no válido: {periodo}. Usa alguno de {PERIODOS}.")
+
+
+def agregar_ohlc(fechas, open_, high, low, close, volume, periodo='semana'):
+    """
+    Agrega barras diarias ordenadas por fecha en velas del periodo dado.
+
+    Parámetros:
+    -----------
+    fechas : numpy.ndarray
+        Días (int) desde 1970-01-01, crecientes.
+    open_, high, low, close, volume : numpy.ndarray
+        Valores de cada barra.
+    periodo : str, opcional
+        'semana' o 'mes'.
+
+    Retorna:
+    --------
+    tuple
+        (fechas, open, high, low, close, volume) con una fila por periodo; la
+        fecha es la de la primera barra del periodo.
+    """
+    n = len(fechas)
+    if n == 0:
+        return fechas, open_, high, low, close, volume
+    clave = _clave_periodo(fechas, periodo)
+    inicios = np.flatnonzero(np.r_[True, clave[1:] != clave[:-1]])
+    finales = np.r_[inicios[1:], n] - 1
+    return (
+        np.asarray(fechas)[inicios],
+        np.asarray(open_)[inicios],
+        np.fmax.reduceat(np.asarray(high, dtype=np.float64), inicios),
+        np.fmin.reduceat(np.asarray(low, dtype=np.float64), inicios),
+        np.asarray(close)[finales],
+        np.add.reduceat(np.asarray(volume), inicios),
+    )
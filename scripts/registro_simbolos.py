@@ -0,0 +1,180 @@
+"""
+Módulo con el registro persistente de validación de símbolos.
+
+La comprobación de si un símbolo existe en Yahoo Finance (ticker.info) es una
+llamada de red pesada. En lugar de hacerla en cada descarga, el resultado se
+guarda en un fichero JSON local con la fecha de la última comprobación y solo
+se vuelve a validar, en bloque, cuando ha caducado (TTL).
+"""
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import yfinance as yf
+
+TTL_HORAS_POR_DEFECTO = 24 * 7
+RUTA_POR_DEFECTO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'data', 'registro_simbolos.json')
+
+logger = logging.getLogger('alphavantage.registro_simbolos')
+
+
+def validar_con_yahoo(symbol):
+    """
+    Consulta ticker.info y devuelve los metadatos básicos del símbolo.
+
+    Retorna:
+    --------
+    dict
+        Diccionario con valido, nombre y moneda.
+    """
+    info = yf.Ticker(symbol).info or {}
+    return {
+        'valido': 'regularMarketPrice' in info or 'previousClose' in info,
+        'nombre': info.get('longName') or info.get('shortName'),
+        'moneda': info.get('currency'),
+    }
+
+
+class RegistroSimbolos:
+    """
+    Registro de símbolos validados, persistido en un fichero JSON.
+
+    Parámetros:
+    -----------
+    ruta : str, opcional
+        Fichero del registro. Por defecto REGISTRO_SIMBOLOS_RUTA o data/registro_simbolos.json.
+    ttl_horas : float, opcional
+        Horas que una validación se considera vigente. Por defecto
+        REGISTRO_SIMBOLOS_TTL_HORAS o una semana.
+    validador : callable, opcional
+        Función validador(symbol) -> dict con la clave 'valido'. Por defecto validar_con_yahoo.
+    """
+
+    def __init__(self, ruta=None, ttl_horas=None, validador=validar_con_yahoo):
+        self.ruta = ruta or os.getenv('REGISTRO_SIMBOLOS_RUTA', RUTA_POR_DEFECTO)
+        if ttl_horas is None:
+            ttl_horas = float(os.getenv('REGISTRO_SIMBOLOS_TTL_HORAS', TTL_HORAS_POR_DEFECTO))
+        self.ttl = timedelta(hours=ttl_horas)
+        self.validador = validador
+        self._lock = threading.Lock()
+        self._entradas = self._cargar()
+
+    def _cargar(self):
+        if not os.path.exists(self.ruta):
+            return {}
+        try:
+            with open(self.ruta, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("No se pudo leer el registro de símbolos '%s': %s", self.ruta, e)
+            return {}
+
+    def guardar(self):
+        """Escribe el registro en disco de forma atómica."""
+        with self._lock:
+            contenido = dict(self._entradas)
+        os.makedirs(os.path.dirname(self.ruta) or '.', exist_ok=True)
+        temporal = f"{self.ruta}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(contenido, f, indent=2, sort_keys=True)
+        os.replace(temporal, self.ruta)
+
+    def _vigente(self, entrada, ahora):
+        comprobado = datetime.fromisoformat(entrada['ultima_comprobacion'])
+        return ahora - comprobado < self.ttl
+
+    def consultar(self, symbol):
+        """Devuelve la entrada vigente del símbolo o None si no existe o ha caducado. No usa la red."""
+        with self._lock:
+            entrada = self._entradas.get(symbol)
+        if entrada is None or not self._vigente(entrada, datetime.now()):
+            return None
+        return entrada
+
+    def es_valido(self, symbol):
+        """True/False según la última validación vigente, o None si se desconoce."""
+        entrada = self.consultar(symbol)
+        return None if entrada is None else entrada['valido']
+
+    def pendientes(self, simbolos):
+        """Símbolos sin validación vigente."""
+        return [symbol for symbol in simbolos if self.consultar(symbol) is None]
+
+    def registrar(self, symbol, valido, **metadatos):
+        """Añade o sustituye la entrada de un símbolo con la fecha actual."""
+        with self._lock:
+            self._entradas[symbol] = {
+                **metadatos,
+                'valido': bool(valido),
+                'ultima_comprobacion': datetime.now().isoformat(timespec='seconds'),
+            }
+
+    def actualizar(self, simbolos, max_hilos=4, forzar=False):
+        """
+        Valida en bloque los símbolos caducados o desconocidos y guarda el registro.
+
+        Parámetros:
+        -----------
+        simbolos : iterable
+            Símbolos a comprobar.
+        max_hilos : int, opcional
+            Validaciones simultáneas.
+        forzar : bool, opcional
+            Si es True se validan todos, aunque estén vigentes.
+
+        Retorna:
+        --------
+        int
+            Número de símbolos validados contra la red.
+        """
+        simbolos = list(dict.fromkeys(simbolos))
+        por_validar = simbolos if forzar else self.pendientes(simbolos)
+        if not por_validar:
+            return 0
+
+        def validar(symbol):
+            try:
+                resultado = self.validador(symbol)
+            except Exception as e:
+                # Un error de red no invalida el símbolo: se deja sin registrar para reintentar
+                logger.warning("No se pudo validar '%s': %s", symbol, e)
+                return
+            self.registrar(symbol, **resultado)
+
+        with ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="validacion") as pool:
+            list(pool.map(validar, por_validar))
+        self.guardar()
+        logger.info("Registro de símbolos: %d símbolos validados", len(por_validar))
+        return len(por_validar)
+
+    def filtrar_validos(self, tareas, clave='Symbol'):
+        """
+        Actualiza el registro para los símbolos de las tareas y descarta los no válidos.
+
+        Los símbolos que no se han podido validar (error de red) se conservan.
+        """
+        self.actualizar([tarea[clave] for tarea in tareas])
+        validas = []
+        for tarea in tareas:
+            if self.es_valido(tarea[clave]) is False:
+                logger.warning("Se omite '%s', no es un símbolo válido en Yahoo Finance.", tarea[clave])
+                continue
+            validas.append(tarea)
+        return validas
+
+
+_registro = None
+_registro_lock = threading.Lock()
+
+
+def obtener_registro():
+    """Devuelve el registro de símbolos compartido por el proceso."""
+    global _registro
+    with _registro_lock:
+        if _registro is None:
+            _registro = RegistroSimbolos()
+        return _registro
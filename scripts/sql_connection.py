@@ -1,11 +1,188 @@
 """
 Módulo para conectar con SQL Server mediante SQLAlchemy y pyodbc.
+
+El engine se crea una sola vez por proceso (obtener_engine) y mantiene un pool
+de conexiones reutilizables, de modo que cada petición no paga un nuevo login.
 """
+import importlib
+import logging
 import os
-import pyodbc
+import threading
+import time
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.exc import SQLAlchemyError
+
+try:
+    from .metricas import contar, fijar, observar
+except ImportError:
+    from metricas import contar, fijar, observar
+
+POOL_SIZE_POR_DEFECTO = 5
+MAX_OVERFLOW_POR_DEFECTO = 10
+POOL_RECYCLE_POR_DEFECTO = 1800
+POOL_TIMEOUT_POR_DEFECTO = 30
+TAMANO_LOTE_LECTURA_POR_DEFECTO = 50000
+
+# Etiqueta 'operacion' de sql_consulta_segundos (el resto se agrupa como 'otra')
+OPERACIONES_SQL = ('select', 'insert', 'update', 'delete', 'merge', 'with')
+
+logger = logging.getLogger('alphavantage.sql_connection')
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def construir_url():
+    """
+    Construye la URL de conexión a partir de las variables de entorno.
+
+    Si SQL_URL está definida se usa tal cual (por ejemplo 'sqlite:///local.db'
+    en pruebas); en otro caso se compone la URL de SQL Server con SQL_USER,
+    SQL_PASSWORD, SQL_SERVER, SQL_PORT y SQL_DATABASE.
+    """
+    if os.getenv('SQL_URL'):
+        return os.getenv('SQL_URL')
+    mySQLPasssord = os.getenv('SQL_PASSWORD').replace("@", "%40")
+    return f"mssql+pyodbc://{os.getenv('SQL_USER')}:{mySQLPasssord}@{os.getenv('SQL_SERVER')}:{os.getenv('SQL_PORT')}/{os.getenv('SQL_DATABASE')}?driver=/opt/homebrew/lib/libmsodbcsql.18.dylib&TrustServerCertificate=yes"
+
+def crear_engine(url=None, pool_size=None, max_overflow=None, pool_recycle=None, pool_timeout=None):
+    """
+    Crea un engine nuevo con pool de conexiones.
+
+    Parámetros:
+    -----------
+    url : str, opcional
+        URL de conexión. Por defecto construir_url().
+    pool_size, max_overflow, pool_recycle, pool_timeout : int, opcional
+        Parámetros del pool. Por defecto SQL_POOL_SIZE (5), SQL_MAX_OVERFLOW (10),
+        SQL_POOL_RECYCLE (1800 s) y SQL_POOL_TIMEOUT (30 s).
+
+    Retorna:
+    --------
+    engine : sqlalchemy.engine.Engine
+    """
+    url = make_url(url or construir_url())
+    opciones = {'pool_pre_ping': True}
+
+    # SQLite en memoria usa un pool de una conexión por hilo sin tamaño configurable
+    en_memoria = url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+    if not en_memoria:
+        opciones.update(
+            pool_size=pool_size if pool_size is not None else int(os.getenv('SQL_POOL_SIZE', POOL_SIZE_POR_DEFECTO)),
+            max_overflow=max_overflow if max_overflow is not None else int(os.getenv('SQL_MAX_OVERFLOW', MAX_OVERFLOW_POR_DEFECTO)),
+            pool_recycle=pool_recycle if pool_recycle is not None else int(os.getenv('SQL_POOL_RECYCLE', POOL_RECYCLE_POR_DEFECTO)),
+            pool_timeout=pool_timeout if pool_timeout is not None else int(os.getenv('SQL_POOL_TIMEOUT', POOL_TIMEOUT_POR_DEFECTO)),
+        )
+    if url.drivername == 'mssql+pyodbc':
+        # pyodbc solo se importa para SQL Server: necesita unixODBC, que no hace
+        # falta para los motores locales (SQLite del benchmark y las pruebas). Se
+        # importa aquí para que un driver ausente falle al crear el engine
+        importlib.import_module('pyodbc')
+        # fast_executemany hace que pyodbc envíe los lotes de executemany como arrays de parámetros
+        opciones['fast_executemany'] = True
+
+    engine = create_engine(url, **opciones)
+    instrumentar_engine(engine)
+    return engine
+
+def instrumentar_engine(engine):
+    """
+    Registra métricas de un engine: duración de cada sentencia (sql_consulta_segundos
+    por operación), tiempo de login de las conexiones nuevas (sql_conexion_nueva_segundos),
+    tiempo que cada conexión permanece prestada (sql_conexion_uso_segundos) y conexiones
+    prestadas en cada momento (sql_pool_en_uso). Cuando sql_pool_en_uso alcanza
+    SQL_POOL_SIZE + SQL_MAX_OVERFLOW, las peticiones siguientes esperan hasta SQL_POOL_TIMEOUT.
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _antes(conn, cursor, sentencia, parametros, contexto, executemany):
+        conn.info.setdefault('_inicios_consulta', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _despues(conn, cursor, sentencia, parametros, contexto, executemany):
+        inicios = conn.info.get('_inicios_consulta')
+        if inicios:
+            palabra = sentencia.lstrip().split(None, 1)[0].lower() if sentencia.strip() else ''
+            operacion = palabra if palabra in OPERACIONES_SQL else 'otra'
+            observar('sql_consulta_segundos', time.perf_counter() - inicios.pop(), operacion=operacion)
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(contexto):
+        contar('sql_errores')
+        if contexto.connection is not None:
+            inicios = contexto.connection.info.get('_inicios_consulta')
+            if inicios:
+                inicios.pop()
+
+    @event.listens_for(engine, 'do_connect')
+    def _conectar(dialecto, registro, cargs, cparams):
+        inicio = time.perf_counter()
+        conexion = dialecto.connect(*cargs, **cparams)
+        observar('sql_conexion_nueva_segundos', time.perf_counter() - inicio)
+        return conexion
+
+    # Eventos del pool registrados sobre el engine: se conservan en el pool nuevo tras dispose()
+    @event.listens_for(engine, 'checkout')
+    def _prestar(conexion_dbapi, registro, proxy):
+        registro.info['_prestada_en'] = time.perf_counter()
+        _fijar_en_uso(engine.pool)
+
+    @event.listens_for(engine, 'checkin')
+    def _devolver(conexion_dbapi, registro):
+        inicio = registro.info.pop('_prestada_en', None)
+        if inicio is not None:
+            observar('sql_conexion_uso_segundos', time.perf_counter() - inicio)
+        # checkin se emite antes de devolver la conexión al pool: aún cuenta como en uso
+        _fijar_en_uso(engine.pool, -1)
+
+def _fijar_en_uso(pool, ajuste=0):
+    """Actualiza sql_pool_en_uso (solo en pools que cuentan sus conexiones, como QueuePool)."""
+    if callable(getattr(pool, 'checkedout', None)):
+        fijar('sql_pool_en_uso', pool.checkedout() + ajuste)
+
+def obtener_engine():
+    """
+    Devuelve el engine compartido por todo el proceso, creándolo la primera vez.
+
+    No hay que llamar a dispose() tras cada uso: las conexiones vuelven al pool
+    al cerrar el bloque "with engine.connect()". Para liberar el pool al terminar
+    el proceso se usa cerrar_engine().
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = crear_engine()
+    return _engine
+
+def cerrar_engine():
+    """Cierra todas las conexiones del pool compartido y descarta el engine."""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+def estadisticas_pool():
+    """
+    Devuelve el estado del pool del engine compartido.
+
+    Retorna:
+    --------
+    dict
+        Claves tamano, en_uso, disponibles y desbordamiento (cuando el pool las
+        expone) y estado con el texto de pool.status().
+    """
+    if _engine is None:
+        return {'estado': 'sin crear'}
+    pool = _engine.pool
+    estadisticas = {'estado': pool.status()}
+    for clave, metodo in (('tamano', 'size'), ('en_uso', 'checkedout'),
+                          ('disponibles', 'checkedin'), ('desbordamiento', 'overflow')):
+        if callable(getattr(pool, metodo, None)):
+            estadisticas[clave] = getattr(pool, metodo)()
+    return estadisticas
+
 def conectar_sql_server():
     """
     Crea una conexión a SQL Server utilizando SQLAlchemy y pyodbc.
@@ -13,26 +190,29 @@ def conectar_sql_server():
     Retorna:
     --------
     engine : sqlalchemy.engine.Engine
-        Objeto engine de SQLAlchemy para interactuar con la base de datos.
+        Engine compartido del proceso (ver obtener_engine), tras comprobar que
+        se puede abrir una conexión.
     """
-    mySQLPasssord = os.getenv('SQL_PASSWORD').replace("@", "%40")
-    engineURL = f"mssql+pyodbc://{os.getenv('SQL_USER')}:{mySQLPasssord}@{os.getenv('SQL_SERVER')}:{os.getenv('SQL_PORT')}/{os.getenv('SQL_DATABASE')}?driver=/opt/homebrew/lib/libmsodbcsql.18.dylib&TrustServerCertificate=yes"
-
-    engine = create_engine(engineURL)  
+    engine = obtener_engine()
     
     try:
-        engine.connect()
-        print("Conexión exitosa")
+        with engine.connect():
+            pass
+        logger.info("Conexión exitosa")
           
         return engine
     
     except SQLAlchemyError as e:
-        print(f"Error de SQLAlchemy: {str(e)}")
+        logger.error("Error de SQLAlchemy: %s", e)
         raise
     except Exception as e:
-        print(f"Error al conectar con SQL Server: {str(e)}")
+        logger.error("Error al conectar con SQL Server: %s", e)
         raise
 
+def _sentencia(consulta):
+    """Acepta una cadena SQL o una sentencia ya construida con text()."""
+    return text(consulta) if isinstance(consulta, str) else consulta
+
 def ejecutar_consulta(engine, consulta, parametros=None):
     """
     Ejecuta una consulta SQL y devuelve los resultados.
@@ -48,24 +228,183 @@ def ejecutar_consulta(engine, consulta, parametros=None):
     
     Retorna:
     --------
-    list
-        Lista de diccionarios con los resultados de la consulta.
+    pandas.DataFrame
+        DataFrame con los resultados de la consulta.
     
     Ejemplo:
     --------
-    >>> engine = conectar_sql_server('SERVIDOR', 'MiBaseDeDatos', 'usuario', 'contraseña')
+    >>> engine = conectar_sql_server()
     >>> resultados = ejecutar_consulta(engine, "SELECT * FROM Clientes WHERE Ciudad = :ciudad", {"ciudad": "Madrid"})
     """
     try:
         with engine.connect() as conn:
-            if parametros:
-                result = pd.read_sql(text(consulta), parametros)
-            else:
-                result = pd.read_sql(consulta, engine)
-            
-            # Convertir resultados a lista de diccionarios
-            return result
+            return pd.read_sql(_sentencia(consulta), conn, params=parametros)
     
     except SQLAlchemyError as e:
-        print(f"Error al ejecutar la consulta: {str(e)}")
+        logger.error("Error al ejecutar la consulta: %s", e)
+        raise
+
+def ejecutar_consulta_analitica(consulta, parametros=None, motor=None, engine=None):
+    """
+    Ejecuta una consulta de análisis en el motor configurado.
+
+    Con motor 'sqlserver' (por defecto) equivale a ejecutar_consulta. Con
+    'duckdb' la consulta T-SQL se traduce y se ejecuta en local sobre el espejo
+    Parquet de scripts/espejo_columnar.py, sin tocar SQL Server.
+
+    Parámetros:
+    -----------
+    consulta : str
+        Consulta T-SQL, p. ej. el contenido de scripts/Queries/EDA1.sql.
+    parametros : dict, opcional
+        Diccionario con los parámetros :nombre de la consulta.
+    motor : str, opcional
+        'sqlserver' o 'duckdb'. Por defecto ANALITICA_MOTOR o 'sqlserver'.
+    engine : sqlalchemy.engine.Engine, opcional
+        Engine para el motor 'sqlserver'. Por defecto el compartido (obtener_engine).
+
+    Retorna:
+    --------
+    pandas.DataFrame
+        DataFrame con los resultados de la consulta.
+
+    Ejemplo:
+    --------
+    >>> with open('scripts/Queries/ProfileQueryWithAggregations.sql') as f:
+    ...     perfil = ejecutar_consulta_analitica(f.read(), motor='duckdb')
+    """
+    motor = (motor or os.getenv('ANALITICA_MOTOR', 'sqlserver')).lower()
+    if motor == 'duckdb':
+        try:
+            from .espejo_columnar import ejecutar_consulta_duckdb
+        except ImportError:
+            from espejo_columnar import ejecutar_consulta_duckdb
+        inicio = time.perf_counter()
+        try:
+            return ejecutar_consulta_duckdb(consulta, parametros)
+        finally:
+            observar('consulta_analitica_segundos', time.perf_counter() - inicio, motor='duckdb')
+    if motor != 'sqlserver':
+        raise ValueError(f"Motor analítico no válido: {motor} (usa 'sqlserver' o 'duckdb')")
+    return ejecutar_consulta(engine or obtener_engine(), consulta, parametros)
+
+def ejecutar_consulta_por_lotes(engine, consulta, parametros=None, tamano_lote=None, formato='pandas', esquema=None):
+    """
+    Ejecuta una consulta SQL y devuelve los resultados en bloques de tamaño fijo.
+
+    Usa un cursor de servidor (stream_results) que va trayendo las filas según
+    se consumen, de modo que la memoria no depende del tamaño del resultado y el
+    primer bloque se puede procesar antes de que termine la consulta.
+
+    Parámetros:
+    -----------
+    engine : sqlalchemy.engine.Engine
+        Objeto engine de SQLAlchemy.
+    consulta : str
+        Consulta SQL a ejecutar.
+    parametros : dict, opcional
+        Diccionario con los parámetros para la consulta.
+    tamano_lote : int, opcional
+        Filas por bloque (y por viaje al servidor). Por defecto
+        CONSULTA_TAMANO_LOTE o 50000.
+    formato : str, opcional
+        'pandas' para DataFrames o 'arrow' para pyarrow.RecordBatch.
+    esquema : pyarrow.Schema, opcional
+        Solo con formato='arrow': tipos de las columnas, en el orden de la consulta.
+        Todos los bloques se convierten a este esquema. Sin él, cada columna toma
+        el tipo de su primer valor no nulo: si alguna llega entera a NULL en los
+        primeros bloques, estos se retienen hasta conocer su tipo y se emiten
+        después convertidos. Las columnas que no traen ningún valor quedan como
+        texto (string).
+
+    Retorna:
+    --------
+    generator
+        Bloques con como máximo tamano_lote filas. La conexión se devuelve al
+        pool al agotar el generador o al cerrarlo. En formato 'arrow' todos los
+        RecordBatch comparten esquema, así que se pueden escribir seguidos en un
+        mismo fichero Parquet o flujo IPC.
+
+    Ejemplo:
+    --------
+    >>> for bloque in ejecutar_consulta_por_lotes(engine, "SELECT * FROM AVdata.StockPrices WHERE SymbolID = :id", {"id": 1}):
+    ...     procesar(bloque)
+    """
+    if formato not in ('pandas', 'arrow'):
+        raise ValueError("formato debe ser 'pandas' o 'arrow'.")
+    if esquema is not None and formato != 'arrow':
+        raise ValueError("esquema solo se admite con formato='arrow'.")
+    if tamano_lote is None:
+        tamano_lote = int(os.getenv('CONSULTA_TAMANO_LOTE', TAMANO_LOTE_LECTURA_POR_DEFECTO))
+    return _generar_lotes(engine, _sentencia(consulta), parametros or {}, tamano_lote, formato, esquema)
+
+def _lote_arrow(columnas, filas, esquema):
+    """Convierte filas a un RecordBatch con el esquema dado (o inferido, si es None)."""
+    import pyarrow as pa
+
+    arrays = [pa.array(valores) for valores in zip(*filas)]
+    if esquema is None:
+        return pa.RecordBatch.from_arrays(arrays, names=columnas)
+    return _convertir_arrays(arrays, esquema)
+
+def _convertir_arrays(arrays, esquema):
+    """Crea un RecordBatch con el esquema dado convirtiendo los arrays que no coinciden."""
+    import pyarrow as pa
+
+    try:
+        # pa.array(..., type=) no acepta, p. ej., Decimal -> float64; cast sí
+        arrays = [array if array.type == campo.type else array.cast(campo.type)
+                  for array, campo in zip(arrays, esquema)]
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+        raise ValueError(f"Un bloque no se puede convertir al esquema {esquema}: {e}. "
+                         "Pasa esquema= con los tipos de las columnas.") from e
+    return pa.RecordBatch.from_arrays(arrays, schema=esquema)
+
+def _inferir_esquema(lotes, final=False):
+    """
+    Esquema con el tipo del primer valor no nulo de cada columna de los bloques.
+
+    Retorna None si alguna columna solo ha traído NULL, salvo con final=True
+    (no quedan bloques por leer): entonces esas columnas se fijan como string.
+    """
+    import pyarrow as pa
+
+    campos = []
+    for i, campo in enumerate(lotes[0].schema):
+        tipo = next((lote.schema.field(i).type for lote in lotes
+                     if not pa.types.is_null(lote.schema.field(i).type)), None)
+        if tipo is None:
+            if not final:
+                return None
+            tipo = pa.string()
+        campos.append(campo.with_type(tipo))
+    return pa.schema(campos)
+
+def _generar_lotes(engine, sentencia, parametros, tamano_lote, formato, esquema=None):
+    try:
+        with engine.connect() as conn:
+            resultado = conn.execution_options(stream_results=True, max_row_buffer=tamano_lote) \
+                            .execute(sentencia, parametros)
+            columnas = list(resultado.keys())
+            if esquema is not None and esquema.names != columnas:
+                raise ValueError(f"El esquema ({esquema.names}) no coincide con las columnas de la consulta ({columnas}).")
+            # Sin esquema explícito se infiere en cuanto todas las columnas han traído algún
+            # valor; hasta entonces se retienen los bloques leídos (normalmente solo el primero)
+            pendientes = []
+            for filas in resultado.partitions(tamano_lote):
+                if formato != 'arrow':
+                    yield pd.DataFrame.from_records(filas, columns=columnas)
+                elif esquema is not None:
+                    yield _lote_arrow(columnas, filas, esquema)
+                else:
+                    pendientes.append(_lote_arrow(columnas, filas, None))
+                    esquema = _inferir_esquema(pendientes)
+                    if esquema is not None:
+                        yield from (_convertir_arrays(lote.columns, esquema) for lote in pendientes)
+                        pendientes = []
+            if pendientes:
+                esquema = _inferir_esquema(pendientes, final=True)
+                yield from (_convertir_arrays(lote.columns, esquema) for lote in pendientes)
+    except SQLAlchemyError as e:
+        logger.error("Error al ejecutar la consulta: %s", e)
         raise
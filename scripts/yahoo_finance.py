@@ -1,10 +1,20 @@
 """
 Módulo para descargar datos históricos de Yahoo Finance.
 """
+import logging
 import yfinance as yf
 import pandas as pd
 from datetime import datetime, timedelta
 
+try:
+    from .metricas import contar, cronometro
+    from .registro_simbolos import obtener_registro
+except ImportError:
+    from metricas import contar, cronometro
+    from registro_simbolos import obtener_registro
+
+logger = logging.getLogger('alphavantage.yahoo_finance')
+
 def descargar_datos_yahoo(symbol, periodo_inicio=None, periodo_fin=None, intervalo="1d"):
     """
     Descarga datos históricos de un símbolo bursátil desde Yahoo Finance.
@@ -55,20 +65,21 @@ def descargar_datos_yahoo(symbol, periodo_inicio=None, periodo_fin=None, interva
         if periodo_fin is None:
             periodo_fin = datetime.now().strftime('%Y-%m-%d')
         
-        # Validar el símbolo
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
-        
-        # Verificar si el símbolo existe
-        if 'regularMarketPrice' not in info and 'previousClose' not in info:
-            print(f"Advertencia: El símbolo '{symbol}' podría no ser válido o no tener datos disponibles.")
+        # Verificar el símbolo contra el registro local (sin llamada a ticker.info);
+        # la validación en red se hace en bloque con RegistroSimbolos.actualizar
+        if obtener_registro().es_valido(symbol) is False:
+            logger.warning("El símbolo '%s' podría no ser válido o no tener datos disponibles.", symbol)
         
         # Descargar los datos históricos
-        df = ticker.history(start=periodo_inicio, end=periodo_fin, interval=intervalo)
+        with cronometro('yahoo_descarga_segundos', {'symbol': symbol}, intervalo=intervalo) as detalle:
+            ticker = yf.Ticker(symbol)
+            df = ticker.history(start=periodo_inicio, end=periodo_fin, interval=intervalo)
+            detalle['filas'] = len(df)
+        contar('yahoo_filas', len(df), intervalo=intervalo)
         
         # Verificar si se obtuvieron datos
         if df.empty:
-            print(f"No se encontraron datos para el símbolo '{symbol}' en el período especificado.")
+            logger.warning("No se encontraron datos para el símbolo '%s' en el período especificado.", symbol)
             return df
         
         # Resetear el índice para que la fecha sea una columna
@@ -79,13 +90,81 @@ def descargar_datos_yahoo(symbol, periodo_inicio=None, periodo_fin=None, interva
             df = df.reset_index()
             df = df.rename(columns={'index': 'Date'})
         
-        print(f"Datos descargados exitosamente para '{symbol}' desde {periodo_inicio} hasta {periodo_fin}")
+        logger.info("Datos descargados exitosamente para '%s' desde %s hasta %s", symbol, periodo_inicio, periodo_fin)
         return df
     
     except Exception as e:
-        print(f"Error al descargar datos de Yahoo Finance: {str(e)}")
+        contar('yahoo_errores', intervalo=intervalo)
+        logger.error("Error al descargar datos de Yahoo Finance: %s", e)
+        raise
+
+def descargar_datos_yahoo_lote(simbolos, periodo_inicio=None, periodo_fin=None, intervalo="1d", registro=None):
+    """
+    Descarga en una sola petición los históricos de varios símbolos.
+
+    Los símbolos pasan antes por el registro de validación (filtrar_validos):
+    solo se validan contra la red los desconocidos o caducados y los no válidos
+    se omiten de la petición.
+
+    Parámetros:
+    -----------
+    simbolos : list
+        Lista de símbolos bursátiles.
+    periodo_inicio, periodo_fin, intervalo :
+        Igual que en descargar_datos_yahoo.
+    registro : RegistroSimbolos, opcional
+        Registro de validación. Por defecto el compartido por el proceso.
+
+    Retorna:
+    --------
+    dict
+        Diccionario {symbol: DataFrame} con el mismo formato que descargar_datos_yahoo
+        (precios ajustados, dividendos y splits, fechas con zona horaria).
+        Los símbolos sin datos no aparecen.
+
+    Ejemplo:
+    --------
+    >>> datos = descargar_datos_yahoo_lote(['AAPL', 'MSFT', 'NVDA'], '2024-01-01', '2024-12-31')
+    >>> datos['AAPL'].head()
+    """
+    if periodo_inicio is None:
+        periodo_inicio = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+    if periodo_fin is None:
+        periodo_fin = datetime.now().strftime('%Y-%m-%d')
+
+    registro = registro or obtener_registro()
+    tareas = registro.filtrar_validos([{'Symbol': symbol} for symbol in dict.fromkeys(simbolos)])
+    simbolos = [tarea['Symbol'] for tarea in tareas]
+    if not simbolos:
+        return {}
+
+    try:
+        # Mismos ajustes que Ticker.history: precios ajustados, acciones corporativas y zona horaria
+        with cronometro('yahoo_lote_segundos', {'simbolos': len(simbolos)}, intervalo=intervalo):
+            datos = yf.download(simbolos, start=periodo_inicio, end=periodo_fin, interval=intervalo,
+                                group_by='ticker', auto_adjust=True, actions=True, ignore_tz=False,
+                                multi_level_index=True, progress=False)
+    except Exception as e:
+        contar('yahoo_errores', intervalo=intervalo)
+        logger.error("Error al descargar el lote de Yahoo Finance: %s", e)
         raise
 
+    resultado = {}
+    for symbol in simbolos:
+        if datos is None or symbol not in datos.columns.get_level_values(0):
+            continue
+        df = datos[symbol].dropna(how='all')
+        if df.empty:
+            continue
+        df = df.rename_axis('Date').reset_index()
+        df.columns.name = None
+        resultado[symbol] = df
+        contar('yahoo_filas', len(df), intervalo=intervalo)
+
+    logger.info("Lote descargado: %d de %d símbolos con datos desde %s hasta %s", len(resultado), len(simbolos),
+                periodo_inicio, periodo_fin)
+    return resultado
+
 def guardar_datos(df, formato='csv', ruta_archivo=None, symbol=None):
     """
     Guarda los datos descargados en un archivo.
@@ -95,7 +174,9 @@ def guardar_datos(df, formato='csv', ruta_archivo=None, symbol=None):
     df : pandas.DataFrame
         DataFrame con los datos a guardar.
     formato : str, opcional
-        Formato del archivo ('csv' o 'excel'). Por defecto es 'csv'.
+        Formato del archivo ('csv', 'excel' o 'parquet'). Por defecto es 'csv'.
+        Para históricos grandes conviene 'parquet' (comprimido y con tipos);
+        para exportar desde la base de datos ver exportacion.exportar_tabla.
     ruta_archivo : str, opcional
         Ruta completa donde guardar el archivo. Si no se especifica,
         se generará automáticamente basado en el símbolo y la fecha actual.
@@ -108,7 +189,7 @@ def guardar_datos(df, formato='csv', ruta_archivo=None, symbol=None):
         Ruta del archivo guardado.
     """
     if df.empty:
-        print("No hay datos para guardar.")
+        logger.warning("No hay datos para guardar.")
         return None
     
     # Generar nombre de archivo si no se especifica
@@ -121,8 +202,10 @@ def guardar_datos(df, formato='csv', ruta_archivo=None, symbol=None):
             ruta_archivo = f"{symbol}_{fecha_actual}.csv"
         elif formato.lower() == 'excel':
             ruta_archivo = f"{symbol}_{fecha_actual}.xlsx"
+        elif formato.lower() == 'parquet':
+            ruta_archivo = f"{symbol}_{fecha_actual}.parquet"
         else:
-            raise ValueError("Formato no soportado. Use 'csv' o 'excel'.")
+            raise ValueError("Formato no soportado. Use 'csv', 'excel' o 'parquet'.")
     
     try:
         # Guardar según el formato
@@ -130,10 +213,12 @@ def guardar_datos(df, formato='csv', ruta_archivo=None, symbol=None):
             df.to_csv(ruta_archivo, index=False)
         elif formato.lower() == 'excel':
             df.to_excel(ruta_archivo, index=False)
+        elif formato.lower() == 'parquet':
+            df.to_parquet(ruta_archivo, index=False, compression='zstd')
         
-        print(f"Datos guardados exitosamente en '{ruta_archivo}'")
+        logger.info("Datos guardados exitosamente en '%s'", ruta_archivo)
         return ruta_archivo
     
     except Exception as e:
-        print(f"Error al guardar los datos: {str(e)}")
+        logger.error("Error al guardar los datos: %s", e)
         raise
@@ -0,0 +1,24 @@
+CREATE TABLE [AVdata].[StockFeatures] (
+    [SymbolID]              INT         NOT NULL,
+    [Date]                  DATE        NOT NULL,
+    [MonthlyAvg_Close]      FLOAT (53)  NULL,
+    [MonthlyStdDev_Close]   FLOAT (53)  NULL,
+    [MonthlyAvg_Volume]     FLOAT (53)  NULL,
+    [MonthlyStdDev_Volume]  FLOAT (53)  NULL,
+    [MA_20d_Close]          FLOAT (53)  NULL,
+    [MA_50d_Close]          FLOAT (53)  NULL,
+    [Volatility_20d_Close]  FLOAT (53)  NULL,
+    [PrevDay_Close]         FLOAT (53)  NULL,
+    [PctChange_Close_Daily] FLOAT (53)  NULL,
+    [DailyRange]            FLOAT (53)  NULL,
+    [DayOfWeek]             TINYINT     NULL,
+    [DayOfMonth]            TINYINT     NULL,
+    [Month]                 TINYINT     NULL,
+    [CreatedDate]           DATETIME    DEFAULT (getdate()) NULL,
+    CONSTRAINT [PK_StockFeatures] PRIMARY KEY CLUSTERED ([SymbolID] ASC, [Date] ASC),
+    CONSTRAINT [FK_StockFeatures_Symbols] FOREIGN KEY ([SymbolID]) REFERENCES [Metadata].[Symbols] ([SymbolID])
+);
+
+
+GO
+
@@ -0,0 +1,13 @@
+CREATE TABLE [AVdata].[StockFeaturesState] (
+    [SymbolID]          INT             NOT NULL,
+    [LastDate]          DATE            NOT NULL,
+    [DefinitionVersion] INT             NOT NULL,
+    [State]             NVARCHAR (MAX)  NOT NULL,
+    [UpdatedDate]       DATETIME        DEFAULT (getdate()) NULL,
+    CONSTRAINT [PK_StockFeaturesState] PRIMARY KEY CLUSTERED ([SymbolID] ASC),
+    CONSTRAINT [FK_StockFeaturesState_Symbols] FOREIGN KEY ([SymbolID]) REFERENCES [Metadata].[Symbols] ([SymbolID])
+);
+
+
+GO
+
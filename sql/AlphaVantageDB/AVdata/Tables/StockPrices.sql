@@ -8,15 +8,24 @@ CREATE TABLE [AVdata].[StockPrices] (
     [Close]         DECIMAL (18, 6) NULL,
     [Volume]        BIGINT          NULL,
     [CreatedDate]   DATETIME        DEFAULT (getdate()) NULL,
-    PRIMARY KEY CLUSTERED ([PriceID] ASC),
+    -- Clave agrupada por símbolo y fecha: una barra por día y lecturas de rango con un solo seek
+    CONSTRAINT [PK_StockPrices] PRIMARY KEY CLUSTERED ([SymbolID] ASC, [Date] ASC) WITH (DATA_COMPRESSION = PAGE),
     CONSTRAINT [FK_StockPrices_Symbols] FOREIGN KEY ([SymbolID]) REFERENCES [Metadata].[Symbols] ([SymbolID])
 );
 
 
 GO
 
-CREATE NONCLUSTERED INDEX [IX_StockPrices_SymbolDate]
-    ON [AVdata].[StockPrices]([SymbolID] ASC, [Date] ASC);
+CREATE UNIQUE NONCLUSTERED INDEX [UX_StockPrices_PriceID]
+    ON [AVdata].[StockPrices]([PriceID] ASC);
+
+
+GO
+
+-- Barras escritas desde una fecha por símbolo: el almacén de características detecta
+-- las correcciones sin recorrer el histórico (las columnas de la clave agrupada van incluidas)
+CREATE NONCLUSTERED INDEX [IX_StockPrices_SymbolCreated]
+    ON [AVdata].[StockPrices]([SymbolID] ASC, [CreatedDate] ASC) WITH (DATA_COMPRESSION = PAGE);
 
 
 GO
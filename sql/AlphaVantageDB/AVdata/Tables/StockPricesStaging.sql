@@ -0,0 +1,18 @@
+-- Tabla intermedia de carga: carga_masiva.fusionar_precios inserta aquí cada lote
+-- con su LoteID, aplica un MERGE sobre AVdata.StockPrices y borra el lote.
+CREATE TABLE [AVdata].[StockPricesStaging] (
+    [LoteID]        UNIQUEIDENTIFIER NOT NULL,
+    [SymbolID]      INT             NOT NULL,
+    [Date]          DATE            NOT NULL,
+    [Open]          DECIMAL (18, 6) NULL,
+    [High]          DECIMAL (18, 6) NULL,
+    [Low]           DECIMAL (18, 6) NULL,
+    [Close]         DECIMAL (18, 6) NULL,
+    [Volume]        BIGINT          NULL,
+    [CreatedDate]   DATETIME        NOT NULL,
+    CONSTRAINT [PK_StockPricesStaging] PRIMARY KEY CLUSTERED ([LoteID] ASC, [SymbolID] ASC, [Date] ASC)
+);
+
+
+GO
+
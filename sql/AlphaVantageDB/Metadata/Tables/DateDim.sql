@@ -8,5 +8,7 @@ CREATE TABLE [Metadata].[DateDim]
   [NombreMes] VARCHAR(25) NOT NULL,
   [MesAno] VARCHAR(7) NOT NULL,
   [SemanaAno] INT NOT NULL,
-  [NombreDia] VARCHAR(25)
+  [NombreDia] VARCHAR(25),
+  -- 1 si hay sesión en NYSE/Nasdaq (scripts/calendario_bursatil.py)
+  [EsDiaHabil] BIT NOT NULL CONSTRAINT [DF_DateDim_EsDiaHabil] DEFAULT (0)
 )
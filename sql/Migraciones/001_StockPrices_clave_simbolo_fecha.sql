@@ -0,0 +1,91 @@
+-- =============================================================================
+-- Migración 001: AVdata.StockPrices agrupada por (SymbolID, Date)
+--
+-- Lleva una base existente al esquema de sql/AlphaVantageDB:
+--   1. Elimina las barras duplicadas por (SymbolID, Date), conservando la más reciente.
+--   2. Sustituye la clave agrupada sobre PriceID por PK_StockPrices (SymbolID, Date)
+--      con compresión PAGE; PriceID se mantiene con un índice único no agrupado.
+--   3. Elimina IX_StockPrices_SymbolDate, que queda redundante.
+--   4. Crea AVdata.StockPricesStaging para la carga con MERGE (carga_masiva.fusionar_precios).
+--   5. Opcional: índice columnstore no agrupado para las consultas de análisis
+--      sobre todo el histórico (@CrearColumnstore = 1).
+--
+-- Es reejecutable: cada paso comprueba si ya está aplicado. Conviene lanzarla
+-- en una ventana sin cargas, porque reconstruye la tabla completa.
+-- =============================================================================
+USE [AlphaVantageDB];
+GO
+
+SET XACT_ABORT ON;
+SET NOCOUNT ON;
+
+DECLARE @CrearColumnstore BIT = 0;
+
+BEGIN TRANSACTION;
+
+-- 1. Duplicados: se queda la barra escrita más tarde
+;WITH Duplicados AS (
+    SELECT ROW_NUMBER() OVER (PARTITION BY SymbolID, [Date] ORDER BY CreatedDate DESC, PriceID DESC) AS Orden
+    FROM [AVdata].[StockPrices]
+)
+DELETE FROM Duplicados WHERE Orden > 1;
+PRINT CONCAT('Barras duplicadas eliminadas: ', @@ROWCOUNT);
+
+-- 2 y 3. Clave agrupada. La PK original sobre PriceID tiene nombre generado por el sistema
+IF NOT EXISTS (SELECT 1 FROM sys.key_constraints
+               WHERE name = 'PK_StockPrices' AND parent_object_id = OBJECT_ID('[AVdata].[StockPrices]'))
+BEGIN
+    DECLARE @pk_actual SYSNAME = (
+        SELECT name FROM sys.key_constraints
+        WHERE type = 'PK' AND parent_object_id = OBJECT_ID('[AVdata].[StockPrices]')
+    );
+    IF @pk_actual IS NOT NULL
+        EXEC ('ALTER TABLE [AVdata].[StockPrices] DROP CONSTRAINT [' + @pk_actual + ']');
+
+    IF EXISTS (SELECT 1 FROM sys.indexes
+               WHERE name = 'IX_StockPrices_SymbolDate' AND object_id = OBJECT_ID('[AVdata].[StockPrices]'))
+        DROP INDEX [IX_StockPrices_SymbolDate] ON [AVdata].[StockPrices];
+
+    ALTER TABLE [AVdata].[StockPrices]
+        ADD CONSTRAINT [PK_StockPrices] PRIMARY KEY CLUSTERED ([SymbolID] ASC, [Date] ASC)
+        WITH (DATA_COMPRESSION = PAGE, SORT_IN_TEMPDB = ON);
+    PRINT 'PK_StockPrices (SymbolID, Date) creada.';
+END
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes
+               WHERE name = 'UX_StockPrices_PriceID' AND object_id = OBJECT_ID('[AVdata].[StockPrices]'))
+    CREATE UNIQUE NONCLUSTERED INDEX [UX_StockPrices_PriceID]
+        ON [AVdata].[StockPrices]([PriceID] ASC);
+
+-- 4. Tabla de staging para el MERGE
+IF OBJECT_ID('[AVdata].[StockPricesStaging]') IS NULL
+BEGIN
+    CREATE TABLE [AVdata].[StockPricesStaging] (
+        [LoteID]        UNIQUEIDENTIFIER NOT NULL,
+        [SymbolID]      INT             NOT NULL,
+        [Date]          DATE            NOT NULL,
+        [Open]          DECIMAL (18, 6) NULL,
+        [High]          DECIMAL (18, 6) NULL,
+        [Low]           DECIMAL (18, 6) NULL,
+        [Close]         DECIMAL (18, 6) NULL,
+        [Volume]        BIGINT          NULL,
+        [CreatedDate]   DATETIME        NOT NULL,
+        CONSTRAINT [PK_StockPricesStaging] PRIMARY KEY CLUSTERED ([LoteID] ASC, [SymbolID] ASC, [Date] ASC)
+    );
+    PRINT 'AVdata.StockPricesStaging creada.';
+END
+
+COMMIT TRANSACTION;
+
+-- 5. Columnstore opcional (fuera de la transacción: es una operación larga y se
+-- puede crear o descartar por separado). Acelera EDA1/EDA2 y los perfiles, que
+-- leen columnas de todo el histórico; las lecturas por símbolo siguen usando la PK.
+IF @CrearColumnstore = 1
+   AND NOT EXISTS (SELECT 1 FROM sys.indexes
+                   WHERE name = 'NCCI_StockPrices' AND object_id = OBJECT_ID('[AVdata].[StockPrices]'))
+BEGIN
+    CREATE NONCLUSTERED COLUMNSTORE INDEX [NCCI_StockPrices]
+        ON [AVdata].[StockPrices] ([SymbolID], [Date], [Open], [High], [Low], [Close], [Volume]);
+    PRINT 'NCCI_StockPrices creado.';
+END
+GO
@@ -0,0 +1,18 @@
+-- =============================================================================
+-- Migración 002: columna EsDiaHabil en Metadata.DateDim
+--
+-- Añade el indicador de sesión de mercado. Después hay que recargar el
+-- calendario con:
+--     python scripts/calendario_bursatil.py
+-- que sustituye a scripts/Queries/LlenarDateDim.sql.
+-- =============================================================================
+USE [AlphaVantageDB];
+GO
+
+IF COL_LENGTH('Metadata.DateDim', 'EsDiaHabil') IS NULL
+BEGIN
+    ALTER TABLE [Metadata].[DateDim]
+        ADD [EsDiaHabil] BIT NOT NULL CONSTRAINT [DF_DateDim_EsDiaHabil] DEFAULT (0);
+    PRINT 'Metadata.DateDim.EsDiaHabil añadida.';
+END
+GO
@@ -0,0 +1,24 @@
+-- =============================================================================
+-- Migración 003: índice (SymbolID, CreatedDate) en AVdata.StockPrices
+--
+-- almacen_caracteristicas.actualizar_caracteristicas busca en cada ejecución
+-- las barras escritas después del punto de control de cada símbolo
+-- (CreatedDate > StockFeaturesState.UpdatedDate). Sin este índice esa búsqueda
+-- recorre el histórico completo de todos los símbolos; con él solo lee las
+-- barras escritas desde la última actualización.
+--
+-- Requiere la migración 001 (clave agrupada (SymbolID, Date), que el índice
+-- incluye). Es reejecutable.
+-- =============================================================================
+USE [AlphaVantageDB];
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes
+               WHERE name = 'IX_StockPrices_SymbolCreated' AND object_id = OBJECT_ID('[AVdata].[StockPrices]'))
+BEGIN
+    CREATE NONCLUSTERED INDEX [IX_StockPrices_SymbolCreated]
+        ON [AVdata].[StockPrices]([SymbolID] ASC, [CreatedDate] ASC)
+        WITH (DATA_COMPRESSION = PAGE, SORT_IN_TEMPDB = ON);
+    PRINT 'IX_StockPrices_SymbolCreated creado.';
+END
+GO
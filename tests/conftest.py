@@ -0,0 +1,19 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Los módulos de scripts/ se importan como módulos sueltos (igual que al ejecutarlos)
+sys.path.insert(0, os.path.join(RAIZ, 'scripts'))
+
+
+@pytest.fixture(scope='module')
+def webapp():
+    """webapp/app.py cargado como módulo (importa scripts.* desde la raíz del proyecto)."""
+    spec = importlib.util.spec_from_file_location('webapp_app', os.path.join(RAIZ, 'webapp', 'app.py'))
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
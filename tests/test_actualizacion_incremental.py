@@ -0,0 +1,168 @@
+"""Actualización incremental: tramos pendientes, descarga desde la última barra y huecos según el calendario."""
+import threading
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+from sqlalchemy import bindparam, text
+from sqlalchemy.types import Date
+
+from actualizacion_incremental import (actualizar_incremental, detectar_huecos, obtener_ultimas_fechas,
+                                       planificar_descargas, rellenar_huecos)
+from calendario_bursatil import cargar_date_dim, sesiones
+from carga_masiva import fusionar_precios
+from entorno_sintetico import ProveedorSintetico, crear_engine_local, generar_ohlcv, registrar_simbolos
+
+BORRAR_BARRA_SQL = text('DELETE FROM AVdata.StockPrices WHERE SymbolID = :symbol_id AND [Date] = :fecha').bindparams(
+    bindparam('fecha', type_=Date()))
+
+
+class ProveedorRegistrado(ProveedorSintetico):
+    """ProveedorSintetico que guarda cada petición (symbol, inicio, fin)."""
+
+    def __init__(self, datos, hasta=None):
+        super().__init__(datos, hasta=hasta)
+        self.llamadas = []
+        self._lock = threading.Lock()
+
+    def __call__(self, symbol, periodo_inicio=None, periodo_fin=None, intervalo="1d"):
+        with self._lock:
+            self.llamadas.append((symbol, periodo_inicio, periodo_fin))
+        return super().__call__(symbol, periodo_inicio, periodo_fin, intervalo)
+
+
+def _ultimas(*filas):
+    return pd.DataFrame(filas, columns=['SymbolID', 'Symbol', 'UltimaFecha'])
+
+
+def _solo_sesiones(datos, desde, hasta):
+    """Barras de las sesiones de mercado entre desde y hasta (sin festivos)."""
+    validas = sesiones(desde, hasta)
+    return {symbol: df[df['Date'].dt.tz_localize(None).isin(validas)].reset_index(drop=True)
+            for symbol, df in datos.items()}
+
+
+def _tramos(tareas):
+    return [(tarea['SymbolID'], tarea['inicio'], tarea['fin'], tarea['sesiones']) for tarea in tareas]
+
+
+@pytest.fixture
+def con_huecos(tmp_path):
+    engine = crear_engine_local(str(tmp_path))
+    cargar_date_dim(engine, '2024-01-01', '2024-12-31')
+    datos = _solo_sesiones(generar_ohlcv(['AAPL', 'MSFT', 'NVDA', 'TSLA'], 1, fecha_fin='2024-07-31', semilla=5),
+                           '2024-06-03', '2024-07-31')
+    registrar_simbolos(engine, list(datos))
+    for symbol_id, (symbol, df) in enumerate(datos.items(), 1):
+        # NVDA empieza más tarde: las sesiones anteriores a su primera barra no son huecos
+        fusionar_precios(engine, df[df['Date'].dt.month == 7] if symbol == 'NVDA' else df, symbol_id)
+    borradas = [
+        # AAPL: las sesiones a ambos lados del festivo del 4 de julio forman un solo hueco
+        (1, date(2024, 7, 3)), (1, date(2024, 7, 5)),
+        # MSFT: dos huecos a 2 sesiones de distancia y otro de 2 sesiones seguidas mucho después
+        (2, date(2024, 6, 10)), (2, date(2024, 6, 13)), (2, date(2024, 7, 22)), (2, date(2024, 7, 23)),
+        # TSLA: inactivo, su hueco no se revisa
+        (4, date(2024, 6, 18)),
+    ]
+    with engine.begin() as conn:
+        conn.execute(BORRAR_BARRA_SQL, [{'symbol_id': symbol_id, 'fecha': fecha} for symbol_id, fecha in borradas])
+        conn.execute(text('UPDATE Metadata.Symbols SET IsActive = 0 WHERE SymbolID = 4'))
+    yield engine, datos
+    engine.dispose()
+
+
+def test_planificar_descargas_guarda_el_fin_calculado():
+    ultimas = _ultimas((1, 'AAPL', date(2024, 6, 26)), (2, 'NVDA', date(2024, 6, 27)), (3, 'MSFT', None))
+    tareas = planificar_descargas(ultimas, '2024-01-01', '2024-06-28')
+    # NVDA empezaría el 28, que es el fin exclusivo: ya está al día
+    assert tareas == [
+        {'SymbolID': 1, 'Symbol': 'AAPL', 'inicio': '2024-06-27', 'fin': '2024-06-28'},
+        {'SymbolID': 3, 'Symbol': 'MSFT', 'inicio': '2024-01-01', 'fin': '2024-06-28'},
+    ]
+
+    # Sin fecha_fin cada tarea lleva la de hoy, no None
+    hoy = datetime.now().strftime('%Y-%m-%d')
+    assert [tarea['fin'] for tarea in planificar_descargas(ultimas, '2024-01-01')] == [hoy] * 3
+
+
+def _contar_filas(engine):
+    with engine.connect() as conn:
+        return dict(conn.execute(text('SELECT SymbolID, COUNT(*) FROM AVdata.StockPrices GROUP BY SymbolID')).all())
+
+
+def test_actualizar_incremental_pide_solo_lo_que_falta(tmp_path):
+    engine = crear_engine_local(str(tmp_path))
+    datos = generar_ohlcv(['AAPL', 'MSFT', 'NVDA', 'TSLA'], 1, fecha_fin='2024-06-28', semilla=6)
+    datos = {symbol: df[df['Date'].dt.tz_localize(None) >= '2024-06-03'].reset_index(drop=True)
+             for symbol, df in datos.items()}
+    registrar_simbolos(engine, list(datos))
+    hasta_el_14 = {symbol: df[df['Date'].dt.tz_localize(None) < '2024-06-15'] for symbol, df in datos.items()}
+    # AAPL a medias, MSFT al día, NVDA sin precios y TSLA a medias pero inactivo
+    fusionar_precios(engine, hasta_el_14['AAPL'], 1)
+    fusionar_precios(engine, datos['MSFT'], 2)
+    fusionar_precios(engine, hasta_el_14['TSLA'], 4)
+    with engine.begin() as conn:
+        conn.execute(text('UPDATE Metadata.Symbols SET IsActive = 0 WHERE SymbolID = 4'))
+
+    ultimas = obtener_ultimas_fechas(engine)
+    assert list(ultimas.itertuples(index=False, name=None)) == [
+        (1, 'AAPL', date(2024, 6, 14)), (2, 'MSFT', date(2024, 6, 28)), (3, 'NVDA', None)]
+
+    proveedor = ProveedorRegistrado(datos)
+    resumen = actualizar_incremental(engine, fecha_inicio_defecto='2024-06-03', fecha_fin='2024-06-29',
+                                     proveedor=proveedor, peticiones_por_segundo=1000)
+
+    # Desde el día siguiente a la última barra, o desde la fecha por defecto si no hay ninguna
+    assert sorted(proveedor.llamadas) == [('AAPL', '2024-06-15', '2024-06-29'), ('NVDA', '2024-06-03', '2024-06-29')]
+    nuevas = len(datos['AAPL']) - len(hasta_el_14['AAPL']) + len(datos['NVDA'])
+    assert resumen == {'simbolos_actualizados': 2, 'simbolos_al_dia': 1, 'filas': nuevas, 'errores': []}
+    assert _contar_filas(engine) == {1: len(datos['AAPL']), 2: len(datos['MSFT']), 3: len(datos['NVDA']),
+                                     4: len(hasta_el_14['TSLA'])}
+
+    # Todo al día: la segunda ejecución no pide nada
+    proveedor.llamadas.clear()
+    resumen = actualizar_incremental(engine, fecha_inicio_defecto='2024-06-03', fecha_fin='2024-06-29',
+                                     proveedor=proveedor, peticiones_por_segundo=1000)
+    assert proveedor.llamadas == []
+    assert resumen == {'simbolos_actualizados': 0, 'simbolos_al_dia': 3, 'filas': 0, 'errores': []}
+    engine.dispose()
+
+
+def test_detectar_huecos_por_sesiones(con_huecos):
+    engine, _ = con_huecos
+    # Los festivos (19 de junio, 4 de julio) no tienen barra en ningún símbolo y no son huecos;
+    # fin es exclusivo: el día siguiente a la última sesión que falta
+    assert _tramos(detectar_huecos(engine, '2024-06-01', '2024-07-31')) == [
+        (1, '2024-07-03', '2024-07-06', 2),
+        (2, '2024-06-10', '2024-06-14', 2),
+        (2, '2024-07-22', '2024-07-24', 2),
+    ]
+    # Sin unir los huecos cercanos, cada isla de sesiones es un tramo
+    assert _tramos(detectar_huecos(engine, '2024-06-01', '2024-07-31', unir_separados=0)) == [
+        (1, '2024-07-03', '2024-07-06', 2),
+        (2, '2024-06-10', '2024-06-11', 1),
+        (2, '2024-06-13', '2024-06-14', 1),
+        (2, '2024-07-22', '2024-07-24', 2),
+    ]
+    # El rango revisado recorta los tramos
+    assert _tramos(detectar_huecos(engine, '2024-07-01', '2024-07-03')) == [(1, '2024-07-03', '2024-07-04', 1)]
+
+
+def test_rellenar_huecos_solo_pide_los_tramos(con_huecos):
+    engine, datos = con_huecos
+    proveedor = ProveedorRegistrado(datos)
+
+    resumen = rellenar_huecos(engine, '2024-06-01', '2024-07-31', proveedor=proveedor, peticiones_por_segundo=1000)
+
+    assert sorted(proveedor.llamadas) == [('AAPL', '2024-07-03', '2024-07-06'), ('MSFT', '2024-06-10', '2024-06-14'),
+                                          ('MSFT', '2024-07-22', '2024-07-24')]
+    assert (resumen['tramos'], resumen['sesiones_faltantes'], resumen['errores']) == (3, 6, [])
+    # Las barras de MSFT entre sus dos primeros huecos ya estaban: solo se insertan las que faltaban
+    assert resumen['filas_insertadas'] == 6
+    assert sorted(resumen['symbol_ids']) == [1, 2]
+    assert detectar_huecos(engine, '2024-06-01', '2024-07-31') == []
+
+    # Sin huecos no hay peticiones
+    proveedor.llamadas.clear()
+    assert rellenar_huecos(engine, '2024-06-01', '2024-07-31', proveedor=proveedor)['tramos'] == 0
+    assert proveedor.llamadas == []
@@ -0,0 +1,106 @@
+"""AVdata.StockFeatures: la actualización incremental debe dar lo mismo que una reconstrucción."""
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from almacen_caracteristicas import (CAMBIADOS_SQL, SIN_ESTADO_SQL, actualizar_caracteristicas, leer_caracteristicas,
+                                     reconstruir_caracteristicas)
+from caracteristicas import COLUMNAS_CARACTERISTICAS
+from carga_masiva import fusionar_precios
+from entorno_sintetico import crear_engine_local, generar_ohlcv, registrar_simbolos
+
+
+@pytest.fixture
+def entorno(tmp_path):
+    engine = crear_engine_local(str(tmp_path))
+    datos = generar_ohlcv(4, 2, fecha_fin='2024-06-28', semilla=7)
+    # Una serie tipo FX (1.1 con pasos de 1e-4) junto a las acciones
+    fx = datos['MSFT']
+    pasos = np.random.default_rng(1).normal(0.0, 1e-4, len(fx))
+    fx['Close'] = 1.1 + np.cumsum(pasos)
+    fx['Open'], fx['High'], fx['Low'] = fx['Close'], fx['Close'] + 1e-4, fx['Close'] - 1e-4
+    simbolos = registrar_simbolos(engine, list(datos))
+    yield engine, datos, [s['SymbolID'] for s in simbolos]
+    engine.dispose()
+
+
+def _cargar(engine, datos, desde=None, hasta=None):
+    for symbol_id, df in enumerate(datos.values(), 1):
+        fechas = df['Date'].dt.tz_localize(None)
+        mascara = np.ones(len(df), dtype=bool)
+        if desde:
+            mascara &= fechas >= pd.Timestamp(desde)
+        if hasta:
+            mascara &= fechas < pd.Timestamp(hasta)
+        fusionar_precios(engine, df[mascara], symbol_id)
+
+
+def _comparar(a, b):
+    assert len(a) == len(b)
+    pd.testing.assert_frame_equal(a[['SymbolID', 'Date']], b[['SymbolID', 'Date']])
+    for columna in COLUMNAS_CARACTERISTICAS:
+        np.testing.assert_allclose(a[columna].to_numpy(dtype=float), b[columna].to_numpy(dtype=float),
+                                   rtol=1e-9, atol=1e-12, equal_nan=True, err_msg=columna)
+
+
+def test_incremental_igual_a_reconstruccion(entorno):
+    engine, datos, symbol_ids = entorno
+    _cargar(engine, datos, hasta='2024-03-15')
+    actualizar_caracteristicas(engine)
+    # Barras nuevas en varias tandas, una de ellas a mitad de mes
+    for desde, hasta in (('2024-03-15', '2024-04-10'), ('2024-04-10', '2024-04-11'), ('2024-04-11', None)):
+        _cargar(engine, datos, desde, hasta)
+        resumen = actualizar_caracteristicas(engine)
+        assert resumen['simbolos_reconstruidos'] == 0
+    incremental = leer_caracteristicas(engine, symbol_ids)
+
+    reconstruir_caracteristicas(engine)
+    _comparar(incremental, leer_caracteristicas(engine, symbol_ids))
+
+
+def test_barra_corregida_invalida_el_estado(entorno):
+    engine, datos, symbol_ids = entorno
+    _cargar(engine, datos)
+    actualizar_caracteristicas(engine)
+
+    corregido = datos['AAPL'].iloc[[100]].copy()
+    corregido['Close'] *= 1.5
+    estadisticas = fusionar_precios(engine, corregido, 1)
+    assert estadisticas['filas_actualizadas'] == 1
+    # La carga no toca el estado; la corrección se detecta al actualizar, solo en ese símbolo
+    with engine.connect() as conn:
+        estados = {fila[0] for fila in conn.execute(text('SELECT SymbolID FROM AVdata.StockFeaturesState'))}
+    assert estados == set(symbol_ids)
+
+    resumen = actualizar_caracteristicas(engine)
+    assert (resumen['simbolos_reconstruidos'], resumen['simbolos_actualizados']) == (1, 0)
+    assert actualizar_caracteristicas(engine)['simbolos_reconstruidos'] == 0
+    actualizado = leer_caracteristicas(engine, symbol_ids)
+    reconstruir_caracteristicas(engine)
+    _comparar(actualizado, leer_caracteristicas(engine, symbol_ids))
+
+
+def test_recargar_barras_identicas_no_invalida(entorno):
+    engine, datos, _ = entorno
+    _cargar(engine, datos)
+    actualizar_caracteristicas(engine)
+    estadisticas = fusionar_precios(engine, datos['AAPL'], 1)
+    assert estadisticas['primera_fecha_cambiada'] is None
+    assert actualizar_caracteristicas(engine) == {'simbolos_actualizados': 0, 'simbolos_reconstruidos': 0,
+                                                  'filas': 0}
+
+
+def test_deteccion_de_cambios_sin_recorrer_los_precios(entorno):
+    engine, _, _ = entorno
+    with engine.connect() as conn:
+        def plan(plantilla, **parametros):
+            sentencia = 'EXPLAIN QUERY PLAN ' + plantilla.format(filtro='')
+            return [fila[3] for fila in conn.execute(text(sentencia), parametros)]
+
+        cambiados = plan(CAMBIADOS_SQL)
+        sin_estado = plan(SIN_ESTADO_SQL, version=1)
+    # StockPrices solo se consulta por índice, nunca se recorre entera
+    assert any('IX_StockPrices_SymbolCreated (SymbolID=? AND CreatedDate>?)' in paso for paso in cambiados)
+    assert 'SCAN s' in sin_estado
+    assert not any(paso.startswith('SCAN sp') for paso in cambiados + sin_estado)
@@ -0,0 +1,87 @@
+"""Almacén en memoria: lecturas de símbolos limitadas y detección de cargas de otros procesos."""
+from sqlalchemy import event
+
+from almacen_memoria import AlmacenMemoria
+from carga_masiva import fusionar_precios
+from entorno_sintetico import crear_engine_local, generar_ohlcv, registrar_simbolos
+
+
+def _contador_lecturas_simbolos(engine):
+    lecturas = []
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _contar(conn, cursor, sentencia, parametros, contexto, executemany):
+        if 'FROM Metadata.Symbols' in sentencia:
+            lecturas.append(sentencia)
+
+    return lecturas
+
+
+def test_simbolos_desconocidos_recargan_como_mucho_una_vez_por_intervalo(tmp_path):
+    engine = crear_engine_local(str(tmp_path))
+    registrar_simbolos(engine, ['AAPL', 'MSFT'])
+    lecturas = _contador_lecturas_simbolos(engine)
+    almacen = AlmacenMemoria(engine, recarga_simbolos=3600)
+
+    assert almacen.id_de('AAPL') == 1
+    for _ in range(50):
+        assert almacen.id_de('NOEXISTE') is None
+        assert almacen.symbol_de(999) is None
+    assert len(lecturas) == 1
+
+    # Sin recarga: nunca se consulta la base de datos
+    almacen.invalidar()
+    assert almacen.id_de('NOEXISTE', recargar=False) is None
+    assert len(lecturas) == 2
+    engine.dispose()
+
+
+def test_simbolo_nuevo_visible_tras_el_intervalo(tmp_path):
+    engine = crear_engine_local(str(tmp_path))
+    registrar_simbolos(engine, ['AAPL'])
+    almacen = AlmacenMemoria(engine, recarga_simbolos=0)
+    assert almacen.id_de('MSFT') is None
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO Metadata.Symbols (SymbolID, Symbol, CompanyName) VALUES (2, 'MSFT', 'x')")
+    assert almacen.id_de('MSFT') == 2
+    engine.dispose()
+
+
+def test_ingesta_de_otro_proceso_se_detecta(tmp_path):
+    engine = crear_engine_local(str(tmp_path))
+    otro = crear_engine_local(str(tmp_path))
+    registrar_simbolos(engine, ['AAPL'])
+    df = generar_ohlcv(['AAPL'], 1, fecha_fin='2024-06-28', semilla=2)['AAPL']
+    fusionar_precios(engine, df.iloc[:-5], 1)
+
+    almacen = AlmacenMemoria(engine, comprobacion_ingestas=0)
+    almacen.cargar()
+    version = almacen.ultima_ingesta(1)
+    assert len(almacen.rango(1).fechas) == len(df) - 5
+
+    # Carga nocturna desde otro proceso (otro engine sobre los mismos ficheros)
+    fusionar_precios(otro, df, 1)
+    assert almacen.ultima_ingesta(1) != version
+    assert len(almacen.rango(1).fechas) == len(df)
+    assert almacen.rango(1).close[-1] == df['Close'].iloc[-1]
+    otro.dispose()
+    engine.dispose()
+
+
+def test_comprobacion_de_ingestas_limitada_por_intervalo(tmp_path):
+    engine = crear_engine_local(str(tmp_path))
+    registrar_simbolos(engine, ['AAPL'])
+    fusionar_precios(engine, generar_ohlcv(['AAPL'], 1, semilla=2)['AAPL'], 1)
+    almacen = AlmacenMemoria(engine, comprobacion_ingestas=3600)
+    almacen.serie(1)
+    consultas = []
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _contar(conn, cursor, sentencia, parametros, contexto, executemany):
+        consultas.append(sentencia)
+
+    for _ in range(20):
+        almacen.rango(1, '2024-01-01', '2024-03-01')
+        almacen.ultima_ingesta(1)
+    assert consultas == []
+    engine.dispose()
@@ -0,0 +1,110 @@
+"""Caché de precios: contadores con hilos, último acceso en el índice, expulsión y cambios de base."""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_precios import CachePrecios
+from entorno_sintetico import generar_ohlcv
+
+
+def _proveedor():
+    df = generar_ohlcv(1, 1, fecha_fin='2024-06-28', semilla=5)['AAPL']
+    return lambda symbol, inicio, fin, intervalo: df
+
+
+def _ultimo_acceso_en_disco(cache, clave):
+    with open(os.path.join(cache.directorio, 'indice.json'), encoding='utf-8') as f:
+        return json.load(f)[clave]['ultimo_acceso']
+
+
+def test_contadores_exactos_con_hilos(tmp_path):
+    cache = CachePrecios(str(tmp_path), proveedor=_proveedor(), guardado_indice=3600)
+    cache.obtener('AAPL', '2024-01-02', '2024-06-01')
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: cache.obtener('AAPL', '2024-02-01', '2024-05-01'), range(400)))
+    estadisticas = cache.estadisticas()
+    assert (estadisticas['fallos'], estadisticas['aciertos'], estadisticas['parciales']) == (1, 400, 0)
+
+
+def test_acierto_persiste_ultimo_acceso(tmp_path):
+    cache = CachePrecios(str(tmp_path), proveedor=_proveedor(), guardado_indice=3600)
+    cache.obtener('AAPL', '2024-01-02', '2024-06-01')
+    clave = cache._clave('AAPL', '1d')
+    escrito = _ultimo_acceso_en_disco(cache, clave)
+
+    # Dentro del intervalo el acierto solo queda en memoria hasta guardar()
+    cache.obtener('AAPL', '2024-02-01', '2024-05-01')
+    assert _ultimo_acceso_en_disco(cache, clave) == escrito
+    cache.guardar()
+    assert _ultimo_acceso_en_disco(cache, clave) > escrito
+
+    # Con el intervalo cumplido el propio acierto reescribe el índice
+    cache.guardado_indice = 0
+    escrito = _ultimo_acceso_en_disco(cache, clave)
+    cache.obtener('AAPL', '2024-02-01', '2024-05-01')
+    assert _ultimo_acceso_en_disco(cache, clave) > escrito
+    assert CachePrecios(str(tmp_path))._indice[clave]['ultimo_acceso'] > escrito
+
+
+def test_expulsion_salta_claves_en_uso(tmp_path):
+    df = generar_ohlcv(1, 1, fecha_fin='2024-06-28', semilla=5)['AAPL']
+    dentro, liberar = threading.Event(), threading.Event()
+
+    def proveedor(symbol, inicio, fin, intervalo):
+        if symbol == 'AAA' and fin == '2024-06-01':
+            dentro.set()
+            liberar.wait(5)
+        return df
+
+    cache = CachePrecios(str(tmp_path), proveedor=proveedor, guardado_indice=3600)
+    cache.obtener('AAA', '2024-01-02', '2024-03-01')
+    cache.max_bytes = cache.estadisticas()['bytes'] * 3 // 2
+    ruta_aaa = cache._ruta_datos(cache._clave('AAA', '1d'))
+
+    with ThreadPoolExecutor(1) as pool:
+        # Otro hilo descarga un hueco de AAA y mantiene su lock mientras tanto
+        futuro = pool.submit(cache.obtener, 'AAA', '2024-01-02', '2024-06-01')
+        assert dentro.wait(5)
+        cache.obtener('BBB', '2024-01-02', '2024-03-01')
+        # AAA es la menos usada, pero está en uso: no se borra bajo el otro hilo
+        assert os.path.exists(ruta_aaa)
+        assert cache._clave('AAA', '1d') in cache._indice
+        liberar.set()
+        resultado = futuro.result()
+
+    assert len(resultado) == len(df[(df['Date'].dt.tz_localize(None) >= '2024-01-02')
+                                    & (df['Date'].dt.tz_localize(None) < '2024-06-01')])
+    # La escritura de AAA completa la expulsión pendiente
+    assert cache._clave('BBB', '1d') not in cache._indice
+    assert cache.estadisticas()['bytes'] <= cache.max_bytes
+
+
+def test_cambio_de_base_invalida_la_clave(tmp_path):
+    df = generar_ohlcv(1, 1, fecha_fin='2024-06-28', semilla=5)['AAPL']
+    actual = {'df': df}
+    llamadas = []
+
+    def proveedor(symbol, inicio, fin, intervalo):
+        llamadas.append((inicio, fin))
+        fechas = actual['df']['Date'].dt.tz_localize(None)
+        return actual['df'][(fechas >= inicio) & (fechas < fin)].reset_index(drop=True)
+
+    cache = CachePrecios(str(tmp_path), proveedor=proveedor, guardado_indice=3600)
+    cache.obtener('AAPL', '2024-01-02', '2024-03-01')
+
+    # Ampliar sin cambios: solo se pide el hueco, solapado con la última barra guardada
+    cache.obtener('AAPL', '2024-01-02', '2024-04-01')
+    assert llamadas[-1] == ('2024-02-29', '2024-04-01')
+    assert cache._indice[cache._clave('AAPL', '1d')]['rangos'] == [['2024-01-02', '2024-04-01']]
+
+    # Split 2:1: Yahoo devuelve todo el histórico a la mitad
+    dividido = df.copy()
+    dividido[['Open', 'High', 'Low', 'Close']] /= 2
+    actual['df'] = dividido
+    resultado = cache.obtener('AAPL', '2024-02-01', '2024-05-01')
+    assert llamadas[-2:] == [('2024-03-29', '2024-05-01'), ('2024-02-01', '2024-05-01')]
+    esperado = proveedor('AAPL', '2024-02-01', '2024-05-01', '1d')
+    assert resultado['Close'].tolist() == esperado['Close'].tolist()
+    # Lo anterior al rango pedido se descartó junto con la base antigua
+    assert cache._indice[cache._clave('AAPL', '1d')]['rangos'] == [['2024-02-01', '2024-05-01']]
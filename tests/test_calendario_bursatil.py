@@ -0,0 +1,47 @@
+"""Metadata.DateDim: mismas columnas que LlenarDateDim.sql con SET LANGUAGE Spanish."""
+from calendario_bursatil import CIERRES_EXTRAORDINARIOS, construir_date_dim
+
+
+def test_nombres_y_semanas_como_datename_spanish():
+    filas = construir_date_dim('2022-12-31', '2024-01-10').set_index('IdFecha')
+    # Valores de SQL Server: DATENAME(mm/WEEKDAY) y DATEPART(WEEK) con DATEFIRST 1
+    esperado = {
+        20221231: ('Diciembre', 'Sábado', 53),
+        20230101: ('Enero', 'Domingo', 1),
+        20230102: ('Enero', 'Lunes', 2),
+        20230301: ('Marzo', 'Miércoles', 10),
+        20240101: ('Enero', 'Lunes', 1),
+        20240107: ('Enero', 'Domingo', 1),
+        20240108: ('Enero', 'Lunes', 2),
+    }
+    for id_fecha, (mes, dia, semana) in esperado.items():
+        fila = filas.loc[id_fecha]
+        assert (fila['NombreMes'], fila['NombreDia'], fila['SemanaAno']) == (mes, dia, semana)
+    assert filas.loc[20230301, 'MesAno'] == '3/2023'
+
+
+def test_semana_ano_igual_a_datepart_week_datefirst_1():
+    filas = construir_date_dim('1999-01-01', '2030-12-31')
+    # DATEPART(WEEK) con DATEFIRST 1: 1 + lunes transcurridos desde el 1 de enero (sin contarlo)
+    esperado = []
+    for fecha in filas['Fecha']:
+        if (fecha.month, fecha.day) == (1, 1):
+            semana = 1
+        elif fecha.weekday() == 0:
+            semana += 1
+        esperado.append(semana)
+    assert filas['SemanaAno'].tolist() == esperado
+
+
+def test_viernes_santo_y_cierres_extraordinarios_no_son_habiles():
+    filas = construir_date_dim('2000-01-01', '2025-12-31').set_index('IdFecha')
+    viernes_santo = [20010413, 20080321, 20160325, 20230407, 20240329, 20250418]
+    assert (filas.loc[viernes_santo, 'EsDiaHabil'] == 0).all()
+    extraordinarios = [int(dia.replace('-', '')) for dia in CIERRES_EXTRAORDINARIOS]
+    assert (filas.loc[extraordinarios, 'EsDiaHabil'] == 0).all()
+    # Año Nuevo en sábado no se traslada al viernes; Juneteenth en domingo pasa al lunes
+    assert filas.loc[20211231, 'EsDiaHabil'] == 1
+    assert filas.loc[20220620, 'EsDiaHabil'] == 0
+    # Sesiones por año publicadas por NYSE
+    sesiones_ano = filas.groupby('Ano')['EsDiaHabil'].sum()
+    assert sesiones_ano[[2001, 2012, 2022, 2023, 2024, 2025]].tolist() == [248, 250, 251, 250, 252, 250]
@@ -0,0 +1,88 @@
+"""Comparación de caracteristicas.calcular_caracteristicas con la definición de EDA2 en pandas."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from caracteristicas import calcular_caracteristicas
+
+
+def _serie(symbol_id, n, inicio, paso, semilla, fecha_inicio='2010-01-04'):
+    generador = np.random.default_rng(semilla)
+    close = inicio + np.cumsum(generador.normal(0.0, paso, n))
+    return pd.DataFrame({
+        'SymbolID': symbol_id,
+        'Date': pd.bdate_range(fecha_inicio, periods=n),
+        'Open': close,
+        'High': close + paso,
+        'Low': close - paso,
+        'Close': close,
+        'Volume': generador.integers(1_000, 5_000_000, n).astype(np.float64),
+    })
+
+
+def _referencia(df):
+    """Funciones de ventana de EDA2 (AVG/STDEV OVER ...) con groupby de pandas."""
+    df = df.sort_values(['SymbolID', 'Date']).reset_index(drop=True)
+    por_simbolo = df.groupby('SymbolID')['Close']
+    por_mes = df.groupby(['SymbolID', df['Date'].dt.year, df['Date'].dt.month])
+    return pd.DataFrame({
+        'MonthlyAvg_Close': por_mes['Close'].transform('mean'),
+        'MonthlyStdDev_Close': por_mes['Close'].transform('std'),
+        'MonthlyAvg_Volume': por_mes['Volume'].transform('mean'),
+        'MonthlyStdDev_Volume': por_mes['Volume'].transform('std'),
+        'MA_20d_Close': por_simbolo.transform(lambda x: x.rolling(20, min_periods=1).mean()),
+        'MA_50d_Close': por_simbolo.transform(lambda x: x.rolling(50, min_periods=1).mean()),
+        'Volatility_20d_Close': por_simbolo.transform(lambda x: x.rolling(20, min_periods=1).std()),
+        'PrevDay_Close': por_simbolo.shift(1),
+        'DailyRange': df['High'] - df['Low'],
+    })
+
+
+def _comprobar(df):
+    resultado = calcular_caracteristicas(df)
+    esperado = _referencia(df)
+    for columna in esperado.columns:
+        np.testing.assert_allclose(resultado[columna].to_numpy(), esperado[columna].to_numpy(),
+                                   rtol=1e-7, atol=1e-12, equal_nan=True, err_msg=columna)
+    return resultado
+
+
+def test_un_simbolo_coincide_con_la_referencia():
+    _comprobar(_serie(1, 600, 100.0, 1.0, semilla=1))
+
+
+def test_varios_simbolos_con_escalas_mezcladas():
+    # Acciones (cientos y miles de dólares) junto a series tipo FX de muy poca
+    # varianza: la volatilidad de las FX no puede depender de los otros símbolos
+    series = []
+    for symbol_id in range(1, 61):
+        if symbol_id % 3 == 0:
+            series.append(_serie(symbol_id, 1500, 1.1, 1e-4, semilla=symbol_id))
+        else:
+            series.append(_serie(symbol_id, 1500, 50.0 * symbol_id, 0.02 * 50.0 * symbol_id, semilla=symbol_id))
+    precios = pd.concat(series, ignore_index=True)
+    resultado = _comprobar(precios)
+
+    fx = precios[precios['SymbolID'] == 30]
+    solo = calcular_caracteristicas(fx)
+    en_lote = resultado[resultado['SymbolID'] == 30]
+    np.testing.assert_allclose(en_lote['Volatility_20d_Close'].to_numpy(), solo['Volatility_20d_Close'].to_numpy(),
+                               rtol=1e-9, equal_nan=True)
+
+
+def test_entrada_desordenada_y_con_nulos():
+    precios = pd.concat([_serie(1, 300, 20.0, 0.5, semilla=3), _serie(2, 250, 300.0, 4.0, semilla=4)],
+                        ignore_index=True)
+    precios.loc[[10, 11, 400], 'Close'] = np.nan
+    _comprobar(precios.sample(frac=1.0, random_state=0))
+
+
+def test_caracteristicas_de_fecha():
+    precios = _serie(1, 10, 10.0, 0.1, semilla=5, fecha_inicio='2024-02-26')
+    resultado = calcular_caracteristicas(precios, primer_dia_semana=7)
+    # Con DATEFIRST 7 el lunes es el día 2
+    assert resultado['DayOfWeek'].iloc[0] == 2
+    assert list(resultado['DayOfMonth'].iloc[:4]) == [26, 27, 28, 29]
+    assert list(resultado['Month'].iloc[[0, 4]]) == [2, 3]
+    assert resultado['PctChange_Close_Daily'].iloc[1] == pytest.approx(
+        precios['Close'].iloc[1] / precios['Close'].iloc[0] - 1)
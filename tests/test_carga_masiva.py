@@ -0,0 +1,147 @@
+"""Carga de precios en SQLite: lotes de executemany en staging, rollback, MERGE idempotente y mensajes por logging."""
+import json
+import logging
+
+import pandas as pd
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+
+from carga_masiva import ejecutar_por_lotes, fusionar_precios
+from entorno_sintetico import crear_engine_local, generar_ohlcv, registrar_simbolos
+from metricas import configurar_logging
+
+
+@pytest.fixture
+def entorno(tmp_path):
+    engine = crear_engine_local(str(tmp_path))
+    datos = generar_ohlcv(1, 1, fecha_fin='2024-06-28', semilla=7)
+    registrar_simbolos(engine, list(datos))
+    yield engine, next(iter(datos.values()))
+    engine.dispose()
+
+
+def _precios(engine):
+    with engine.connect() as conn:
+        return pd.read_sql(text('SELECT [Date], [Close], CreatedDate FROM AVdata.StockPrices '
+                                'WHERE SymbolID = 1 ORDER BY [Date]'), conn)
+
+
+def _filas_en_staging(engine):
+    with engine.connect() as conn:
+        return conn.execute(text('SELECT COUNT(*) FROM AVdata.StockPricesStaging')).scalar()
+
+
+def test_lotes_que_no_dividen_el_total(entorno):
+    engine, df = entorno
+    llamadas, progreso = [], []
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _contar(conn, cursor, sentencia, parametros, contexto, executemany):
+        if sentencia.lstrip().startswith('INSERT INTO AVdata.StockPricesStaging'):
+            llamadas.append((executemany, len(parametros)))
+
+    resumen = fusionar_precios(engine, df.iloc[:23], 1, tamano_lote=5, progreso=progreso.append)
+    assert (resumen['filas'], resumen['lotes'], resumen['filas_insertadas']) == (23, 5, 23)
+    assert progreso == [5, 10, 15, 20, 23]
+    # Una llamada executemany por lote; el último lleva el resto
+    assert llamadas == [(True, 5)] * 4 + [(True, 3)]
+    assert len(_precios(engine)) == 23
+    # El lote de staging se vacía tras el MERGE
+    assert _filas_en_staging(engine) == 0
+
+    with pytest.raises(ValueError):
+        fusionar_precios(engine, df, 1, tamano_lote=0)
+
+
+def test_ejecutar_por_lotes_envia_nulos_y_constantes(entorno):
+    engine, _ = entorno
+    registros = pd.DataFrame({'valor': [1.5, None, 3.0], 'nota': ['a', None, 'c']})
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE temporal (valor REAL, nota TEXT, grupo INTEGER)'))
+        filas, lotes = ejecutar_por_lotes(conn, text('INSERT INTO temporal VALUES (:valor, :nota, :grupo)'),
+                                          registros, tamano_lote=2, constantes={'grupo': 7})
+        assert (filas, lotes) == (3, 2)
+        guardadas = conn.execute(text('SELECT valor, nota, grupo FROM temporal ORDER BY rowid')).all()
+    assert [tuple(fila) for fila in guardadas] == [(1.5, 'a', 7), (None, None, 7), (3.0, 'c', 7)]
+
+
+def test_fallo_en_un_lote_deshace_la_carga(entorno):
+    engine, df = entorno
+    # La fila 12 no tiene fecha: el tercer lote viola el NOT NULL de la tabla de staging
+    sin_fecha = df.iloc[:20].copy()
+    sin_fecha['Date'] = sin_fecha['Date'].astype(object)
+    sin_fecha.loc[12, 'Date'] = None
+    with pytest.raises(IntegrityError):
+        fusionar_precios(engine, sin_fecha, 1, tamano_lote=5)
+    assert len(_precios(engine)) == 0
+    assert _filas_en_staging(engine) == 0
+
+    # Con una conexión ya abierta la transacción es de quien llama
+    with pytest.raises(IntegrityError):
+        with engine.begin() as conn:
+            fusionar_precios(conn, df.iloc[20:30], 1, tamano_lote=4)
+            fusionar_precios(conn, sin_fecha, 1, tamano_lote=5)
+    assert len(_precios(engine)) == 0
+    assert _filas_en_staging(engine) == 0
+
+
+def test_fusionar_precios_es_idempotente(entorno):
+    engine, df = entorno
+    primera = fusionar_precios(engine, df, 1, tamano_lote=100)
+    assert (primera['filas_insertadas'], primera['filas_actualizadas']) == (len(df), 0)
+    antes = _precios(engine)
+
+    segunda = fusionar_precios(engine, df, 1, tamano_lote=100)
+    assert (segunda['filas_insertadas'], segunda['filas_actualizadas']) == (0, 0)
+    assert segunda['primera_fecha_cambiada'] is None
+    # Mismo número de filas y sin reescribir CreatedDate
+    pd.testing.assert_frame_equal(_precios(engine), antes)
+
+
+def test_fusionar_precios_actualiza_las_barras_cambiadas(entorno):
+    engine, df = entorno
+    fusionar_precios(engine, df.iloc[:-5], 1)
+    antes = _precios(engine)
+
+    cambiado = df.copy()
+    cambiado.loc[[10, 40], 'Close'] *= 1.1
+    resumen = fusionar_precios(engine, cambiado, 1)
+    assert (resumen['filas_insertadas'], resumen['filas_actualizadas']) == (5, 2)
+    fechas = cambiado['Date'].dt.tz_localize(None).dt.date
+    assert resumen['primera_fecha_cambiada'] == fechas[10]
+
+    despues = _precios(engine)
+    assert len(despues) == len(df)
+    assert despues['Close'].tolist() == pytest.approx(cambiado['Close'].tolist())
+    # Solo las barras cambiadas reciben un CreatedDate nuevo
+    reescritas = despues['CreatedDate'].iloc[:len(antes)] != antes['CreatedDate']
+    assert reescritas[reescritas].index.tolist() == [10, 40]
+
+
+def test_fusionar_precios_sin_tabla_de_estado(entorno):
+    engine, df = entorno
+    # Bases sin el DDL del almacén de características: la carga no depende de él
+    with engine.begin() as conn:
+        conn.execute(text('DROP TABLE AVdata.StockFeaturesState'))
+    fusionar_precios(engine, df.iloc[:-5], 1)
+    cambiado = df.copy()
+    cambiado.loc[0, 'Close'] *= 1.1
+    resumen = fusionar_precios(engine, cambiado, 1)
+    assert (resumen['filas_insertadas'], resumen['filas_actualizadas']) == (5, 1)
+    assert len(_precios(engine)) == len(df)
+
+
+def test_mensajes_de_la_carga_en_json(entorno, capsys):
+    engine, df = entorno
+    raiz = logging.getLogger('alphavantage')
+    anterior = (raiz.handlers[:], raiz.level, raiz.propagate)
+    try:
+        configurar_logging('INFO', 'json')
+        fusionar_precios(engine, df, 1)
+        registros = [json.loads(linea) for linea in capsys.readouterr().err.splitlines()]
+    finally:
+        raiz.handlers[:], raiz.level, raiz.propagate = anterior
+    carga = [r for r in registros if r['logger'] == 'alphavantage.carga_masiva']
+    assert len(carga) == 1
+    assert carga[0]['nivel'] == 'INFO' and carga[0]['mensaje'].startswith(f'SymbolID 1: {len(df)} filas')
@@ -0,0 +1,149 @@
+"""Cola de trabajos: agrupación de envíos duplicados, estados, purga y el ciclo /descargar -> /trabajos/<id>."""
+import threading
+import time
+
+import pytest
+
+from almacen_memoria import AlmacenMemoria
+from cola_trabajos import COMPLETADO, EN_CURSO, ERROR, GestorTrabajos
+from entorno_sintetico import crear_engine_local, generar_ohlcv, registrar_simbolos
+
+ESPERA_MAXIMA = 10
+
+
+def _esperar(condicion):
+    limite = time.monotonic() + ESPERA_MAXIMA
+    while not condicion():
+        assert time.monotonic() < limite, "el trabajo no ha llegado al estado esperado"
+        time.sleep(0.01)
+
+
+def _esperar_fin(gestor, trabajo_id):
+    _esperar(lambda: not gestor.obtener(trabajo_id).activo)
+    return gestor.obtener(trabajo_id).a_dict()
+
+
+@pytest.fixture
+def gestor():
+    gestor = GestorTrabajos(max_hilos=2)
+    yield gestor
+    gestor.cerrar()
+
+
+def test_envios_duplicados_comparten_trabajo(gestor):
+    liberar = threading.Event()
+    llamadas = []
+
+    def trabajo_bloqueado(trabajo, symbol):
+        llamadas.append(symbol)
+        liberar.wait(ESPERA_MAXIMA)
+        return f"{symbol} listo"
+
+    primero, nuevo = gestor.enviar(('AAPL', '2024-01-01', '2024-06-01'), trabajo_bloqueado, 'AAPL')
+    assert nuevo
+    segundo, nuevo = gestor.enviar(('AAPL', '2024-01-01', '2024-06-01'), trabajo_bloqueado, 'AAPL')
+    assert (segundo.id, nuevo) == (primero.id, False)
+    # Otro rango es otro trabajo
+    otro, nuevo = gestor.enviar(('AAPL', '2024-01-01', '2024-07-01'), trabajo_bloqueado, 'AAPL')
+    assert nuevo and otro.id != primero.id
+
+    liberar.set()
+    assert _esperar_fin(gestor, primero.id)['mensaje'] == 'AAPL listo'
+    _esperar_fin(gestor, otro.id)
+    assert llamadas == ['AAPL', 'AAPL']
+    # Terminado el trabajo, la misma clave vuelve a encolar uno nuevo
+    tercero, nuevo = gestor.enviar(('AAPL', '2024-01-01', '2024-06-01'), trabajo_bloqueado, 'AAPL')
+    assert nuevo and tercero.id != primero.id
+    _esperar_fin(gestor, tercero.id)
+
+
+def test_fases_filas_y_tiempo(gestor):
+    en_fase, liberar = threading.Event(), threading.Event()
+
+    def descargar(trabajo):
+        trabajo.actualizar(fase='descargando')
+        trabajo.actualizar(fase='guardando', filas=250)
+        en_fase.set()
+        liberar.wait(ESPERA_MAXIMA)
+        return 'hecho'
+
+    trabajo, _ = gestor.enviar('clave', descargar, descripcion='AAPL 2024')
+    assert en_fase.wait(ESPERA_MAXIMA)
+    time.sleep(0.02)
+    estado = trabajo.a_dict()
+    assert (estado['estado'], estado['fase'], estado['filas']) == (EN_CURSO, 'guardando', 250)
+    assert estado['segundos'] > 0
+    assert estado['descripcion'] == 'AAPL 2024'
+
+    liberar.set()
+    final = _esperar_fin(gestor, trabajo.id)
+    assert (final['estado'], final['fase'], final['mensaje'], final['error']) == (COMPLETADO, 'terminado', 'hecho', None)
+    # El tiempo deja de correr al terminar
+    assert trabajo.a_dict()['segundos'] == final['segundos'] >= estado['segundos']
+
+
+def test_funcion_que_falla_termina_en_error(gestor):
+    def fallar(trabajo):
+        trabajo.actualizar(fase='descargando')
+        raise ConnectionError('Yahoo Finance no responde')
+
+    trabajo, _ = gestor.enviar('clave', fallar)
+    final = _esperar_fin(gestor, trabajo.id)
+    assert final['estado'] == ERROR
+    assert final['error'] == 'Yahoo Finance no responde'
+    assert final['fase'] == 'descargando'
+
+
+def test_purga_de_trabajos_terminados(gestor):
+    gestor.retencion_segundos = 60
+    liberar = threading.Event()
+    terminado, _ = gestor.enviar('a', lambda trabajo: None)
+    _esperar_fin(gestor, terminado.id)
+    reciente, _ = gestor.enviar('b', lambda trabajo: None)
+    _esperar_fin(gestor, reciente.id)
+    activo, _ = gestor.enviar('c', lambda trabajo: liberar.wait(ESPERA_MAXIMA))
+
+    # Terminado hace más de la retención: se olvida en el siguiente envío
+    terminado.terminado -= 120
+    siguiente, _ = gestor.enviar('d', lambda trabajo: None)
+    assert gestor.obtener(terminado.id) is None
+    assert gestor.obtener(reciente.id) is not None
+    assert gestor.obtener(activo.id) is not None
+    assert terminado.id not in [t['id'] for t in gestor.listar()]
+
+    liberar.set()
+    _esperar_fin(gestor, activo.id)
+    _esperar_fin(gestor, siguiente.id)
+
+
+def test_descargar_encola_y_se_consulta_hasta_completar(webapp, tmp_path, monkeypatch, gestor):
+    engine = crear_engine_local(str(tmp_path))
+    datos = generar_ohlcv(1, 1, fecha_fin='2024-06-28', semilla=4)
+    registrar_simbolos(engine, list(datos))
+    symbol, df = next(iter(datos.items()))
+    almacen = AlmacenMemoria(engine, recarga_simbolos=0, comprobacion_ingestas=0)
+    monkeypatch.setattr(webapp, 'obtener_almacen', lambda: almacen)
+    monkeypatch.setattr(webapp, 'obtener_engine', lambda: engine)
+    monkeypatch.setattr(webapp, 'gestor_trabajos', gestor)
+    monkeypatch.setattr(webapp, 'descargar_datos_cache', lambda *args, **kwargs: df.copy())
+    cliente = webapp.app.test_client()
+
+    respuesta = cliente.post('/descargar', data={'symbol_id': '1', 'fecha_inicio': '2023-07-01',
+                                                 'fecha_fin': '2024-06-29'},
+                             headers={'Accept': 'application/json'})
+    assert respuesta.status_code == 202
+    cuerpo = respuesta.get_json()
+    assert cuerpo['nuevo'] is True
+    assert cuerpo['estado_url'] == f"/trabajos/{cuerpo['id']}"
+
+    def consultar():
+        return cliente.get(cuerpo['estado_url']).get_json()
+
+    _esperar(lambda: consultar()['estado'] in (COMPLETADO, ERROR))
+    final = consultar()
+    assert final['estado'] == COMPLETADO, final['error']
+    assert final['filas'] == len(df)
+    assert symbol in final['mensaje']
+    assert [t['id'] for t in cliente.get('/trabajos').get_json()] == [cuerpo['id']]
+    assert cliente.get('/trabajos/no-existe').status_code == 404
+    engine.dispose()
@@ -0,0 +1,85 @@
+"""Descargador: limitador de tasa, reintentos y entrega de cada tramo a un único escritor."""
+import threading
+import time
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+import descargador
+from descargador import LimitadorTasa, descargar_con_reintentos, descargar_y_cargar
+
+
+class ProveedorFallon:
+    """Proveedor falso: cada símbolo falla las primeras veces indicadas y después responde."""
+
+    def __init__(self, fallos=None, siempre_falla=(), vacios=()):
+        self.fallos = dict(fallos or {})
+        self.siempre_falla = set(siempre_falla)
+        self.vacios = set(vacios)
+        self.llamadas = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, symbol, inicio, fin, intervalo):
+        with self._lock:
+            self.llamadas[symbol] += 1
+            llamada = self.llamadas[symbol]
+        if symbol in self.siempre_falla or llamada <= self.fallos.get(symbol, 0):
+            raise ConnectionError(f'{symbol}: error transitorio {llamada}')
+        if symbol in self.vacios:
+            return pd.DataFrame()
+        return pd.DataFrame({'Date': pd.date_range(inicio, fin, freq='B', inclusive='left'), 'Symbol': symbol})
+
+
+@pytest.fixture(autouse=True)
+def sin_esperas(monkeypatch):
+    # La espera con jitter es random.uniform(0, tope): sin esperas en las pruebas
+    monkeypatch.setattr(descargador.random, 'uniform', lambda a, b: 0.0)
+
+
+def test_limitador_respeta_la_tasa():
+    with pytest.raises(ValueError):
+        LimitadorTasa(0)
+    limitador = LimitadorTasa(20, capacidad=1)
+    inicio = time.monotonic()
+    for _ in range(6):
+        limitador.adquirir()
+    # El primer token ya está en la cubeta; los otros cinco llegan a 20 por segundo
+    assert time.monotonic() - inicio >= 5 / 20 * 0.9
+
+
+def test_reintentos_hasta_el_exito_y_hasta_agotarlos():
+    proveedor = ProveedorFallon(fallos={'AAPL': 2, 'MSFT': 5})
+    df = descargar_con_reintentos(proveedor, 'AAPL', '2024-01-01', '2024-01-08', reintentos=3)
+    assert len(df) == 5 and proveedor.llamadas['AAPL'] == 3
+
+    with pytest.raises(ConnectionError):
+        descargar_con_reintentos(proveedor, 'MSFT', '2024-01-01', '2024-01-08', reintentos=3)
+    assert proveedor.llamadas['MSFT'] == 4
+
+
+def test_cada_tramo_llega_una_vez_al_escritor():
+    simbolos = [f'S{i:02d}' for i in range(20)]
+    tareas = [{'SymbolID': i, 'Symbol': symbol, 'inicio': '2024-01-01', 'fin': '2024-02-01'}
+              for i, symbol in enumerate(simbolos + ['ROTO', 'VACIO', 'NOGUARDA'])]
+    proveedor = ProveedorFallon(fallos={symbol: i % 3 for i, symbol in enumerate(simbolos)},
+                                siempre_falla={'ROTO'}, vacios={'VACIO'})
+    escritas, hilos = Counter(), set()
+
+    def escritor(tarea, df):
+        hilos.add(threading.get_ident())
+        if tarea['Symbol'] == 'NOGUARDA':
+            raise RuntimeError('fallo al guardar')
+        assert (df['Symbol'] == tarea['Symbol']).all()
+        escritas[tarea['Symbol']] += 1
+
+    resumen = descargar_y_cargar(tareas, escritor, proveedor=proveedor, max_hilos=4,
+                                 peticiones_por_segundo=1000, reintentos=2)
+
+    assert escritas == Counter(simbolos)
+    assert len(hilos) == 1 and threading.get_ident() not in hilos
+    assert (resumen['descargados'], resumen['escritos'], resumen['vacios']) == (21, 20, 1)
+    # Los errores se informan en el resumen, no se propagan
+    assert sorted(symbol for symbol, _ in resumen['errores']) == ['NOGUARDA', 'ROTO']
+    assert proveedor.llamadas['ROTO'] == 3
+    assert all(proveedor.llamadas[symbol] == i % 3 + 1 for i, symbol in enumerate(simbolos))
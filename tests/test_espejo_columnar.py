@@ -0,0 +1,156 @@
+"""Espejo columnar: consultas de scripts/Queries traducidas a DuckDB y sincronización por huella."""
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from caracteristicas import COLUMNAS_CARACTERISTICAS, calcular_caracteristicas
+from carga_masiva import fusionar_precios
+from entorno_sintetico import crear_engine_local, generar_ohlcv, registrar_simbolos
+from espejo_columnar import ejecutar_consulta_duckdb, sincronizar_espejo
+from matriz_precios import pivotar_precios
+
+pytest.importorskip('duckdb')
+
+CONSULTAS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts', 'Queries')
+# Script de carga (SET LANGUAGE, TRUNCATE, INSERT con CTE recursiva), no una consulta de análisis;
+# lo sustituye calendario_bursatil.cargar_date_dim
+NO_CONSULTAS = {'LlenarDateDim.sql'}
+BARRAS = 60
+
+
+@pytest.fixture
+def espejo(tmp_path):
+    engine = crear_engine_local(str(tmp_path / 'db'))
+    datos = generar_ohlcv(3, 1, fecha_fin='2024-06-28', semilla=13)
+    registrar_simbolos(engine, list(datos))
+    for symbol_id, df in enumerate(datos.values(), 1):
+        df = df.iloc[-BARRAS:]
+        if symbol_id == 2:
+            # NVDA sin algunas barras: las columnas pivotadas llevan NULL esos días
+            df = df.drop(df.index[[5, 6, 30]])
+        fusionar_precios(engine, df, symbol_id)
+    directorio = str(tmp_path / 'espejo')
+    sincronizar_espejo(engine, directorio=directorio)
+    yield engine, directorio
+    engine.dispose()
+
+
+def _leer(nombre):
+    with open(os.path.join(CONSULTAS, nombre), encoding='utf-8') as f:
+        return f.read()
+
+
+def _precios(engine):
+    with engine.connect() as conn:
+        df = pd.read_sql(text('SELECT SymbolID, [Date], [Open], [High], [Low], [Close], [Volume] '
+                              'FROM AVdata.StockPrices ORDER BY SymbolID, [Date]'), conn)
+    df['Date'] = pd.to_datetime(df['Date'])
+    return df
+
+
+def _ancho(engine, campos=('Open', 'Close', 'Low', 'High', 'Volume')):
+    return pivotar_precios(_precios(engine), {1: 'AAPL', 2: 'NVDA'}, list(campos))
+
+
+def _con_indice(resultado):
+    resultado = resultado.copy()
+    resultado['Date'] = pd.to_datetime(resultado['Date']).astype('datetime64[ns]')
+    return resultado.set_index('Date').sort_index()
+
+
+@pytest.mark.parametrize('nombre', sorted(os.path.basename(ruta) for ruta in glob.glob(os.path.join(CONSULTAS, '*.sql'))
+                                          if os.path.basename(ruta) not in NO_CONSULTAS))
+def test_cada_consulta_se_traduce_y_ejecuta(espejo, nombre):
+    _, directorio = espejo
+    resultado = ejecutar_consulta_duckdb(_leer(nombre), directorio=directorio)
+    assert len(resultado) > 0
+    assert {'Close_AAPL', 'Close_NVDA'} <= set(resultado.columns)
+    assert pd.to_datetime(resultado['Date']).notna().all()
+
+
+@pytest.mark.parametrize('nombre', ['ProfileQueryWithAggregations.sql', 'ProfileQueryWithPivotation.sql'])
+def test_pivotes_igual_a_matriz_precios(espejo, nombre):
+    engine, directorio = espejo
+    resultado = ejecutar_consulta_duckdb(_leer(nombre), directorio=directorio)
+    assert pd.to_datetime(resultado['Date']).is_monotonic_decreasing
+    esperado = _ancho(engine)
+    pd.testing.assert_frame_equal(_con_indice(resultado)[list(esperado.columns)].astype(float), esperado,
+                                  check_names=False, check_freq=False)
+
+
+def test_eda1_igual_a_caracteristicas(espejo):
+    engine, directorio = espejo
+    resultado = _con_indice(ejecutar_consulta_duckdb(_leer('EDA1.sql'), directorio=directorio))
+    precios = _precios(engine)
+    caracteristicas = calcular_caracteristicas(precios[precios['SymbolID'].isin([1, 2])])
+    for symbol_id, symbol in ((1, 'AAPL'), (2, 'NVDA')):
+        propias = caracteristicas[caracteristicas['SymbolID'] == symbol_id].set_index('Date')
+        fechas = propias.index
+        for columna in COLUMNAS_CARACTERISTICAS:
+            np.testing.assert_allclose(resultado.loc[fechas, f'{columna}_{symbol}'].to_numpy(dtype=float),
+                                       propias[columna].to_numpy(dtype=float), rtol=1e-9, equal_nan=True,
+                                       err_msg=f'{columna}_{symbol}')
+
+
+def test_eda2_reproduce_el_outer_apply(espejo):
+    _, directorio = espejo
+    resultado = ejecutar_consulta_duckdb(_leer('EDA2.sql.sql'), directorio=directorio)
+    fechas = pd.to_datetime(resultado['Date']).drop_duplicates().sort_values().reset_index(drop=True)
+    # PERCENTILE_CONT ... OVER () dentro de cada OUTER APPLY devuelve una fila por fecha de la
+    # ventana de 90 días, como en SQL Server: cada fecha sale k * k veces
+    ventana = np.array([((fechas >= fecha - pd.Timedelta(days=89)) & (fechas <= fecha)).sum() for fecha in fechas])
+    assert len(resultado) == int((ventana ** 2).sum())
+
+    ultima = resultado[pd.to_datetime(resultado['Date']) == fechas.iloc[-1]].iloc[0]
+    unicos = resultado.drop_duplicates('Date')
+    en_ventana = unicos[pd.to_datetime(unicos['Date']) >= fechas.iloc[-1] - pd.Timedelta(days=89)]
+    cierres = en_ventana['Close_AAPL'].dropna().to_numpy(dtype=float)
+    esperado = np.quantile(cierres, [0.25, 0.75])
+    q1 = ultima['Close_AAPL'] < esperado[0] - 1.5 * (esperado[1] - esperado[0])
+    q3 = ultima['Close_AAPL'] > esperado[1] + 1.5 * (esperado[1] - esperado[0])
+    assert ultima['IsOutlier_IQR_Close_AAPL'] == int(q1 or q3)
+
+
+def _mtimes(directorio):
+    carpeta = os.path.join(directorio, 'stock_prices')
+    return {nombre: os.stat(os.path.join(carpeta, nombre)).st_mtime_ns for nombre in os.listdir(carpeta)}
+
+
+def test_sincronizacion_por_huella(espejo):
+    engine, directorio = espejo
+    antes = _mtimes(directorio)
+    assert set(antes) == {'1.parquet', '2.parquet', '3.parquet'}
+
+    # Sin cambios no se reescribe ningún fichero
+    assert sincronizar_espejo(engine, directorio=directorio) == {'simbolos_reescritos': 0, 'simbolos_borrados': 0,
+                                                                 'filas': 0}
+    assert _mtimes(directorio) == antes
+
+    # Una barra corregida reescribe solo su símbolo
+    precios = _precios(engine)
+    corregida = precios[precios['SymbolID'] == 3].iloc[[10]].copy()
+    corregida['Close'] *= 1.2
+    fusionar_precios(engine, corregida, 3)
+    resumen = sincronizar_espejo(engine, directorio=directorio)
+    assert (resumen['simbolos_reescritos'], resumen['filas']) == (1, BARRAS)
+    despues = _mtimes(directorio)
+    assert despues['1.parquet'] == antes['1.parquet'] and despues['3.parquet'] != antes['3.parquet']
+    consulta = 'SELECT "Close" FROM AVdata.StockPrices WHERE SymbolID = 3 AND "Date" = $fecha'
+    valor = ejecutar_consulta_duckdb(consulta, {'fecha': corregida['Date'].iloc[0].date()}, traducir=False,
+                                     directorio=directorio)
+    assert valor['Close'].item() == pytest.approx(corregida['Close'].item())
+
+    # Un símbolo borrado de la base desaparece del espejo, pero no si la sincronización se limita a otros
+    with engine.begin() as conn:
+        conn.execute(text('DELETE FROM AVdata.StockPrices WHERE SymbolID = 2'))
+    assert sincronizar_espejo(engine, symbol_ids=[1], directorio=directorio)['simbolos_borrados'] == 0
+    assert '2.parquet' in _mtimes(directorio)
+    assert sincronizar_espejo(engine, directorio=directorio)['simbolos_borrados'] == 1
+    assert set(_mtimes(directorio)) == {'1.parquet', '3.parquet'}
+    simbolos = ejecutar_consulta_duckdb('SELECT DISTINCT SymbolID FROM AVdata.StockPrices ORDER BY 1',
+                                        traducir=False, directorio=directorio)
+    assert simbolos['SymbolID'].tolist() == [1, 3]
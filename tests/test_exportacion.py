@@ -0,0 +1,144 @@
+"""Exportación a Parquet: particiones, manifiesto, huérfanos y reescritura incremental."""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+import pytest
+from sqlalchemy import text
+
+from almacen_caracteristicas import actualizar_caracteristicas
+from caracteristicas import COLUMNAS_CARACTERISTICAS
+from carga_masiva import fusionar_precios
+from entorno_sintetico import crear_engine_local, generar_ohlcv, registrar_simbolos
+from exportacion import exportar_tabla
+
+
+@pytest.fixture
+def entorno(tmp_path):
+    engine = crear_engine_local(str(tmp_path / 'db'))
+    datos = generar_ohlcv(3, 2, fecha_fin='2024-03-28', semilla=11)
+    registrar_simbolos(engine, list(datos))
+    yield engine, datos, str(tmp_path / 'exportacion')
+    engine.dispose()
+
+
+def _cargar(engine, datos, desde=None, hasta=None):
+    for symbol_id, df in enumerate(datos.values(), 1):
+        fechas = df['Date'].dt.tz_localize(None)
+        mascara = np.ones(len(df), dtype=bool)
+        if desde:
+            mascara &= fechas >= pd.Timestamp(desde)
+        if hasta:
+            mascara &= fechas < pd.Timestamp(hasta)
+        fusionar_precios(engine, df[mascara], symbol_id)
+
+
+def _exportado(directorio, nombre):
+    tabla = ds.dataset(os.path.join(directorio, nombre), format='parquet', partitioning='hive').to_table()
+    df = tabla.to_pandas().sort_values(['SymbolID', 'Date'], ignore_index=True)
+    df['Date'] = pd.to_datetime(df['Date'])
+    return df
+
+
+def _en_base(engine, tabla, columnas):
+    consulta = f"SELECT SymbolID, [Date], {', '.join(f'[{c}]' for c in columnas)} FROM {tabla} ORDER BY SymbolID, [Date]"
+    with engine.connect() as conn:
+        df = pd.read_sql(text(consulta), conn)
+    df['Date'] = pd.to_datetime(df['Date'])
+    return df
+
+
+def _comparar(exportado, en_base, columnas):
+    assert len(exportado) == len(en_base)
+    assert exportado['SymbolID'].tolist() == en_base['SymbolID'].tolist()
+    assert exportado['Date'].tolist() == en_base['Date'].tolist()
+    for columna in columnas:
+        np.testing.assert_allclose(exportado[columna].to_numpy(dtype=float), en_base[columna].to_numpy(dtype=float),
+                                   rtol=1e-12, equal_nan=True, err_msg=columna)
+
+
+def test_particiones_y_manifiesto(entorno):
+    engine, datos, directorio = entorno
+    _cargar(engine, datos)
+    resumen = exportar_tabla(engine, 'precios', directorio=directorio)
+    assert resumen['modo'] == 'completo'
+
+    carpeta = os.path.join(directorio, 'precios')
+    esperadas = {f"symbol={symbol}/year={ano}" for symbol in datos for ano in (2022, 2023, 2024)}
+    with open(os.path.join(carpeta, '_manifiesto.json'), encoding='utf-8') as f:
+        manifiesto = json.load(f)
+    assert set(manifiesto['particiones']) == esperadas
+    for particion, info in manifiesto['particiones'].items():
+        for fichero in info['ficheros']:
+            assert os.path.exists(os.path.join(carpeta, particion, fichero))
+    assert sum(info['filas'] for info in manifiesto['particiones'].values()) == resumen['filas']
+
+    exportado = _exportado(directorio, 'precios')
+    _comparar(exportado, _en_base(engine, 'AVdata.StockPrices', ['Close', 'Volume']), ['Close', 'Volume'])
+    # La columna de partición coincide con el año de cada fila
+    assert (exportado['year'] == exportado['Date'].dt.year).all()
+
+    # Sin cambios no se reescribe nada
+    resumen = exportar_tabla(engine, 'precios', directorio=directorio)
+    assert (resumen['modo'], resumen['filas'], resumen['simbolos_reescritos']) == ('incremental', 0, 0)
+
+
+def test_incremental_refleja_barras_nuevas_y_corregidas(entorno):
+    engine, datos, directorio = entorno
+    _cargar(engine, datos, hasta='2024-02-15')
+    exportar_tabla(engine, 'precios', directorio=directorio)
+
+    _cargar(engine, datos, desde='2024-02-15')
+    # Corrección de una barra de 2022 ya exportada, solo en el segundo símbolo
+    corregida = datos['NVDA'].iloc[[20]].copy()
+    corregida['Close'] *= 1.25
+    fusionar_precios(engine, corregida, 2)
+
+    resumen = exportar_tabla(engine, 'precios', directorio=directorio)
+    assert resumen['modo'] == 'incremental'
+    assert resumen['simbolos_reescritos'] == 3
+    _comparar(_exportado(directorio, 'precios'), _en_base(engine, 'AVdata.StockPrices', ['Close', 'Volume']),
+              ['Close', 'Volume'])
+    # Solo se reescriben los años afectados: 2024 para todos y 2022-2024 para NVDA
+    carpeta = os.path.join(directorio, 'precios')
+    assert os.listdir(os.path.join(carpeta, 'symbol=AAPL', 'year=2023')) == ['part-00001.parquet']
+    assert os.listdir(os.path.join(carpeta, 'symbol=AAPL', 'year=2024')) == ['part-00002.parquet']
+    assert os.listdir(os.path.join(carpeta, 'symbol=NVDA', 'year=2022')) == ['part-00002.parquet']
+
+
+def test_incremental_de_caracteristicas_reescribe_el_mes(entorno):
+    engine, datos, directorio = entorno
+    # La carga se corta a mitad de mes: las medias mensuales de días ya exportados cambian
+    _cargar(engine, datos, hasta='2024-03-14')
+    actualizar_caracteristicas(engine)
+    exportar_tabla(engine, 'caracteristicas', directorio=directorio)
+    antes = _exportado(directorio, 'caracteristicas')
+
+    _cargar(engine, datos, desde='2024-03-14')
+    actualizar_caracteristicas(engine)
+    exportar_tabla(engine, 'caracteristicas', directorio=directorio)
+    despues = _exportado(directorio, 'caracteristicas')
+
+    _comparar(despues, _en_base(engine, 'AVdata.StockFeatures', COLUMNAS_CARACTERISTICAS), COLUMNAS_CARACTERISTICAS)
+    dia = (despues['SymbolID'] == 1) & (despues['Date'] == pd.Timestamp('2024-03-01'))
+    assert antes.loc[(antes['SymbolID'] == 1) & (antes['Date'] == pd.Timestamp('2024-03-01')),
+                     'MonthlyAvg_Close'].item() != despues.loc[dia, 'MonthlyAvg_Close'].item()
+
+
+def test_huerfanos_de_una_exportacion_interrumpida(entorno):
+    engine, datos, directorio = entorno
+    _cargar(engine, datos)
+    exportar_tabla(engine, 'precios', directorio=directorio)
+    particion = os.path.join(directorio, 'precios', 'symbol=AAPL', 'year=2023')
+    registrado = os.path.join(particion, 'part-00001.parquet')
+    with open(registrado, 'rb') as f:
+        contenido = f.read()
+    for nombre in ('part-00002.parquet', '.part-00002.parquet.tmp'):
+        with open(os.path.join(particion, nombre), 'wb') as f:
+            f.write(contenido)
+
+    exportar_tabla(engine, 'precios', directorio=directorio)
+    assert os.listdir(particion) == ['part-00001.parquet']
+    _comparar(_exportado(directorio, 'precios'), _en_base(engine, 'AVdata.StockPrices', ['Close']), ['Close'])
@@ -0,0 +1,155 @@
+"""Intradía: ventanas por intervalo, formato compacto, fusión por meses, lectura por rango y descarga por ventanas."""
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from intradia import (VENTANAS_INTRADIA, calcular_ventanas, descargar_intradia, guardar_barras, leer_intradia,
+                      preparar_barras)
+
+
+def _barras(momentos, cierre=100.0, zona='UTC', columna='Datetime'):
+    """DataFrame con el formato del proveedor: una barra por momento."""
+    indice = pd.DatetimeIndex(pd.to_datetime(momentos)).tz_localize(zona)
+    n = len(indice)
+    cierres = np.full(n, cierre) if np.isscalar(cierre) else np.asarray(cierre, dtype=float)
+    return pd.DataFrame({columna: indice, 'Open': cierres - 1, 'High': cierres + 1, 'Low': cierres - 2,
+                         'Close': cierres, 'Volume': np.arange(1, n + 1) * 100})
+
+
+def _ts(momento):
+    return int(pd.Timestamp(momento, tz='UTC').timestamp())
+
+
+class ProveedorIntradia:
+    """Proveedor falso: barras horarias de 14:30 a 20:30 UTC en días laborables de [inicio, fin)."""
+
+    def __init__(self):
+        self.llamadas = []
+        self._lock = threading.Lock()
+
+    def __call__(self, symbol, inicio, fin, intervalo):
+        with self._lock:
+            self.llamadas.append((symbol, inicio, fin, intervalo))
+        dias = pd.date_range(inicio, fin, freq='B', inclusive='left')
+        momentos = [dia + pd.Timedelta(hours=14, minutes=30) + pd.Timedelta(hours=h) for dia in dias for h in range(7)]
+        return _barras(momentos, cierre=[150.0 + i for i in range(len(momentos))])
+
+    @staticmethod
+    def esperadas(inicio, fin):
+        return 7 * len(pd.date_range(inicio, fin, freq='B', inclusive='left'))
+
+
+def test_ventanas_recortadas_a_la_antiguedad_maxima():
+    ahora = datetime(2024, 6, 30, 15, 0)
+    # 1m: tramos de 7 días y solo los últimos 30 (29 días antes de hoy, con margen)
+    assert calcular_ventanas('1m', '2024-05-01', '2024-06-20', ahora=ahora) == [
+        ('2024-06-01', '2024-06-08'), ('2024-06-08', '2024-06-15'), ('2024-06-15', '2024-06-20')]
+    # Sin fechas: desde lo más antiguo disponible hasta hoy incluido
+    assert calcular_ventanas('5m', ahora=ahora) == [('2024-05-02', '2024-07-01')]
+    # Periodo entero fuera de la antigüedad máxima: nada que pedir
+    assert calcular_ventanas('1m', '2024-03-01', '2024-04-01', ahora=ahora) == []
+    with pytest.raises(ValueError):
+        calcular_ventanas('1d', ahora=ahora)
+
+
+@pytest.mark.parametrize('intervalo', sorted(VENTANAS_INTRADIA))
+def test_tamano_de_las_ventanas_por_intervalo(intervalo):
+    dias_ventana, antiguedad = VENTANAS_INTRADIA[intervalo]
+    ahora = datetime(2024, 6, 30, 15, 0)
+    ventanas = calcular_ventanas(intervalo, '2020-01-01', '2024-06-30', ahora=ahora)
+
+    dias = [(date.fromisoformat(fin) - date.fromisoformat(inicio)).days for inicio, fin in ventanas]
+    assert all(d == dias_ventana for d in dias[:-1])
+    assert 0 < dias[-1] <= dias_ventana
+    # Consecutivas, sin huecos ni solapes, y cubriendo el periodo disponible
+    assert all(anterior[1] == siguiente[0] for anterior, siguiente in zip(ventanas, ventanas[1:]))
+    assert ventanas[0][0] == (ahora.date() - timedelta(days=antiguedad - 1)).isoformat()
+    assert ventanas[-1][1] == '2024-06-30'
+
+
+def test_preparar_barras_en_utc_y_sin_duplicados():
+    # 09:30 en Nueva York con horario de invierno (UTC-5) y de verano (UTC-4)
+    df = _barras(['2024-03-08 09:35', '2024-03-08 09:30', '2024-03-11 09:30', '2024-03-08 09:35'],
+                 cierre=[10.0, 11.0, 12.0, 13.0], zona='America/New_York')
+    barras = preparar_barras(df)
+
+    assert barras['ts'].tolist() == [_ts('2024-03-08 14:30'), _ts('2024-03-08 14:35'), _ts('2024-03-11 13:30')]
+    # La barra repetida conserva la última recibida
+    assert barras['close'].tolist() == [11.0, 13.0, 12.0]
+    assert barras.dtypes.to_dict() == {'ts': np.int64, 'open': np.float32, 'high': np.float32, 'low': np.float32,
+                                       'close': np.float32, 'volume': np.int64}
+
+    # Columna Date sin zona horaria: se interpreta como UTC
+    sin_zona = _barras(['2024-03-08 14:30'], columna='Date')
+    sin_zona['Date'] = sin_zona['Date'].dt.tz_localize(None)
+    assert preparar_barras(sin_zona)['ts'].tolist() == [_ts('2024-03-08 14:30')]
+
+
+def test_guardar_barras_fusiona_entre_meses(tmp_path):
+    directorio = str(tmp_path)
+    primera = _barras(['2024-05-31 19:00', '2024-05-31 20:00', '2024-06-03 14:00'], cierre=[1.0, 2.0, 3.0])
+    assert guardar_barras('AAPL', '1h', primera, directorio) == 3
+
+    # Solapa con lo guardado a ambos lados del cambio de mes y corrige una barra
+    segunda = _barras(['2024-05-31 20:00', '2024-05-31 21:00', '2024-06-03 14:00', '2024-06-03 15:00'],
+                      cierre=[20.0, 21.0, 3.0, 4.0])
+    assert guardar_barras('AAPL', '1h', segunda, directorio) == 2
+    assert sorted(os.listdir(tmp_path / '1h' / 'AAPL')) == ['2024-05.parquet', '2024-06.parquet']
+
+    barras = leer_intradia('AAPL', '1h', directorio=directorio)
+    assert barras['close'].tolist() == [1.0, 20.0, 21.0, 3.0, 4.0]
+    assert barras['ts'].is_monotonic_increasing
+
+    # Repetir la misma escritura no añade nada
+    assert guardar_barras('AAPL', '1h', segunda, directorio) == 0
+    assert len(leer_intradia('AAPL', '1h', directorio=directorio)) == 5
+
+
+def test_leer_intradia_por_rango_solo_abre_los_meses_del_rango(tmp_path):
+    directorio = str(tmp_path)
+    guardar_barras('MSFT', '1h', _barras(['2024-04-30 20:00', '2024-05-02 14:00', '2024-05-31 20:00',
+                                          '2024-06-03 14:00', '2024-06-04 14:00'], cierre=[1.0, 2.0, 3.0, 4.0, 5.0]),
+                   directorio)
+    # Un mes ilegible fuera del rango: si se abriera, la lectura fallaría
+    with open(tmp_path / '1h' / 'MSFT' / '2024-01.parquet', 'wb') as f:
+        f.write(b'no es parquet')
+
+    # Límites incluidos, también con zona horaria distinta de UTC
+    barras = leer_intradia('MSFT', '1h', desde='2024-05-02 14:00',
+                           hasta=pd.Timestamp('2024-06-03 10:00', tz='America/New_York'), directorio=directorio)
+    assert barras['close'].tolist() == [2.0, 3.0, 4.0]
+
+    assert leer_intradia('MSFT', '1h', desde='2024-07-01', directorio=directorio).empty
+    assert leer_intradia('NADA', '1h', directorio=directorio).empty
+
+
+def test_descargar_intradia_por_ventanas(tmp_path):
+    directorio = str(tmp_path)
+    hoy = date.today()
+    inicio, fin = (hoy - timedelta(days=20)).isoformat(), hoy.isoformat()
+    ventanas = calcular_ventanas('1m', inicio, fin)
+    assert len(ventanas) == 3
+    proveedor = ProveedorIntradia()
+
+    resumen = descargar_intradia(['AAPL', 'MSFT'], '1m', inicio, fin, proveedor=proveedor, directorio=directorio,
+                                 max_hilos=4, peticiones_por_segundo=1000)
+
+    assert resumen['ventanas'] == 6
+    assert resumen['errores'] == []
+    assert sorted(proveedor.llamadas) == sorted((symbol, desde, hasta, '1m') for symbol in ('AAPL', 'MSFT')
+                                                for desde, hasta in ventanas)
+    esperadas = ProveedorIntradia.esperadas(inicio, fin)
+    assert resumen['barras_nuevas'] == 2 * esperadas
+    for symbol in ('AAPL', 'MSFT'):
+        barras = leer_intradia(symbol, '1m', directorio=directorio)
+        assert len(barras) == esperadas
+        assert barras['ts'].is_unique and barras['ts'].is_monotonic_increasing
+
+    # Volver a descargar el mismo periodo no duplica barras
+    repetido = descargar_intradia(['AAPL', 'MSFT'], '1m', inicio, fin, proveedor=proveedor, directorio=directorio,
+                                  peticiones_por_segundo=1000)
+    assert repetido['barras_nuevas'] == 0
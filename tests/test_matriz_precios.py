@@ -0,0 +1,80 @@
+"""Matriz de precios: pivotar_precios frente a DataFrame.pivot, dropna y ffill de pandas."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from matriz_precios import pivotar_precios
+
+# Orden de columnas distinto del orden numérico de los SymbolID
+ETIQUETAS = {30: 'NVDA', 10: 'AAPL', 20: 'MSFT'}
+CAMPOS = ['Close', 'Volume']
+
+
+@pytest.fixture
+def largos():
+    rng = np.random.default_rng(4)
+    fechas = pd.bdate_range('2024-01-01', periods=12)
+    filas = []
+    for symbol_id in (10, 20, 30, 99):
+        for i, fecha in enumerate(fechas):
+            # Barras que faltan: AAPL los primeros días, MSFT alguno suelto, NVDA al final
+            if (symbol_id == 10 and i < 2) or (symbol_id == 20 and i in (4, 7)) or (symbol_id == 30 and i > 9):
+                continue
+            filas.append({'SymbolID': symbol_id, 'Date': fecha, 'Close': rng.uniform(50, 150),
+                          'Volume': np.nan if (symbol_id, i) == (20, 5) else float(rng.integers(1000, 5000))})
+    # Desordenado y con un símbolo (99) que no se pide
+    return pd.DataFrame(filas).sample(frac=1.0, random_state=2).reset_index(drop=True)
+
+
+def _referencia(largos, campos=CAMPOS):
+    pedidos = largos[largos['SymbolID'].isin(list(ETIQUETAS))]
+    ancho = pedidos.pivot(index='Date', columns='SymbolID', values=campos)
+    columnas = [(campo, symbol_id) for symbol_id in ETIQUETAS for campo in campos]
+    ancho = ancho[columnas]
+    ancho.columns = [f"{campo}_{ETIQUETAS[symbol_id]}" for campo, symbol_id in columnas]
+    # pivotar_precios devuelve el índice en nanosegundos; pandas puede inferir otra unidad
+    ancho.index = ancho.index.as_unit('ns')
+    return ancho
+
+
+def test_union_igual_a_pivot(largos):
+    matriz = pivotar_precios(largos, ETIQUETAS, CAMPOS)
+    esperado = _referencia(largos)
+    assert list(matriz.columns) == ['Close_NVDA', 'Volume_NVDA', 'Close_AAPL', 'Volume_AAPL',
+                                    'Close_MSFT', 'Volume_MSFT']
+    pd.testing.assert_frame_equal(matriz, esperado, check_names=False, check_freq=False)
+    assert matriz.index.is_monotonic_increasing and matriz.index.name == 'Date'
+
+
+def test_interseccion_solo_fechas_con_barra_de_todos(largos):
+    matriz = pivotar_precios(largos, ETIQUETAS, CAMPOS, fechas='interseccion')
+    pedidos = largos[largos['SymbolID'].isin(list(ETIQUETAS))]
+    completas = pedidos.groupby('Date')['SymbolID'].nunique() == len(ETIQUETAS)
+    esperado = _referencia(largos).loc[completas[completas].index]
+    pd.testing.assert_frame_equal(matriz, esperado, check_names=False, check_freq=False)
+    # Un valor nulo en una barra existente no la saca de la intersección (a diferencia de dropna)
+    assert matriz['Volume_MSFT'].isna().sum() == 1
+    # Con campos sin nulos, la intersección coincide con dropna
+    solo_close = pivotar_precios(largos, ETIQUETAS, ['Close'], fechas='interseccion')
+    pd.testing.assert_frame_equal(solo_close, _referencia(largos, ['Close']).dropna(),
+                                  check_names=False, check_freq=False)
+
+
+def test_ffill_igual_a_pandas(largos):
+    matriz = pivotar_precios(largos, ETIQUETAS, CAMPOS, relleno='ffill')
+    esperado = _referencia(largos).ffill()
+    pd.testing.assert_frame_equal(matriz, esperado, check_names=False, check_freq=False)
+    # Antes de la primera barra de AAPL no hay nada que arrastrar
+    assert matriz['Close_AAPL'].iloc[:2].isna().all() and matriz['Close_NVDA'].iloc[-2:].notna().all()
+
+
+def test_float32_y_parametros_invalidos(largos):
+    matriz = pivotar_precios(largos, ETIQUETAS, ['Close'], dtype=np.float32)
+    assert (matriz.dtypes == np.float32).all()
+    np.testing.assert_allclose(matriz.to_numpy(), _referencia(largos, ['Close']).to_numpy(), rtol=1e-6)
+    with pytest.raises(ValueError):
+        pivotar_precios(largos, ETIQUETAS, ['Adj Close'])
+    with pytest.raises(ValueError):
+        pivotar_precios(largos, ETIQUETAS, fechas='todas')
+    with pytest.raises(ValueError):
+        pivotar_precios(largos, ETIQUETAS, relleno='bfill')
@@ -0,0 +1,106 @@
+"""Métricas: formato de texto de Prometheus de contadores, valores e histogramas, cronometro y perfilado."""
+import io
+import json
+import logging
+import os
+
+import pytest
+
+from metricas import FormatoJSON, Metricas, cronometro, obtener_metricas, perfilar
+
+
+def _muestras(texto):
+    """{'serie{etiquetas}': valor} de las líneas que no son comentarios."""
+    muestras = {}
+    for linea in texto.splitlines():
+        if linea and not linea.startswith('#'):
+            serie, valor = linea.rsplit(' ', 1)
+            muestras[serie] = float(valor)
+    return muestras
+
+
+def test_contador_con_tipo_ayuda_y_etiquetas():
+    metricas = Metricas()
+    metricas.describir('descargas', 'Descargas completadas')
+    metricas.contar('descargas', origen='yahoo')
+    metricas.contar('descargas', 4, origen='yahoo')
+    metricas.contar('descargas', origen='cache')
+    texto = metricas.texto_prometheus()
+
+    assert '# HELP alphavantage_descargas_total Descargas completadas' in texto
+    # Una sola cabecera # TYPE por familia, aunque tenga varias series
+    assert texto.count('# TYPE alphavantage_descargas_total counter') == 1
+    muestras = _muestras(texto)
+    assert muestras['alphavantage_descargas_total{origen="yahoo"}'] == 5
+    assert muestras['alphavantage_descargas_total{origen="cache"}'] == 1
+
+
+def test_valor_instantaneo_y_escapado_de_etiquetas():
+    metricas = Metricas()
+    metricas.fijar('trabajos', 3, estado='en_curso')
+    metricas.fijar('trabajos', 1, estado='en_curso')
+    metricas.fijar('ruta', 1, url='/a"b\\c')
+    texto = metricas.texto_prometheus()
+
+    assert '# TYPE alphavantage_trabajos gauge' in texto
+    muestras = _muestras(texto)
+    assert muestras['alphavantage_trabajos{estado="en_curso"}'] == 1
+    assert muestras['alphavantage_ruta{url="/a\\"b\\\\c"}'] == 1
+
+
+def test_histograma_cubos_acumulados_suma_y_cuenta():
+    metricas = Metricas()
+    for segundos in (0.002, 0.3, 0.3, 200.0):
+        metricas.observar('consulta_segundos', segundos, operacion='select')
+    texto = metricas.texto_prometheus()
+
+    assert '# TYPE alphavantage_consulta_segundos histogram' in texto
+    muestras = _muestras(texto)
+    serie = 'alphavantage_consulta_segundos'
+    assert muestras[f'{serie}_bucket{{operacion="select",le="0.001"}}'] == 0
+    assert muestras[f'{serie}_bucket{{operacion="select",le="0.005"}}'] == 1
+    assert muestras[f'{serie}_bucket{{operacion="select",le="0.5"}}'] == 3
+    assert muestras[f'{serie}_bucket{{operacion="select",le="120.0"}}'] == 3
+    assert muestras[f'{serie}_bucket{{operacion="select",le="+Inf"}}'] == 4
+    assert muestras[f'{serie}_count{{operacion="select"}}'] == 4
+    assert muestras[f'{serie}_sum{{operacion="select"}}'] == pytest.approx(200.602)
+
+
+def test_cronometro_marca_los_errores():
+    metricas = obtener_metricas()
+    metricas.reiniciar()
+    with cronometro('bloque_segundos', fase='ok') as detalle:
+        detalle['filas'] = 10
+    with pytest.raises(ValueError):
+        with cronometro('bloque_segundos', fase='ok'):
+            raise ValueError('fallo')
+
+    histogramas = metricas.resumen()['histogramas']
+    assert histogramas['bloque_segundos{fase=ok}']['cuenta'] == 1
+    assert histogramas['bloque_segundos{error=1,fase=ok}']['cuenta'] == 1
+    metricas.reiniciar()
+
+
+def test_perfilar_registra_el_informe_en_el_log(tmp_path, monkeypatch):
+    monkeypatch.setenv('PERFILES_DIR', str(tmp_path))
+    salida = io.StringIO()
+    manejador = logging.StreamHandler(salida)
+    manejador.setFormatter(FormatoJSON())
+    registrador = logging.getLogger('alphavantage.metricas')
+    nivel = registrador.level
+    registrador.addHandler(manejador)
+    registrador.setLevel(logging.INFO)
+    try:
+        with perfilar('prueba', activo=True, lineas=5):
+            sorted(range(1000), key=str)
+    finally:
+        registrador.removeHandler(manejador)
+        registrador.setLevel(nivel)
+
+    informe, guardado = [json.loads(linea) for linea in salida.getvalue().splitlines()]
+    ruta, = [str(tmp_path / nombre) for nombre in os.listdir(tmp_path)]
+    assert informe['mensaje'] == 'Perfil de prueba: 5 funciones con más tiempo acumulado'
+    assert informe['perfil'] == ruta
+    assert 'cumulative' in informe['detalle'] and 'sorted' in informe['detalle']
+    assert guardado['mensaje'].startswith(f'Perfil guardado en {ruta}')
+    assert guardado['perfil'] == ruta
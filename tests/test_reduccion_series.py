@@ -0,0 +1,64 @@
+"""reduccion_series: LTTB conserva extremos y tamaño; las velas coinciden con pandas resample."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from reduccion_series import agregar_ohlc, lttb
+
+
+def _diarias(n=700, semilla=4):
+    fechas = pd.bdate_range('2021-03-03', periods=n)
+    # Se quitan algunas sesiones para que haya semanas incompletas
+    fechas = fechas.delete(np.arange(5, n, 37))
+    rng = np.random.default_rng(semilla)
+    cierre = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, len(fechas))))
+    return pd.DataFrame({
+        'Date': fechas,
+        'Open': cierre * (1 + rng.normal(0, 0.01, len(fechas))),
+        'High': cierre * 1.02,
+        'Low': cierre * 0.98,
+        'Close': cierre,
+        'Volume': rng.integers(1_000, 1_000_000, len(fechas)),
+    })
+
+
+def _dias(fechas):
+    return fechas.to_numpy(dtype='datetime64[D]').astype(np.int32)
+
+
+@pytest.mark.parametrize('puntos', [3, 10, 250])
+def test_lttb_conserva_extremos_y_numero_de_puntos(puntos):
+    df = _diarias()
+    elegidos = lttb(_dias(df['Date']), df['Close'].to_numpy(), puntos)
+    assert len(elegidos) == puntos
+    assert elegidos[0] == 0 and elegidos[-1] == len(df) - 1
+    assert np.all(np.diff(elegidos) > 0)
+
+
+def test_lttb_serie_corta_se_devuelve_entera():
+    assert lttb(np.arange(5), np.arange(5.0), 10).tolist() == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize('periodo, regla', [('semana', 'W-SUN'), ('mes', 'MS')])
+def test_agregar_ohlc_igual_que_resample(periodo, regla):
+    df = _diarias()
+    fechas, apertura, maximo, minimo, cierre, volumen = agregar_ohlc(
+        _dias(df['Date']), df['Open'].to_numpy(), df['High'].to_numpy(), df['Low'].to_numpy(),
+        df['Close'].to_numpy(), df['Volume'].to_numpy(), periodo=periodo)
+
+    grupos = df.set_index('Date').resample(regla)
+    esperado = pd.DataFrame({
+        'Date': grupos['Open'].apply(lambda s: s.index[0] if len(s) else pd.NaT),
+        'Open': grupos['Open'].first(),
+        'High': grupos['High'].max(),
+        'Low': grupos['Low'].min(),
+        'Close': grupos['Close'].last(),
+        'Volume': grupos['Volume'].sum(),
+    }).dropna(subset=['Open'])
+
+    assert fechas.tolist() == _dias(esperado['Date']).tolist()
+    np.testing.assert_array_equal(apertura, esperado['Open'].to_numpy())
+    np.testing.assert_array_equal(maximo, esperado['High'].to_numpy())
+    np.testing.assert_array_equal(minimo, esperado['Low'].to_numpy())
+    np.testing.assert_array_equal(cierre, esperado['Close'].to_numpy())
+    np.testing.assert_array_equal(volumen, esperado['Volume'].to_numpy())
@@ -0,0 +1,68 @@
+"""Registro de símbolos: caducidad de las validaciones (TTL) y filtrado de tareas."""
+from datetime import datetime, timedelta
+
+from registro_simbolos import RegistroSimbolos
+
+
+class ValidadorFalso:
+    """Validador sin red: responde según un diccionario y cuenta las llamadas."""
+
+    def __init__(self, validos, fallan=()):
+        self.validos = validos
+        self.fallan = set(fallan)
+        self.llamadas = []
+
+    def __call__(self, symbol):
+        self.llamadas.append(symbol)
+        if symbol in self.fallan:
+            raise ConnectionError('sin red')
+        return {'valido': self.validos.get(symbol, False), 'nombre': symbol, 'moneda': 'USD'}
+
+
+def _envejecer(registro, symbol, horas):
+    entrada = registro._entradas[symbol]
+    entrada['ultima_comprobacion'] = (datetime.now() - timedelta(hours=horas)).isoformat(timespec='seconds')
+
+
+def test_ttl_de_las_validaciones(tmp_path):
+    ruta = str(tmp_path / 'registro.json')
+    validador = ValidadorFalso({'AAPL': True, 'MSFT': True})
+    registro = RegistroSimbolos(ruta, ttl_horas=24, validador=validador)
+    assert registro.es_valido('AAPL') is None
+
+    assert registro.actualizar(['AAPL', 'MSFT', 'AAPL']) == 2
+    assert registro.es_valido('AAPL') is True
+    # Vigentes: no se vuelve a consultar la red, tampoco desde otra instancia con el mismo fichero
+    assert registro.actualizar(['AAPL', 'MSFT']) == 0
+    assert RegistroSimbolos(ruta, ttl_horas=24, validador=validador).actualizar(['AAPL', 'MSFT']) == 0
+    assert validador.llamadas == ['AAPL', 'MSFT']
+
+    # Caducada: deja de contar como conocida y solo ella se revalida
+    _envejecer(registro, 'MSFT', 25)
+    assert registro.es_valido('MSFT') is None
+    assert registro.pendientes(['AAPL', 'MSFT']) == ['MSFT']
+    assert registro.actualizar(['AAPL', 'MSFT']) == 1
+    assert validador.llamadas[-1] == 'MSFT'
+    assert registro.es_valido('MSFT') is True
+
+    # forzar revalida aunque estén vigentes
+    assert registro.actualizar(['AAPL', 'MSFT'], forzar=True) == 2
+
+
+def test_filtrar_validos(tmp_path):
+    validador = ValidadorFalso({'AAPL': True, 'NVDA': True}, fallan={'RED'})
+    registro = RegistroSimbolos(str(tmp_path / 'registro.json'), validador=validador)
+    tareas = [{'Symbol': symbol, 'SymbolID': i} for i, symbol in enumerate(['AAPL', 'XXXX', 'RED', 'NVDA'], 1)]
+
+    validas = registro.filtrar_validos(tareas)
+    # El no válido se descarta; el que no se pudo validar (error de red) se conserva
+    assert [tarea['Symbol'] for tarea in validas] == ['AAPL', 'RED', 'NVDA']
+    assert registro.es_valido('XXXX') is False
+    assert registro.es_valido('RED') is None
+
+    # Con otra clave y el registro ya vigente solo se reintenta el que falló
+    validador.fallan.clear()
+    llamadas = len(validador.llamadas)
+    validas = registro.filtrar_validos([{'simbolo': 'XXXX'}, {'simbolo': 'RED'}], clave='simbolo')
+    assert validas == []
+    assert validador.llamadas[llamadas:] == ['RED']
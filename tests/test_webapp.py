@@ -0,0 +1,149 @@
+"""Webapp: /api/prices (404 desde memoria, 304 con ETag) y versión de los datos ligada a la base de datos."""
+import sys
+
+import pytest
+from sqlalchemy import event
+
+from almacen_memoria import AlmacenMemoria
+from cache_precios import CachePrecios
+from carga_masiva import fusionar_precios
+from cola_trabajos import Trabajo
+from entorno_sintetico import crear_engine_local, generar_ohlcv, registrar_simbolos
+
+
+@pytest.fixture
+def entorno(tmp_path, webapp, monkeypatch):
+    engine = crear_engine_local(str(tmp_path))
+    datos = generar_ohlcv(1, 1, fecha_fin='2024-06-28', semilla=3)
+    registrar_simbolos(engine, list(datos))
+    almacen = AlmacenMemoria(engine, recarga_simbolos=0, comprobacion_ingestas=0)
+    monkeypatch.setattr(webapp, 'obtener_almacen', lambda: almacen)
+    monkeypatch.setattr(webapp, 'obtener_engine', lambda: engine)
+    yield engine, almacen, datos
+    engine.dispose()
+
+
+def test_simbolo_desconocido_404_sin_recargar(webapp, entorno):
+    engine, almacen, _ = entorno
+    cliente = webapp.app.test_client()
+    almacen.cargar_simbolos()
+    lecturas = []
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _contar(conn, cursor, sentencia, parametros, contexto, executemany):
+        if 'FROM Metadata.Symbols' in sentencia:
+            lecturas.append(sentencia)
+
+    for _ in range(5):
+        assert cliente.get('/api/prices/NOEXISTE').status_code == 404
+    assert lecturas == []
+
+
+def test_ingesta_sin_cambios_conserva_la_version(webapp, entorno, monkeypatch):
+    engine, almacen, datos = entorno
+    symbol, df = next(iter(datos.items()))
+    monkeypatch.setattr(webapp, 'descargar_datos_cache', lambda *args, **kwargs: df.copy())
+
+    def descargar():
+        return webapp.procesar_descarga(Trabajo('prueba'), 1, symbol, '2023-01-01', '2024-06-28', False)
+
+    descargar()
+    version = almacen.ultima_ingesta(1)
+    assert version is not None
+    # La misma descarga otra vez: el MERGE no inserta ni actualiza nada
+    descargar()
+    assert almacen.ultima_ingesta(1) == version
+
+
+def test_etag_304_hasta_una_ingesta_de_otro_proceso(webapp, entorno, tmp_path):
+    engine, almacen, datos = entorno
+    symbol, df = next(iter(datos.items()))
+    fusionar_precios(engine, df.iloc[:-3], 1)
+    cliente = webapp.app.test_client()
+    url = f'/api/prices/{symbol}?agregacion=ninguna'
+
+    primera = cliente.get(url)
+    assert primera.status_code == 200
+    etag = primera.headers['ETag']
+    assert cliente.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    # Carga desde otro proceso (p. ej. main.py --incremental): la versión la da la base de datos
+    otro = crear_engine_local(str(tmp_path))
+    fusionar_precios(otro, df, 1)
+    otro.dispose()
+    nueva = cliente.get(url, headers={'If-None-Match': etag})
+    assert nueva.status_code == 200
+    assert nueva.headers['ETag'] != etag
+    assert len(nueva.get_json()['fechas']) == len(df)
+
+
+def test_puntos_fuera_de_rango(webapp, entorno):
+    engine, almacen, datos = entorno
+    symbol, df = next(iter(datos.items()))
+    fusionar_precios(engine, df, 1)
+    cliente = webapp.app.test_client()
+    url = f'/api/prices/{symbol}?puntos='
+
+    # Por debajo del mínimo de lttb se respondería con la serie completa: se rechaza
+    for puntos in ('0', '-5', '1', '2', 'muchos'):
+        respuesta = cliente.get(url + puntos)
+        assert respuesta.status_code == 400, puntos
+        assert 'puntos' in respuesta.get_json()['error']
+
+    assert len(cliente.get(url + '3').get_json()['fechas']) == 3
+    assert len(cliente.get(url + '50').get_json()['fechas']) == 50
+    # Por encima del máximo se recorta: misma respuesta y misma versión que con el máximo
+    maximo = cliente.get(url + str(webapp.PUNTOS_MAXIMO))
+    enorme = cliente.get(url + '1000000000')
+    assert enorme.status_code == 200
+    assert enorme.headers['ETag'] == maximo.headers['ETag']
+    assert len(enorme.get_json()['fechas']) == len(df)
+
+
+def test_descargar_rechaza_un_rango_vacio(webapp, entorno):
+    cliente = webapp.app.test_client()
+    # La fecha de fin es exclusiva: inicio == fin no descargaría nada
+    respuesta = cliente.post('/descargar', data={'symbol_id': '1', 'fecha_inicio': '2024-06-03',
+                                                 'fecha_fin': '2024-06-03'},
+                             headers={'Accept': 'application/json'})
+    assert respuesta.status_code == 400
+    assert 'anterior' in respuesta.get_json()['error']
+
+
+def test_metrics_expone_contadores_e_histogramas(webapp, entorno, tmp_path, monkeypatch):
+    cache = CachePrecios(str(tmp_path / 'cache'), guardado_indice=3600)
+    monkeypatch.setattr(webapp, 'obtener_cache', lambda: cache)
+    # El registro compartido del módulo de métricas que ha importado la webapp
+    modulo_metricas = sys.modules[webapp.obtener_metricas.__module__]
+    metricas = modulo_metricas.obtener_metricas()
+    metricas.reiniciar()
+    cliente = webapp.app.test_client()
+
+    modulo_metricas.observar('prueba_segundos', 0.2, fase='carga')
+    with modulo_metricas.cronometro('prueba_segundos', fase='carga'):
+        pass
+    modulo_metricas.contar('prueba_filas', 7)
+    modulo_metricas.contar('prueba_filas', 3)
+
+    respuesta = cliente.get('/metrics')
+    assert respuesta.status_code == 200
+    assert respuesta.content_type.startswith('text/plain; version=0.0.4')
+    texto = respuesta.get_data(as_text=True)
+    assert '# TYPE alphavantage_prueba_filas_total counter' in texto
+    assert 'alphavantage_prueba_filas_total 10' in texto.splitlines()
+    assert '# TYPE alphavantage_prueba_segundos histogram' in texto
+    assert 'alphavantage_prueba_segundos_bucket{fase="carga",le="0.25"} 2' in texto
+    assert 'alphavantage_prueba_segundos_bucket{fase="carga",le="+Inf"} 2' in texto
+    assert 'alphavantage_prueba_segundos_count{fase="carga"} 2' in texto
+    suma = next(linea for linea in texto.splitlines() if linea.startswith('alphavantage_prueba_segundos_sum'))
+    assert suma.startswith('alphavantage_prueba_segundos_sum{fase="carga"} ')
+    assert float(suma.rsplit(' ', 1)[1]) == pytest.approx(0.2, abs=0.05)
+    # Estado actual fijado por la propia ruta
+    assert '# TYPE alphavantage_trabajos gauge' in texto
+    assert 'alphavantage_cache_precios_fallos 0' in texto
+
+    # La petición anterior queda registrada por after_request
+    texto = cliente.get('/metrics').get_data(as_text=True)
+    assert ('alphavantage_http_peticion_segundos_count{codigo="200",metodo="GET",ruta="/metrics"} 1'
+            in texto)
+    metricas.reiniciar()
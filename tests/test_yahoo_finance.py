@@ -0,0 +1,73 @@
+"""Descarga por lotes: filtrado por el registro de símbolos y reparto del resultado por símbolo."""
+import numpy as np
+import pandas as pd
+
+import yahoo_finance
+from registro_simbolos import RegistroSimbolos
+
+CAMPOS = ['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits']
+
+
+class ValidadorFalso:
+    """Validador sin red: válidos los símbolos del conjunto; guarda las llamadas."""
+
+    def __init__(self, validos):
+        self.validos = set(validos)
+        self.llamadas = []
+
+    def __call__(self, symbol):
+        self.llamadas.append(symbol)
+        return {'valido': symbol in self.validos, 'nombre': symbol, 'moneda': 'USD'}
+
+
+class DescargaFalsa:
+    """Sustituto de yf.download: columnas (símbolo, campo) como con group_by='ticker'."""
+
+    def __init__(self, sin_datos=()):
+        self.sin_datos = set(sin_datos)
+        self.llamadas = []
+
+    def __call__(self, simbolos, **opciones):
+        self.llamadas.append((list(simbolos), opciones))
+        fechas = pd.date_range('2024-01-02', periods=3, freq='B', tz='America/New_York', name='Date')
+        bloques = {}
+        for i, symbol in enumerate(simbolos):
+            valores = np.full((len(fechas), len(CAMPOS)), np.nan if symbol in self.sin_datos else 100.0 + i)
+            bloques[symbol] = pd.DataFrame(valores, index=fechas, columns=CAMPOS)
+        datos = pd.concat(bloques, axis=1)
+        datos.columns.names = ['Ticker', 'Price']
+        return datos
+
+
+def test_lote_filtra_con_el_registro_y_reparte_por_simbolo(tmp_path, monkeypatch):
+    validador = ValidadorFalso({'AAPL', 'MSFT', 'VACIO'})
+    registro = RegistroSimbolos(str(tmp_path / 'registro.json'), validador=validador)
+    descarga = DescargaFalsa(sin_datos={'VACIO'})
+    monkeypatch.setattr(yahoo_finance.yf, 'download', descarga)
+
+    datos = yahoo_finance.descargar_datos_yahoo_lote(['AAPL', 'XXXX', 'MSFT', 'AAPL', 'VACIO'],
+                                                     '2024-01-01', '2024-02-01', registro=registro)
+
+    # El no válido no llega a la petición; los repetidos se piden una vez
+    (simbolos, opciones), = descarga.llamadas
+    assert simbolos == ['AAPL', 'MSFT', 'VACIO']
+    assert opciones['auto_adjust'] is True and opciones['actions'] is True
+    assert sorted(validador.llamadas) == ['AAPL', 'MSFT', 'VACIO', 'XXXX']
+    # Sin filas con datos: no aparece
+    assert sorted(datos) == ['AAPL', 'MSFT']
+    assert list(datos['AAPL'].columns) == ['Date'] + CAMPOS
+    assert datos['MSFT']['Close'].tolist() == [101.0] * 3
+
+    # Con el registro vigente una segunda descarga no vuelve a validar
+    yahoo_finance.descargar_datos_yahoo_lote(['AAPL', 'XXXX'], '2024-01-01', '2024-02-01', registro=registro)
+    assert len(validador.llamadas) == 4
+    assert descarga.llamadas[-1][0] == ['AAPL']
+
+
+def test_lote_sin_simbolos_validos_no_llama_a_la_red(tmp_path, monkeypatch):
+    registro = RegistroSimbolos(str(tmp_path / 'registro.json'), validador=ValidadorFalso(set()))
+    descarga = DescargaFalsa()
+    monkeypatch.setattr(yahoo_finance.yf, 'download', descarga)
+
+    assert yahoo_finance.descargar_datos_yahoo_lote(['XXXX'], registro=registro) == {}
+    assert descarga.llamadas == []
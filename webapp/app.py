@@ -1,20 +1,34 @@
 import os
 import sys
-from flask import Flask, render_template, request, redirect, url_for, flash
-from sqlalchemy import text
+import numpy as np
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, g
 from dotenv import load_dotenv
-from datetime import datetime
+import hashlib
+import logging
+import time
+from datetime import datetime, timezone
 
 # Añadir el directorio padre (raíz del proyecto) al sys.path para encontrar la carpeta 'scripts'
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
+logger = logging.getLogger('alphavantage.webapp')
+
 try:
-    from scripts.sql_connection import conectar_sql_server, ejecutar_consulta
-    from scripts.yahoo_finance import descargar_datos_yahoo
+    from scripts.sql_connection import estadisticas_pool, obtener_engine
+    from scripts.metricas import configurar_logging, fijar, obtener_metricas, observar
+    from scripts.carga_masiva import fusionar_precios
+    from scripts.actualizacion_incremental import calcular_inicio, obtener_ultima_fecha
+    from scripts.cache_precios import descargar_datos_cache, obtener_cache
+    from scripts.cola_trabajos import GestorTrabajos
+    from scripts.almacen_memoria import obtener_almacen
+    from scripts.reduccion_series import PERIODOS, agregar_ohlc, lttb
+    from scripts.espejo_columnar import sincronizar_si_activo
+    from scripts.almacen_caracteristicas import actualizar_caracteristicas
 except ImportError as e:
-    print(f"Error importando módulos de 'scripts': {e}")
-    print("Asegúrate de que la estructura de carpetas es correcta y que los archivos .py existen.")
+    # Aún sin configurar_logging: el mensaje sale por stderr con el manejador por defecto de logging
+    logger.critical("Error importando módulos de 'scripts': %s. Asegúrate de que la estructura de carpetas "
+                    "es correcta y que los archivos .py existen.", e)
     # Podrías querer manejar esto de forma más robusta o salir
     sys.exit(1)
 
@@ -22,142 +36,279 @@ except ImportError as e:
 env_path = os.path.join(project_root, 'config', '.env')
 if os.path.exists(env_path):
     load_dotenv(dotenv_path=env_path)
-    print(f"Archivo .env cargado desde: {env_path}")
+
+# Tras cargar el .env, que puede fijar LOG_NIVEL y LOG_FORMATO
+configurar_logging()
+if os.path.exists(env_path):
+    logger.info("Archivo .env cargado desde: %s", env_path)
 else:
-    print(f"Advertencia: No se encontró el archivo .env en {env_path}. La aplicación podría no funcionar.")
+    logger.warning("No se encontró el archivo .env en %s. La aplicación podría no funcionar.", env_path)
     # Considera añadir valores por defecto o lanzar un error si son cruciales
 
 app = Flask(__name__)
 # Es crucial configurar una SECRET_KEY para usar flash messages
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'una-clave-secreta-por-defecto-muy-segura') # Usa una variable de entorno o genera una aleatoria
 
+# Pool de hilos para las descargas en segundo plano (TRABAJOS_HILOS, por defecto 2)
+gestor_trabajos = GestorTrabajos()
+
+@app.before_request
+def _iniciar_cronometro():
+    g.inicio_peticion = time.perf_counter()
+
+@app.after_request
+def _registrar_peticion(respuesta):
+    """Duración y número de peticiones por ruta, método y código de estado."""
+    inicio = g.pop('inicio_peticion', None)
+    if inicio is not None:
+        ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+        observar('http_peticion_segundos', time.perf_counter() - inicio, {'url': request.path},
+                 ruta=ruta, metodo=request.method, codigo=respuesta.status_code)
+    return respuesta
+
 @app.route('/')
 def index():
     """Muestra el formulario principal con la lista de símbolos."""
     symbols = []
-    engine = None
     try:
-        engine = conectar_sql_server()
-        if engine:
-            consulta_symbols = text("SELECT SymbolID, Symbol FROM Metadata.Symbols WHERE IsActive = 1 ORDER BY Symbol")
-            # Usamos read_sql directamente ya que ejecutar_consulta devuelve un DataFrame
-            # y aquí necesitamos una lista de diccionarios o similar para la plantilla.
-            with engine.connect() as connection:
-                result = connection.execute(consulta_symbols)
-                symbols = result.fetchall() # Obtiene [(SymbolID1, Symbol1), (SymbolID2, Symbol2), ...]
-                # Convertimos a lista de diccionarios si es necesario para la plantilla,
-                # aunque fetchall() devuelve una lista de RowProxy que se pueden acceder por índice o nombre.
-                # symbols = [{'SymbolID': row.SymbolID, 'Symbol': row.Symbol} for row in result] # Alternativa
-        else:
-            flash("Error al conectar con la base de datos.", "error")
-
+        # Lista de símbolos desde el almacén en memoria: solo se consulta la BD en la primera carga
+        symbols = obtener_almacen().simbolos() # [(SymbolID1, Symbol1), (SymbolID2, Symbol2), ...]
     except Exception as e:
         flash(f"Error al obtener símbolos de la base de datos: {str(e)}", "error")
-        print(f"Error en la ruta '/': {str(e)}") # Log para depuración
-    finally:
-        if engine:
-            engine.dispose()
+        logger.exception("Error en la ruta '/': %s", e)
+
+    return render_template('index.html', symbols=symbols, trabajo_id=request.args.get('trabajo'))
 
-    return render_template('index.html', symbols=symbols)
+def _quiere_json():
+    """True si el cliente prefiere una respuesta JSON (p. ej. un script o fetch)."""
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+def _responder_error(mensaje, categoria="warning", codigo=400):
+    """Devuelve el error como JSON o como mensaje flash con redirección al formulario."""
+    if _quiere_json():
+        return jsonify({'error': mensaje}), codigo
+    flash(mensaje, categoria)
+    return redirect(url_for('index'))
+
+def procesar_descarga(trabajo, symbol_id, symbol, fecha_inicio, fecha_fin, incremental):
+    """Trabajo en segundo plano: descarga el rango de Yahoo Finance y lo guarda en SQL Server."""
+    engine = obtener_engine()
+
+    # --- Modo incremental: empezar tras la última fecha ya almacenada ---
+    if incremental:
+        trabajo.actualizar(fase='consultando última fecha')
+        with engine.connect() as connection:
+            fecha_inicio = max(fecha_inicio, calcular_inicio(obtener_ultima_fecha(connection, symbol_id), fecha_inicio))
+        # La fecha de fin es exclusiva (como en yfinance): inicio == fin es un rango vacío
+        if fecha_inicio >= fecha_fin:
+            return f"Los datos de '{symbol}' ya están actualizados hasta {fecha_fin}."
+
+    # --- Descargar datos ---
+    trabajo.actualizar(fase='descargando')
+    logger.info("Intentando descargar datos para %s (%s) desde %s hasta %s", symbol, symbol_id, fecha_inicio, fecha_fin)
+    df_historico = descargar_datos_cache(symbol, fecha_inicio, fecha_fin)
+
+    if df_historico is None or df_historico.empty:
+        return f"No se encontraron datos en Yahoo Finance para '{symbol}' en el período especificado."
+
+    # --- Upsert del tramo descargado (staging + MERGE sobre SymbolID, Date) ---
+    # fusionar_precios abre su propia transacción: si algo falla se hace rollback completo
+    trabajo.actualizar(fase='guardando')
+    estadisticas = fusionar_precios(engine, df_historico, symbol_id,
+                                    progreso=lambda filas: trabajo.actualizar(filas=filas))
+    logger.info("Inserción completada para SymbolID: %s (%d nuevas, %d actualizadas)", symbol_id,
+                estadisticas['filas_insertadas'], estadisticas['filas_actualizadas'])
+    if estadisticas['filas_insertadas'] or estadisticas['filas_actualizadas']:
+        # Los precios en memoria de este símbolo ya no están al día: nueva versión
+        # para ETag/Last-Modified (si el MERGE no cambió nada se conserva la anterior)
+        obtener_almacen().registrar_ingesta(symbol_id)
+        # Características materializadas del símbolo: solo las barras nuevas, o
+        # reconstrucción si el MERGE cambió barras ya procesadas
+        trabajo.actualizar(fase='actualizando características')
+        try:
+            actualizar_caracteristicas(engine, [symbol_id])
+        except Exception as e:
+            logger.warning("No se pudieron actualizar las características de %s: %s", symbol, e)
+    # Con ESPEJO_COLUMNAR=1 se reescribe también su fichero Parquet del espejo de análisis
+    sincronizar_si_activo(engine, [symbol_id])
+    return f"Datos para '{symbol}' descargados e insertados correctamente ({estadisticas['filas']} filas)."
 
 @app.route('/descargar', methods=['POST'])
 def descargar():
-    """Maneja la solicitud de descarga y guardado de datos."""
+    """Valida la solicitud y encola la descarga; responde de inmediato con el ID del trabajo."""
     symbol_id = request.form.get('symbol_id')
     fecha_inicio_str = request.form.get('fecha_inicio')
     fecha_fin_str = request.form.get('fecha_fin')
+    incremental = request.form.get('incremental') == '1'
 
     # --- Validación básica ---
     if not all([symbol_id, fecha_inicio_str, fecha_fin_str]):
-        flash("Por favor, selecciona un símbolo y ambas fechas.", "warning")
-        return redirect(url_for('index'))
+        return _responder_error("Por favor, selecciona un símbolo y ambas fechas.")
 
     try:
         # Validar formato de fechas (opcional pero recomendado)
         fecha_inicio = datetime.strptime(fecha_inicio_str, '%Y-%m-%d').strftime('%Y-%m-%d')
         fecha_fin = datetime.strptime(fecha_fin_str, '%Y-%m-%d').strftime('%Y-%m-%d')
-        if fecha_inicio > fecha_fin:
-             flash("La fecha de inicio no puede ser posterior a la fecha de fin.", "warning")
-             return redirect(url_for('index'))
+        symbol_id = int(symbol_id)
+        if fecha_inicio >= fecha_fin:
+            return _responder_error("La fecha de inicio debe ser anterior a la fecha de fin (la fecha de fin no se incluye).")
     except ValueError:
-        flash("Formato de fecha inválido. Usa YYYY-MM-DD.", "warning")
-        return redirect(url_for('index'))
+        return _responder_error("Formato de fecha o de símbolo inválido. Usa YYYY-MM-DD.")
 
-    engine = None
-    symbol = None
     try:
-        engine = conectar_sql_server()
-        if not engine:
-            flash("Error de conexión a la base de datos.", "error")
-            return redirect(url_for('index'))
+        # --- Obtener el Symbol (almacén en memoria; recarga la tabla si el ID es nuevo) ---
+        symbol = obtener_almacen().symbol_de(symbol_id)
+        if not symbol:
+            return _responder_error(f"No se encontró el símbolo con ID {symbol_id}.", "error", 404)
 
-        # --- Obtener el Symbol ---
-        with engine.connect() as connection:
-            consulta_symbol = text("SELECT Symbol FROM Metadata.Symbols WHERE SymbolID = :symbol_id")
-            result = connection.execute(consulta_symbol, {"symbol_id": symbol_id})
-            symbol_row = result.fetchone()
-            if not symbol_row:
-                flash(f"No se encontró el símbolo con ID {symbol_id}.", "error")
-                return redirect(url_for('index'))
-            symbol = symbol_row[0] # o symbol_row.Symbol
-
-        # --- Descargar datos ---
-        print(f"Intentando descargar datos para {symbol} ({symbol_id}) desde {fecha_inicio} hasta {fecha_fin}")
-        df_historico = descargar_datos_yahoo(symbol, fecha_inicio, fecha_fin)
-
-        if df_historico is None or df_historico.empty:
-            flash(f"No se encontraron datos en Yahoo Finance para '{symbol}' en el período especificado o hubo un error en la descarga.", "warning")
-            return redirect(url_for('index'))
-
-        # --- Borrar datos existentes e Insertar nuevos ---
-        with engine.connect() as connection:
-            with connection.begin(): # Iniciar transacción
-                try:
-                    # Borrar datos existentes para el SymbolID
-                    delete_sql = text("DELETE FROM AVData.StockPrices WHERE SymbolID = :symbol_id")
-                    connection.execute(delete_sql, {"symbol_id": symbol_id})
-                    print(f"Datos existentes borrados para SymbolID: {symbol_id}")
-
-                    # Insertar nuevos datos
-                    insert_sql = text("""
-                        INSERT INTO AVData.StockPrices
-                        (SymbolID, Date, [Open], High, Low, [Close], Volume, CreatedDate)
-                        VALUES (:symbol_id, :date, :open, :high, :low, :close, :volume, GETDATE())
-                    """)
-                    # Convertir DataFrame a lista de diccionarios para la inserción
-                    datos_para_insertar = df_historico.to_dict(orient='records')
-                    for row in datos_para_insertar:
-                        params = {
-                            "symbol_id": int(symbol_id), # Asegurar que es int
-                            "date": row['Date'].strftime('%Y-%m-%d') if isinstance(row.get('Date'), datetime) else row.get('Date'), # Formatear fecha si es datetime
-                            "open": row.get('Open'),
-                            "high": row.get('High'),
-                            "low": row.get('Low'),
-                            "close": row.get('Close'),
-                            "volume": row.get('Volume')
-                        }
-                        # Asegurarse de que las claves coinciden con las columnas de la tabla y los parámetros SQL
-                        # Corregir nombres si es necesario (ej. 'Adj Close' no está en la tabla destino)
-                        connection.execute(insert_sql, params)
-
-                    # connection.begin() maneja el commit automáticamente si no hay errores
-                    flash(f"Datos para '{symbol}' descargados e insertados correctamente ({len(df_historico)} filas).", "success")
-                    print(f"Inserción completada para SymbolID: {symbol_id}")
-
-                except Exception as insert_error:
-                    # connection.begin() maneja el rollback automáticamente en caso de error
-                    flash(f"Error al guardar datos en la base de datos para '{symbol}': {str(insert_error)}", "error")
-                    print(f"Error durante la transacción (borrado/inserción): {str(insert_error)}")
+    except Exception as e:
+        logger.exception("Error en la ruta '/descargar': %s", e)
+        return _responder_error(f"Error inesperado durante el proceso: {str(e)}", "error", 500)
+
+    # --- Encolar el trabajo (las solicitudes repetidas se agrupan en el trabajo activo) ---
+    trabajo, nuevo = gestor_trabajos.enviar(
+        (symbol_id, fecha_inicio, fecha_fin, incremental),
+        procesar_descarga, symbol_id, symbol, fecha_inicio, fecha_fin, incremental,
+        descripcion=f"{symbol} {fecha_inicio} - {fecha_fin}",
+    )
+
+    if _quiere_json():
+        return jsonify({**trabajo.a_dict(), 'nuevo': nuevo,
+                        'estado_url': url_for('estado_trabajo', trabajo_id=trabajo.id)}), 202
+    if nuevo:
+        flash(f"Descarga de '{symbol}' encolada (trabajo {trabajo.id}).", "success")
+    else:
+        flash(f"Ya hay una descarga en curso para '{symbol}' en ese rango (trabajo {trabajo.id}).", "warning")
+    return redirect(url_for('index', trabajo=trabajo.id))
+
+@app.route('/trabajos/<trabajo_id>')
+def estado_trabajo(trabajo_id):
+    """Devuelve en JSON la fase, filas procesadas y tiempo transcurrido de un trabajo."""
+    trabajo = gestor_trabajos.obtener(trabajo_id)
+    if trabajo is None:
+        return jsonify({'error': f"No existe el trabajo {trabajo_id}."}), 404
+    return jsonify(trabajo.a_dict())
+
+@app.route('/trabajos')
+def listar_trabajos():
+    """Devuelve en JSON el estado de los trabajos recientes."""
+    return jsonify(gestor_trabajos.listar())
+
+@app.route('/estado/pool')
+def estado_pool():
+    """Devuelve en JSON el estado del pool de conexiones compartido."""
+    return jsonify(estadisticas_pool())
+
+PUNTOS_POR_DEFECTO = 1000
+# lttb necesita al menos 3 puntos; por encima del máximo se recorta (unos 40 años de barras diarias)
+PUNTOS_MINIMO = 3
+PUNTOS_MAXIMO = 10000
+
+def _lista(valores, decimales=6):
+    """Array numérico a lista JSON: redondeada y con null en lugar de NaN."""
+    valores = np.asarray(valores, dtype=np.float64)
+    redondeados = np.round(valores, decimales).astype(object)
+    redondeados[np.isnan(valores)] = None
+    return redondeados.tolist()
 
+@app.route('/api/prices/<symbol>')
+def api_precios(symbol):
+    """
+    Devuelve en JSON la serie de precios de un símbolo, reducida en el servidor.
 
+    Parámetros de la URL: desde y hasta (YYYY-MM-DD, inclusivas), puntos
+    (máximo de barras para lttb, por defecto 1000, entre PUNTOS_MINIMO y
+    PUNTOS_MAXIMO; los valores mayores se recortan) y agregacion ('lttb',
+    'semana', 'mes' o 'ninguna'). La respuesta lleva ETag y Last-Modified
+    según MAX(CreatedDate) de los precios del símbolo, que el almacén relee como
+    mucho cada ALMACEN_COMPROBACION_SEGUNDOS (así cuentan también las cargas de
+    otros procesos); si el cliente ya tiene esa versión se responde 304 sin
+    leer los precios.
+    """
+    desde = request.args.get('desde')
+    hasta = request.args.get('hasta')
+    agregacion = request.args.get('agregacion', 'lttb')
+    try:
+        for fecha in (desde, hasta):
+            if fecha:
+                datetime.strptime(fecha, '%Y-%m-%d')
+        puntos = int(request.args.get('puntos', PUNTOS_POR_DEFECTO))
+    except ValueError:
+        return jsonify({'error': "Formato de fecha o de puntos inválido. Usa YYYY-MM-DD y un entero."}), 400
+    if puntos < PUNTOS_MINIMO:
+        return jsonify({'error': f"El número de puntos debe ser al menos {PUNTOS_MINIMO}."}), 400
+    puntos = min(puntos, PUNTOS_MAXIMO)
+    if agregacion not in ('lttb', 'ninguna') + PERIODOS:
+        return jsonify({'error': f"Agregación no válida: {agregacion}."}), 400
+
+    try:
+        almacen = obtener_almacen()
+        # Solo el mapa en memoria: un símbolo desconocido no provoca una recarga por petición
+        symbol_id = almacen.id_de(symbol.upper(), recargar=False)
+        if symbol_id is None:
+            return jsonify({'error': f"No se encontró el símbolo {symbol}."}), 404
+
+        # --- Validación condicional: versión = MAX(CreatedDate) del símbolo en la base de datos ---
+        ingesta = almacen.ultima_ingesta(symbol_id)
+        version = f"{symbol_id}:{ingesta}:{desde}:{hasta}:{puntos}:{agregacion}"
+        etag = hashlib.sha1(version.encode('utf-8')).hexdigest()[:20]
+        ultima_modificacion = datetime.fromtimestamp(int(ingesta), timezone.utc) if ingesta else None
+        if request.if_none_match.contains(etag) or (
+                not request.if_none_match and ultima_modificacion and request.if_modified_since
+                and request.if_modified_since >= ultima_modificacion):
+            respuesta = app.response_class(status=304)
+        else:
+            barras = almacen.rango(symbol_id, desde, hasta)
+            fechas, apertura, maximo, minimo, cierre, volumen = barras
+            if agregacion in PERIODOS:
+                fechas, apertura, maximo, minimo, cierre, volumen = agregar_ohlc(*barras, periodo=agregacion)
+            elif agregacion == 'lttb':
+                elegidos = lttb(fechas, cierre, puntos)
+                fechas, apertura, maximo, minimo, cierre, volumen = (campo[elegidos] for campo in barras)
+            respuesta = jsonify({
+                'symbol': symbol.upper(),
+                'agregacion': agregacion,
+                'barras_originales': int(len(barras.fechas)),
+                'fechas': fechas.astype('datetime64[D]').astype(str).tolist(),
+                'open': _lista(apertura),
+                'high': _lista(maximo),
+                'low': _lista(minimo),
+                'close': _lista(cierre),
+                'volume': np.asarray(volumen).tolist(),
+            })
     except Exception as e:
-        flash(f"Error inesperado durante el proceso: {str(e)}", "error")
-        print(f"Error en la ruta '/descargar': {str(e)}") # Log para depuración
-    finally:
-        if engine:
-            engine.dispose()
+        logger.exception("Error en la ruta '/api/prices/%s': %s", symbol, e)
+        return jsonify({'error': f"Error inesperado: {str(e)}"}), 500
 
-    return redirect(url_for('index'))
+    respuesta.set_etag(etag)
+    if ultima_modificacion:
+        respuesta.last_modified = ultima_modificacion
+    # Siempre se revalida: la versión cambia en cuanto termina una descarga del símbolo
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+@app.route('/metrics')
+def metrics():
+    """Métricas en formato de texto de Prometheus (más el estado actual del pool, la caché, el almacén y los trabajos)."""
+    for clave, valor in estadisticas_pool().items():
+        if isinstance(valor, (int, float)):
+            fijar(f'sql_pool_{clave}', valor)
+    for clave, valor in obtener_cache().estadisticas().items():
+        fijar(f'cache_precios_{clave}', valor)
+    memoria = obtener_almacen().memoria()
+    for clave in ('simbolos', 'series', 'barras', 'bytes'):
+        fijar(f'almacen_{clave}', memoria[clave])
+    estados = {}
+    for trabajo in gestor_trabajos.listar():
+        estados[trabajo['estado']] = estados.get(trabajo['estado'], 0) + 1
+    for estado in ('pendiente', 'en_curso', 'completado', 'error'):
+        fijar('trabajos', estados.get(estado, 0), estado=estado)
+    return obtener_metricas().texto_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/estado/almacen')
+def estado_almacen():
+    """Devuelve en JSON el tamaño y la ocupación de memoria del almacén de precios."""
+    return jsonify(obtener_almacen().memoria())
 
 if __name__ == '__main__':
     # Obtener puerto de variable de entorno o usar 5000 por defecto